@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = '002_hot_path_indexes'
+down_revision = '001_init'
+branch_labels = None
+depends_on = None
+# Índices criados com CONCURRENTLY (fora de transação) para não bloquear escrita
+# nas tabelas durante o deploy. As colunas em INCLUDE permitem index-only scans:
+#   allocations   -> listagem de alocações / performance por cliente
+#   daily_returns -> séries por ativo e último fechamento (fallback do prev close)
+#   clients       -> listagem paginada ordenada por created_at
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_allocations_client_id_cover', 'allocations', ['client_id'],
+            postgresql_include=['asset_id', 'quantity', 'purchase_price', 'purchase_date'], postgresql_concurrently=True)
+        op.create_index('ix_daily_returns_asset_date_desc', 'daily_returns', ['asset_id', sa.text('date DESC')],
+            postgresql_include=['close_price'], postgresql_concurrently=True)
+        op.create_index('ix_clients_created_at_id', 'clients', [sa.text('created_at DESC'), 'id'], postgresql_concurrently=True)
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_clients_created_at_id', table_name='clients', postgresql_concurrently=True)
+        op.drop_index('ix_daily_returns_asset_date_desc', table_name='daily_returns', postgresql_concurrently=True)
+        op.drop_index('ix_allocations_client_id_cover', table_name='allocations', postgresql_concurrently=True)
@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from datetime import date
+
+import sqlalchemy as sa
+
+from alembic import op
+
+revision = '003_partition_daily_returns'
+down_revision = '002_hot_path_indexes'
+branch_labels = None
+depends_on = None
+# Converte daily_returns em tabela particionada por ano (RANGE em `date`).
+# A PK passa a incluir a chave de partição (exigência do Postgres); `id`
+# continua vindo da mesma sequência. Partições futuras são criadas pela task
+# `ensure_daily_return_partitions` (ver partitions.py); aqui criamos do
+# primeiro ano com dados até o ano seguinte ao atual.
+YEARS_AHEAD = 1
+def _create_partition(year: int) -> None:
+    op.execute(
+        f"CREATE TABLE IF NOT EXISTS daily_returns_y{year} PARTITION OF daily_returns "
+        f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+    )
+def upgrade() -> None:
+    conn = op.get_bind()
+    first = conn.execute(sa.text("SELECT min(date) FROM daily_returns")).scalar()
+    op.execute("ALTER TABLE daily_returns RENAME TO daily_returns_legacy")
+    op.execute("ALTER TABLE daily_returns_legacy RENAME CONSTRAINT daily_returns_pkey TO daily_returns_legacy_pkey")
+    op.execute("ALTER TABLE daily_returns_legacy RENAME CONSTRAINT uq_asset_date TO uq_asset_date_legacy")
+    op.execute("ALTER INDEX IF EXISTS ix_daily_returns_asset_date_desc RENAME TO ix_daily_returns_asset_date_desc_legacy")
+    op.execute("ALTER SEQUENCE daily_returns_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE daily_returns (
+            id integer NOT NULL DEFAULT nextval('daily_returns_id_seq'),
+            asset_id integer NOT NULL REFERENCES assets (id),
+            date date NOT NULL,
+            close_price double precision NOT NULL,
+            CONSTRAINT daily_returns_pkey PRIMARY KEY (id, date),
+            CONSTRAINT uq_asset_date UNIQUE (asset_id, date)
+        ) PARTITION BY RANGE (date)
+    """)
+    op.execute("ALTER SEQUENCE daily_returns_id_seq OWNED BY daily_returns.id")
+    this_year = date.today().year
+    for year in range((first.year if first else this_year), this_year + YEARS_AHEAD + 1):
+        _create_partition(year)
+    # Índices no pai são replicados em cada partição (inclusive as futuras).
+    # BRIN é minúsculo e basta para filtros por faixa de data numa tabela só de inserção.
+    op.execute("CREATE INDEX ix_daily_returns_date_brin ON daily_returns USING brin (date)")
+    op.execute("CREATE INDEX ix_daily_returns_asset_date_desc ON daily_returns (asset_id, date DESC) INCLUDE (close_price)")
+    op.execute("""
+        INSERT INTO daily_returns (id, asset_id, date, close_price)
+        SELECT id, asset_id, date, close_price FROM daily_returns_legacy
+    """)
+    op.execute("DROP TABLE daily_returns_legacy")
+def downgrade() -> None:
+    op.execute("ALTER TABLE daily_returns RENAME TO daily_returns_part")
+    op.execute("ALTER TABLE daily_returns_part RENAME CONSTRAINT daily_returns_pkey TO daily_returns_part_pkey")
+    op.execute("ALTER TABLE daily_returns_part RENAME CONSTRAINT uq_asset_date TO uq_asset_date_part")
+    op.execute("ALTER INDEX ix_daily_returns_asset_date_desc RENAME TO ix_daily_returns_asset_date_desc_part")
+    op.execute("ALTER SEQUENCE daily_returns_id_seq OWNED BY NONE")
+    op.execute("""
+        CREATE TABLE daily_returns (
+            id integer PRIMARY KEY DEFAULT nextval('daily_returns_id_seq'),
+            asset_id integer NOT NULL REFERENCES assets (id),
+            date date NOT NULL,
+            close_price double precision NOT NULL,
+            CONSTRAINT uq_asset_date UNIQUE (asset_id, date)
+        )
+    """)
+    op.execute("ALTER SEQUENCE daily_returns_id_seq OWNED BY daily_returns.id")
+    op.execute("INSERT INTO daily_returns SELECT id, asset_id, date, close_price FROM daily_returns_part")
+    op.execute("DROP TABLE daily_returns_part")
+    op.execute("CREATE INDEX ix_daily_returns_asset_date_desc ON daily_returns (asset_id, date DESC) INCLUDE (close_price)")
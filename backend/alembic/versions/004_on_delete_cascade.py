@@ -0,0 +1,36 @@
+from __future__ import annotations
+
+from alembic import op
+
+revision = '004_on_delete_cascade'
+down_revision = '003_partition_daily_returns'
+branch_labels = None
+depends_on = None
+# Recria as FKs com ON DELETE CASCADE para que apagar um cliente ou ativo
+# seja um único DELETE, sem o ORM carregar os filhos. Em `allocations` a FK
+# entra NOT VALID e é validada depois, em autocommit (sem bloquear escrita
+# durante a varredura); em `daily_returns`, tabela particionada, o Postgres não aceita
+# NOT VALID e a FK é criada diretamente.
+FKS = [
+    ('allocations', 'allocations_client_id_fkey', 'client_id', 'clients'),
+    ('allocations', 'allocations_asset_id_fkey', 'asset_id', 'assets'),
+    ('daily_returns', 'daily_returns_asset_id_fkey', 'asset_id', 'assets'),
+]
+def _recreate(ondelete: str) -> None:
+    for table, name, column, ref in FKS:
+        op.execute(f"ALTER TABLE {table} DROP CONSTRAINT IF EXISTS {name}")
+        not_valid = " NOT VALID" if table != 'daily_returns' else ""
+        op.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {name} FOREIGN KEY ({column}) "
+            f"REFERENCES {ref} (id){ondelete}{not_valid}"
+        )
+    # VALIDATE fora da transação da migração: a trava do ADD CONSTRAINT é
+    # liberada no commit e a varredura só pega SHARE UPDATE EXCLUSIVE
+    with op.get_context().autocommit_block():
+        for table, name, _, _ in FKS:
+            if table != 'daily_returns':
+                op.execute(f"ALTER TABLE {table} VALIDATE CONSTRAINT {name}")
+def upgrade() -> None:
+    _recreate(" ON DELETE CASCADE")
+def downgrade() -> None:
+    _recreate("")
@@ -0,0 +1,48 @@
+from __future__ import annotations
+
+from alembic import op
+
+revision = '005_dashboard_rollups'
+down_revision = '004_on_delete_cascade'
+branch_labels = None
+depends_on = None
+# Agregados do dashboard (ver rollups.py). As tabelas nascem preenchidas a
+# partir dos dados atuais; daí em diante a aplicação as mantém a cada escrita.
+def upgrade() -> None:
+    op.execute(
+        "CREATE TABLE rollup_clients ("
+        "id integer PRIMARY KEY, total integer NOT NULL DEFAULT 0, active integer NOT NULL DEFAULT 0)"
+    )
+    op.execute(
+        "INSERT INTO rollup_clients (id, total, active) "
+        "SELECT 1, count(*), count(*) FILTER (WHERE is_active) FROM clients"
+    )
+    op.execute(
+        "CREATE TABLE rollup_positions ("
+        "asset_id integer PRIMARY KEY REFERENCES assets (id) ON DELETE CASCADE, "
+        "quantity double precision NOT NULL DEFAULT 0, last_close double precision, "
+        "prev_close double precision, last_close_date date)"
+    )
+    # Dois últimos fechamentos por ativo pelo índice (asset_id, date DESC)
+    op.execute(
+        "INSERT INTO rollup_positions (asset_id, quantity, last_close, prev_close, last_close_date) "
+        "SELECT a.id, COALESCE(q.quantity, 0), c.closes[1], c.closes[2], c.last_date FROM assets a "
+        "LEFT JOIN (SELECT asset_id, sum(quantity) AS quantity FROM allocations GROUP BY asset_id) q ON q.asset_id = a.id "
+        "LEFT JOIN LATERAL (SELECT array_agg(close_price ORDER BY date DESC) AS closes, max(date) AS last_date FROM "
+        "(SELECT close_price, date FROM daily_returns d WHERE d.asset_id = a.id ORDER BY date DESC LIMIT 2) t) c ON true "
+        "WHERE q.quantity IS NOT NULL OR c.last_date IS NOT NULL"
+    )
+    op.execute(
+        "CREATE TABLE rollup_daily ("
+        "date date PRIMARY KEY, aum double precision NOT NULL, pnl double precision NOT NULL DEFAULT 0, "
+        "index_value double precision NOT NULL DEFAULT 1)"
+    )
+    op.execute(
+        "INSERT INTO rollup_daily (date, aum, pnl, index_value) "
+        "SELECT max(last_close_date), COALESCE(sum(quantity * last_close), 0), 0, 1 FROM rollup_positions "
+        "HAVING max(last_close_date) IS NOT NULL"
+    )
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS rollup_daily")
+    op.execute("DROP TABLE IF EXISTS rollup_positions")
+    op.execute("DROP TABLE IF EXISTS rollup_clients")
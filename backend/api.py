@@ -1,21 +1,21 @@
 from __future__ import annotations
-from typing import List, Optional
+from datetime import date, datetime
+from typing import List, Optional, Union
 import os, sys
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, status, Response
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Query, Request, status, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi.responses import RedirectResponse, StreamingResponse, JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy import select
 
 # Adiciona o diretório atual ao path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-import crud, schemas
-from database import get_session
+import bulk_import, crud, exports, http_cache, metrics, price_import, query_stats, rollups, schemas, search, sse, tick_history
+from database import get_read_session, get_session
+from fast_json import FastJSONResponse
 from auth import read_required, admin_required, get_token_for_form
-from pricing import yahoo_search, get_current_price, get_previous_close
+from pricing import get_current_price, get_previous_close
 from sqlalchemy.exc import IntegrityError
-from models import DailyReturn
 
 router = APIRouter(prefix="/api", tags=["invest"])
 
@@ -39,32 +39,33 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()) -> JSONRespons
     )
     return resp
 
-@router.get("/clients", response_model=List[schemas.ClientOut])
-async def list_clients(skip: int = Query(0, ge=0), limit: int = Query(20, gt=0, le=100), search: Optional[str] = None, is_active: Optional[bool] = None, session=Depends(get_session), _: schemas.User = Depends(read_required)) -> List[schemas.ClientOut]:
+@router.get("/clients", response_model=List[schemas.ClientOut], dependencies=[Depends(query_stats.budget(1))])
+async def list_clients(skip: int = Query(0, ge=0), limit: int = Query(20, gt=0, le=100), search: Optional[str] = None, is_active: Optional[bool] = None, session=Depends(get_read_session), _: schemas.User = Depends(read_required)) -> List[schemas.ClientOut]:
     clients = await crud.list_clients(session, skip, limit, search, is_active)
     return list(clients)  # type: ignore[return-value]
 
-@router.post("/clients", response_model=schemas.ClientOut, status_code=status.HTTP_201_CREATED)
+@router.post("/clients", response_model=schemas.ClientOut, status_code=status.HTTP_201_CREATED, dependencies=[Depends(query_stats.budget(3))])
 async def create_client(client_in: schemas.ClientCreate, session=Depends(get_session), _: schemas.User = Depends(admin_required)) -> schemas.ClientOut:
     return await crud.create_client(session, client_in)
 
-@router.get("/clients/{client_id}", response_model=schemas.ClientOut)
-async def get_client(client_id: int, session=Depends(get_session), _: schemas.User = Depends(read_required)) -> schemas.ClientOut:
-    client = await crud.get_client(session, client_id)
-    if not client: raise HTTPException(status_code=404, detail="Client not found")
-    return client
+@router.get("/clients/{client_id}", response_model=schemas.ClientOut, dependencies=[Depends(query_stats.budget(1))])
+async def get_client(client_id: int, request: Request, session=Depends(get_session), _: schemas.User = Depends(read_required)) -> Response:
+    async def build():
+        client = await crud.get_client(session, client_id)
+        if not client: raise HTTPException(status_code=404, detail="Client not found")
+        return schemas.ClientOut.model_validate(client), ()
+    return await http_cache.cached_response(request, [http_cache.client_key(client_id)], build)
 
-@router.put("/clients/{client_id}", response_model=schemas.ClientOut)
+@router.put("/clients/{client_id}", response_model=schemas.ClientOut, dependencies=[Depends(query_stats.budget(4))])
 async def update_client(client_id: int, updates: schemas.ClientUpdate, session=Depends(get_session), _: schemas.User = Depends(admin_required)) -> schemas.ClientOut:
     client = await crud.get_client(session, client_id)
     if not client: raise HTTPException(status_code=404, detail="Client not found")
     return await crud.update_client(session, client, updates)
 
-@router.delete("/clients/{client_id}", status_code=status.HTTP_204_NO_CONTENT, response_class=Response)
+@router.delete("/clients/{client_id}", status_code=status.HTTP_204_NO_CONTENT, response_class=Response, dependencies=[Depends(query_stats.budget(4))])
 async def delete_client(client_id: int, session=Depends(get_session), _: schemas.User = Depends(admin_required)) -> Response:
-    client = await crud.get_client(session, client_id)
-    if not client: raise HTTPException(status_code=404, detail="Client not found")
-    await crud.delete_client(session, client)
+    if not await crud.delete_client(session, client_id):
+        raise HTTPException(status_code=404, detail="Client not found")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @router.get("/prices/{symbol}")
@@ -84,53 +85,116 @@ async def get_prices(symbol: str) -> dict:
         prev = None
     return {"current": cur, "previous": prev}
 
-@router.post("/assets", response_model=schemas.AssetOut, status_code=status.HTTP_201_CREATED)
+@router.get("/prices/{symbol}/intraday", response_model=schemas.IntradaySeries)
+async def intraday_prices(symbol: str, start: Optional[datetime] = None, end: Optional[datetime] = None, points: int = Query(300, ge=1, le=tick_history.MAX_POINTS)) -> Response:
+    """Ticks do dia de um ticker, agregados no servidor em até `points` intervalos.
+
+    Lê o stream Redis do ticker com XRANGE entre `start` e `end` (padrão: todo
+    o histórico retido) e devolve abertura/máxima/mínima/fechamento por
+    intervalo. Como em `/prices/{symbol}`, falha do Redis vira série vazia.
+    """
+    start_ms = int(start.timestamp() * 1000) if start else None
+    end_ms = int(end.timestamp() * 1000) if end else None
+    try:
+        ticks = await tick_history.entries(symbol, start_ms, end_ms)
+    except Exception:
+        ticks = []
+    width, buckets = tick_history.downsample(ticks, points, start_ms, end_ms)
+    return FastJSONResponse({"symbol": symbol.upper(), "interval_seconds": width / 1000, "points": buckets})
+
+@router.get("/stream/prices")
+async def stream_prices(request: Request, symbols: str, last_event_id: Optional[str] = None) -> StreamingResponse:
+    """Cotações por Server-Sent Events (`text/event-stream`).
+
+    `symbols` é uma lista separada por vírgulas. O primeiro evento é um
+    `snapshot` com as cotações atuais; depois cada mudança chega como `tick`.
+    Na reconexão o navegador envia `Last-Event-ID` (ou `?last_event_id=`) e
+    recebe apenas os ticks perdidos, enquanto estiverem no buffer do servidor.
+    """
+    try:
+        syms = sse.parse_symbols(symbols)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    resume = request.headers.get("last-event-id") or last_event_id
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(sse.event_stream(syms, resume), media_type="text/event-stream", headers=headers)
+
+@router.post("/prices:bulk", response_model=schemas.PriceImportReport)
+async def bulk_import_prices(request: Request, format: Optional[str] = None, create_assets: bool = False, session=Depends(get_session), _: schemas.User = Depends(admin_required)) -> schemas.PriceImportReport:
+    """Carrega fechamentos diários em lote (CSV, NDJSON ou Parquet).
+
+    Cada linha traz `ticker` (ou `asset_id`), `date` e `close` (ou
+    `close_price`). Repetições de `(ativo, data)` ficam com a última linha e
+    substituem o valor gravado. Tickers desconhecidos são ignorados, a menos
+    que `create_assets=true`. Ao final os caches derivados do histórico dos
+    ativos alterados são invalidados; a resposta traz contadores e linhas/s.
+    """
+    fmt = price_import.detect_format(request.headers.get("content-type"), format)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Use text/csv, application/x-ndjson or application/vnd.apache.parquet")
+    if fmt == "parquet" and price_import.pq is None:
+        raise HTTPException(status_code=415, detail="Parquet support requires pyarrow")
+    return await price_import.import_prices(session, request.stream(), fmt, create_assets)
+
+@router.post("/assets", response_model=schemas.AssetOut, status_code=status.HTTP_201_CREATED, dependencies=[Depends(query_stats.budget(3))])
 async def create_asset(asset_in: schemas.AssetCreate, session=Depends(get_session), _: schemas.User = Depends(admin_required)) -> schemas.AssetOut:
-    return await crud.create_asset(session, asset_in)
+    asset = await crud.create_asset(session, asset_in)
+    search.index.add(asset.ticker, asset.name)  # os demais workers o veem na próxima recarga do índice
+    return asset
 
-@router.get("/assets", response_model=List[schemas.AssetOut])
-async def list_assets(skip: int = Query(0, ge=0), limit: int = Query(100, gt=0, le=500), search: Optional[str] = None, session=Depends(get_session), _: schemas.User = Depends(read_required)) -> List[schemas.AssetOut]:
-    assets = await crud.list_assets(session, skip, limit, search)
-    return list(assets)  # type: ignore[return-value]
+@router.get("/assets", response_model=List[schemas.AssetOut], dependencies=[Depends(query_stats.budget(1))])
+async def list_assets(request: Request, skip: int = Query(0, ge=0), limit: int = Query(100, gt=0, le=500), search: Optional[str] = None, session=Depends(http_cache.get_cache_session), _: schemas.User = Depends(read_required)) -> Response:
+    async def build():
+        assets = await crud.list_assets(session, skip, limit, search)
+        return [schemas.AssetOut.model_validate(a) for a in assets], ()
+    return await http_cache.cached_response(request, [http_cache.ASSETS_KEY], build)
 
 @router.get("/assets/search")
-async def search_assets(q: str) -> list[dict]:
-    """Busca sugestões de ativos pelo Yahoo Finance.
+async def search_assets(q: str, session=Depends(get_read_session)) -> list[dict]:
+    """Sugestões de ativos (`symbol`, `shortname`) para o autocomplete.
 
-    Consulta o serviço de busca do Yahoo Finance com o parâmetro `q` e
-    retorna uma lista de dicionários contendo `symbol` e `shortname`.
-    Em caso de erro na consulta externa, retorna uma lista vazia ao
-    invés de lançar exceção.
+    Responde do índice em memória com os ativos cadastrados e os resultados
+    do Yahoo Finance já vistos; só termos novos vão ao Yahoo, com o resultado
+    em cache no Redis (ver `search`). Em caso de erro na consulta externa,
+    retorna o que o índice tiver ao invés de lançar exceção.
     """
-    try:
-        return await yahoo_search(q)
-    except Exception:
-        return []
+    return await search.search(q, session)
 
-@router.get("/assets/{asset_id}", response_model=schemas.AssetOut)
+@router.get("/assets/{asset_id}", response_model=schemas.AssetOut, dependencies=[Depends(query_stats.budget(1))])
 async def get_asset(asset_id: int, session=Depends(get_session), _: schemas.User = Depends(read_required)) -> schemas.AssetOut:
     asset = await crud.get_asset(session, asset_id)
     if not asset: raise HTTPException(status_code=404, detail="Asset not found")
     return asset
 
-@router.put("/assets/{asset_id}", response_model=schemas.AssetOut)
+@router.put("/assets/{asset_id}", response_model=schemas.AssetOut, dependencies=[Depends(query_stats.budget(3))])
 async def update_asset(asset_id: int, updates: schemas.AssetUpdate, session=Depends(get_session), _: schemas.User = Depends(admin_required)) -> schemas.AssetOut:
     asset = await crud.get_asset(session, asset_id)
     if not asset: raise HTTPException(status_code=404, detail="Asset not found")
     return await crud.update_asset(session, asset, updates)
 
-@router.delete("/assets/{asset_id}", status_code=status.HTTP_204_NO_CONTENT, response_class=Response)
+@router.delete("/assets/{asset_id}", status_code=status.HTTP_204_NO_CONTENT, response_class=Response, dependencies=[Depends(query_stats.budget(1))])
 async def delete_asset(asset_id: int, session=Depends(get_session), _: schemas.User = Depends(admin_required)) -> Response:
-    asset = await crud.get_asset(session, asset_id)
-    if not asset: raise HTTPException(status_code=404, detail="Asset not found")
-    await crud.delete_asset(session, asset)
+    if not await crud.delete_asset(session, asset_id):
+        raise HTTPException(status_code=404, detail="Asset not found")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @router.get("/clients/{client_id}/allocations", response_model=List[schemas.AllocationOut])
-async def list_allocations(client_id: int, session=Depends(get_session), _: schemas.User = Depends(read_required)) -> List[schemas.AllocationOut]:
-    client = await crud.get_client(session, client_id)
-    if not client: raise HTTPException(status_code=404, detail="Client not found")
-    allocations = await crud.list_allocations_for_client(session, client_id)
+async def list_allocations(client_id: int, request: Request, session=Depends(http_cache.get_cache_session), _: schemas.User = Depends(read_required)) -> Response:
+    """Alocações com preço atual, variação do dia e rentabilidade desde a compra.
+
+    Com ETag: a versão depende do cliente, do cadastro e da cotação de cada
+    ativo da carteira (`http_cache`). Com o cache ligado lê do primário (ver
+    `http_cache.get_cache_session`); sem ele, da réplica.
+    """
+    async def build():
+        client = await crud.get_client(session, client_id)
+        if not client: raise HTTPException(status_code=404, detail="Client not found")
+        allocations = await crud.list_allocations_for_client(session, client_id)
+        deps = [k for a in allocations if a.asset for k in (http_cache.asset_key(a.asset_id), http_cache.quote_key(a.asset.ticker))]
+        return await _allocations_out(allocations), deps
+    return await http_cache.cached_response(request, [http_cache.client_key(client_id)], build)
+
+async def _allocations_out(allocations) -> List[schemas.AllocationOut]:
     out: list[schemas.AllocationOut] = []
     for alloc in allocations:
         # Protege contra falhas externas (rate-limit/HTTP) sem quebrar a rota
@@ -166,7 +230,7 @@ async def list_allocations(client_id: int, session=Depends(get_session), _: sche
         )
     return out
 
-@router.post("/allocations", response_model=schemas.AllocationOut, status_code=status.HTTP_201_CREATED)
+@router.post("/allocations", response_model=schemas.AllocationOut, status_code=status.HTTP_201_CREATED, dependencies=[Depends(query_stats.budget(3))])
 async def create_allocation(allocation_in: schemas.AllocationCreate, session=Depends(get_session), _: schemas.User = Depends(admin_required)) -> schemas.AllocationOut:
     try:
         alloc = await crud.create_allocation(session, allocation_in)
@@ -175,33 +239,69 @@ async def create_allocation(allocation_in: schemas.AllocationCreate, session=Dep
         raise HTTPException(status_code=409, detail="Allocation already exists for this client, asset and date")
     return schemas.AllocationOut(**allocation_in.model_dump(), id=alloc.id)
 
-@router.put("/allocations/{allocation_id}", response_model=schemas.AllocationOut)
+@router.post("/allocations:bulk", response_model=schemas.BulkImportReport)
+async def bulk_create_allocations(request: Request, format: Optional[str] = None, on_conflict: str = Query("skip", pattern="^(skip|update)$"), session=Depends(get_session), _: schemas.User = Depends(admin_required)) -> schemas.BulkImportReport:
+    """Importa alocações em lote a partir de CSV ou NDJSON enviado em streaming.
+
+    O formato vem do `Content-Type` (`text/csv` ou `application/x-ndjson`) ou
+    de `?format=`. Cada linha traz `client_id`, `ticker` (ou `asset_id`),
+    `quantity`, `purchase_price` e `purchase_date`; tickers desconhecidos
+    viram ativos novos. Duplicatas são ignoradas (`on_conflict=skip`) ou
+    atualizam quantidade e preço (`on_conflict=update`). A resposta traz
+    contadores, erros por linha e a vazão da importação.
+    """
+    fmt = bulk_import.detect_format(request.headers.get("content-type"), format)
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Use text/csv or application/x-ndjson")
+    return await bulk_import.import_allocations(session, request.stream(), fmt, on_conflict)
+
+@router.put("/allocations/{allocation_id}", response_model=schemas.AllocationOut, dependencies=[Depends(query_stats.budget(4))])
 async def update_allocation(allocation_id: int, updates: schemas.AllocationUpdate, session=Depends(get_session), _: schemas.User = Depends(admin_required)) -> schemas.AllocationOut:
     allocation = await crud.get_allocation(session, allocation_id)
     if not allocation: raise HTTPException(status_code=404, detail="Allocation not found")
     allocation = await crud.update_allocation(session, allocation, updates)
     return schemas.AllocationOut(id=allocation.id, client_id=allocation.client_id, asset_id=allocation.asset_id, quantity=allocation.quantity, purchase_price=allocation.purchase_price, purchase_date=allocation.purchase_date)
 
-@router.delete("/allocations/{allocation_id}", status_code=status.HTTP_204_NO_CONTENT, response_class=Response)
+@router.delete("/allocations/{allocation_id}", status_code=status.HTTP_204_NO_CONTENT, response_class=Response, dependencies=[Depends(query_stats.budget(2))])
 async def delete_allocation(allocation_id: int, session=Depends(get_session), _: schemas.User = Depends(admin_required)) -> Response:
-    allocation = await crud.get_allocation(session, allocation_id)
-    if not allocation: raise HTTPException(status_code=404, detail="Allocation not found")
-    await crud.delete_allocation(session, allocation)
+    if not await crud.delete_allocation(session, allocation_id):
+        raise HTTPException(status_code=404, detail="Allocation not found")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
-@router.get("/clients/{client_id}/performance", response_model=schemas.PerformanceOut)
-async def get_client_performance(client_id: int, session=Depends(get_session), _: schemas.User = Depends(read_required)) -> schemas.PerformanceOut:
-    client = await crud.get_client(session, client_id)
-    if not client:
-        raise HTTPException(status_code=404, detail="Client not found")
-    # Repassa cálculo ao módulo crud
-    return await crud.compute_client_performance(session, client_id)
+@router.get("/clients/{client_id}/performance", response_model=Union[schemas.PerformanceOut, schemas.PerformanceColumns], dependencies=[Depends(query_stats.budget(3))])
+async def get_client_performance(client_id: int, request: Request, start: Optional[date] = None, end: Optional[date] = None, shape: str = Query("rows", pattern="^(rows|columnar)$"), session=Depends(http_cache.get_cache_session), _: schemas.User = Depends(read_required)) -> Response:
+    """Curva de rentabilidade acumulada do cliente.
+
+    `shape=rows` (padrão) devolve `points: [{date, cumulative_return}]`;
+    `shape=columnar` devolve listas paralelas `dates` e `returns`, menores e
+    mais rápidas de serializar em séries longas. A série sai do crud como
+    listas e é serializada direto (`fast_json`), sem um modelo por ponto.
+
+    A série começa na primeira compra do cliente. Até o particionamento de
+    `daily_returns` ela trazia também os pregões anteriores, com retorno -1
+    (carteira ainda vazia); esses pontos deixaram de ser enviados.
+    """
+    async def build():
+        client = await crud.get_client(session, client_id)
+        if not client:
+            raise HTTPException(status_code=404, detail="Client not found")
+        allocations = await crud.list_allocations_for_client(session, client_id)
+        # Repassa cálculo ao módulo crud; a curva muda com o histórico dos ativos da carteira
+        dates, returns = await crud.performance_series(session, client_id, start, end, allocations=allocations)
+        if shape == "columnar":
+            content: dict = {"client_id": client_id, "dates": dates, "returns": returns}
+        else:
+            content = {"client_id": client_id, "points": [{"date": d, "cumulative_return": r} for d, r in zip(dates, returns)]}
+        return content, [http_cache.asset_key(a.asset_id) for a in allocations]
+    return await http_cache.cached_response(request, [http_cache.client_key(client_id)], build)
 
 @router.get("/clients/{client_id}/positions")
-async def export_positions(client_id: int, format: str = "csv", session=Depends(get_session), _: schemas.User = Depends(read_required)) -> StreamingResponse:
+async def export_positions(client_id: int, format: str = "csv", session=Depends(get_read_session), _: schemas.User = Depends(read_required)) -> Response:
     import csv
     from io import StringIO, BytesIO
     from openpyxl import Workbook
+    if not exports.available(format):
+        raise HTTPException(status_code=406, detail="Parquet/Arrow export requires pyarrow")
     client = await crud.get_client(session, client_id)
     if not client: raise HTTPException(status_code=404, detail="Client not found")
     allocations = await crud.list_allocations_for_client(session, client_id)
@@ -223,23 +323,10 @@ async def export_positions(client_id: int, format: str = "csv", session=Depends(
             prev = await get_previous_close(a.asset.ticker) if a.asset else None
         except Exception:
             prev = None
-        # Fallback para exportação: quando não houver preço atual (ex.: rate-limit), usa fechamento anterior
-        eff_current = cur if cur is not None else prev
-        profit = ((eff_current - a.purchase_price) / a.purchase_price) if eff_current is not None and a.purchase_price else None
-        daily = None
-        if prev and prev != 0 and eff_current is not None:
-            daily = (eff_current - prev) / prev
-        rows.append(
-            (
-                a.asset_id,
-                a.asset.ticker if a.asset else "",
-                a.quantity,
-                a.purchase_price,
-                cur,
-                profit,
-                daily,
-            )
-        )
+        rows.append(tuple(exports.position_row(a, cur, prev)))
+    if format in exports.ARROW_FORMATS:  # colunas tipadas (ticker em dicionário), sem parse na leitura
+        headers = {"Content-Disposition": f"attachment; filename=positions.{exports.EXTENSIONS[format]}"}
+        return Response(exports.encode("positions", format, rows[1:]), media_type=exports.FORMATS[format], headers=headers)
     if format == "xlsx":
         wb = Workbook(); ws = wb.active; ws.title = "positions"; 
         for row in rows: ws.append(list(row))
@@ -251,7 +338,7 @@ async def export_positions(client_id: int, format: str = "csv", session=Depends(
     return StreamingResponse(out, media_type="text/csv", headers=headers)
 
 @router.get("/clients/export")
-async def export_clients(session=Depends(get_session), _: schemas.User = Depends(read_required)) -> StreamingResponse:
+async def export_clients(session=Depends(get_read_session), _: schemas.User = Depends(read_required)) -> StreamingResponse:
     import csv
     from io import StringIO
     clients = await crud.list_clients(session, 0, 1000)
@@ -261,6 +348,77 @@ async def export_clients(session=Depends(get_session), _: schemas.User = Depends
     out.seek(0); headers = {"Content-Disposition": "attachment; filename=clients.csv"}
     return StreamingResponse(out, media_type="text/csv", headers=headers)
 
+def _export_out(job: dict) -> dict:
+    out = {k: v for k, v in job.items() if k in schemas.ExportJob.model_fields}
+    if job["status"] == "done":
+        out["download_url"] = f"/api/exports/{job['id']}/download"
+    return out
+
+async def _get_export(export_id: str, user: schemas.User) -> dict:
+    try:
+        job = await exports.get_job(export_id)
+    except Exception:
+        raise HTTPException(status_code=503, detail="Export queue unavailable")
+    # Jobs de outro usuário aparecem como inexistentes (exceto para admin)
+    if not job or (job["owner"] != user.username and user.role != "admin"):
+        raise HTTPException(status_code=404, detail="Export not found")
+    return job
+
+@router.post("/exports", response_model=schemas.ExportJob, status_code=status.HTTP_202_ACCEPTED)
+async def create_export(export_in: schemas.ExportCreate, session=Depends(get_read_session), user: schemas.User = Depends(read_required)) -> dict:
+    if not exports.available(export_in.format):
+        raise HTTPException(status_code=406, detail="Parquet/Arrow export requires pyarrow")
+    if export_in.client_id is not None and not await crud.get_client(session, export_in.client_id):
+        raise HTTPException(status_code=404, detail="Client not found")
+    try:
+        job = await exports.submit(export_in.kind, export_in.format, user.username, export_in.client_id,
+                                   start=export_in.start, end=export_in.end, tickers=export_in.tickers)
+    except Exception:
+        raise HTTPException(status_code=503, detail="Export queue unavailable")
+    return _export_out(job)
+
+@router.get("/exports/{export_id}", response_model=schemas.ExportJob)
+async def get_export(export_id: str, user: schemas.User = Depends(read_required)) -> dict:
+    return _export_out(await _get_export(export_id, user))
+
+@router.get("/exports/{export_id}/download")
+async def download_export(export_id: str, request: Request, user: schemas.User = Depends(read_required)) -> Response:
+    job = await _get_export(export_id, user)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Export is {job['status']}")
+    storage = exports.get_storage()
+    url = storage.url(job["key"])
+    if url:  # objeto no S3: URL assinada, o próprio S3 atende Range
+        return RedirectResponse(url, status_code=status.HTTP_307_TEMPORARY_REDIRECT)
+    size = storage.size(job["key"])
+    if size is None:
+        raise HTTPException(status_code=410, detail="Export file expired")
+    etag = f'"{job["id"]}-{size}"'
+    headers = {"Accept-Ranges": "bytes", "ETag": etag, "Content-Disposition": f'attachment; filename="{job["filename"]}"'}
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if if_range and if_range.strip() != etag:  # arquivo mudou desde o download parcial: envia inteiro
+        range_header = None
+    try:
+        byte_range = exports.parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE, headers={**headers, "Content-Range": f"bytes */{size}"})
+    media_type = exports.FORMATS[job["format"]]
+    if byte_range is None:
+        return StreamingResponse(exports.iter_file(storage.open(job["key"]), 0, size - 1), media_type=media_type, headers={**headers, "Content-Length": str(size)})
+    start, end = byte_range
+    headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(end - start + 1)})
+    return StreamingResponse(exports.iter_file(storage.open(job["key"]), start, end), status_code=status.HTTP_206_PARTIAL_CONTENT, media_type=media_type, headers=headers)
+
+@router.get("/dashboard/summary", response_model=schemas.DashboardSummary, dependencies=[Depends(query_stats.budget(3))])
+async def dashboard_summary(session=Depends(get_read_session), _: schemas.User = Depends(read_required)) -> schemas.DashboardSummary:
+    """Patrimônio total, variação do dia, retornos no mês/ano e contagem de clientes.
+
+    Lido dos agregados `rollup_*`, atualizados a cada alteração de alocação
+    e a cada carga de fechamentos; o custo não cresce com a carteira.
+    """
+    return await rollups.summary(session)
+
 def create_app() -> FastAPI:
     app = FastAPI(title="Investment API", version="1.0.0")
     origins_env = os.environ.get("FRONTEND_ORIGINS")
@@ -275,5 +433,7 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"]
     )
+    app.add_middleware(metrics.MetricsMiddleware)
+    app.add_middleware(query_stats.QueryStatsMiddleware)
     app.include_router(router)
     return app
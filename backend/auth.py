@@ -1,7 +1,9 @@
 from __future__ import annotations
-import os
+import asyncio, os, time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Dict, Optional, Tuple
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer
 from jose import jwt, JWTError
@@ -9,10 +11,21 @@ from passlib.context import CryptContext
 from schemas import User, Token
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Hashes pré-calculados (padrões: admin123 / reader123); em produção venham do ambiente.
+# Calcular bcrypt no import atrasava cada início de processo e de teste.
 USERS = {
-    "admin@example.com": {"username": "admin@example.com","full_name":"Admin","role":"admin","disabled":False,"hashed_password": pwd_context.hash("admin123")},
-    "reader@example.com": {"username": "reader@example.com","full_name":"Reader","role":"read","disabled":False,"hashed_password": pwd_context.hash("reader123")},
+    "admin@example.com": {"username": "admin@example.com","full_name":"Admin","role":"admin","disabled":False,"hashed_password": os.environ.get("ADMIN_PASSWORD_HASH", "$2b$12$mtsMxygSMVqN/WCFWJB6N.APUoLLcH13.qY9dIPCXMBGYwD4gKX3q")},
+    "reader@example.com": {"username": "reader@example.com","full_name":"Reader","role":"read","disabled":False,"hashed_password": os.environ.get("READER_PASSWORD_HASH", "$2b$12$7gBwDVBGV1F8j/FCo3P99OI4IsWgmnJtKvpQvJidASb87zUODKRue")},
 }
+# Usado para usuários inexistentes, para que o tempo de resposta não revele quais existem
+_DUMMY_HASH = USERS["reader@example.com"]["hashed_password"]
+
+# bcrypt consome ~200 ms de CPU: roda num pool limitado fora do event loop
+_hash_pool = ThreadPoolExecutor(max_workers=int(os.environ.get("AUTH_HASH_WORKERS", "4")), thread_name_prefix="bcrypt")
+# Claims de tokens já validados: token -> (claims, validade monotônica)
+TOKEN_CACHE_TTL = float(os.environ.get("AUTH_TOKEN_CACHE_TTL", "60"))
+TOKEN_CACHE_SIZE = int(os.environ.get("AUTH_TOKEN_CACHE_SIZE", "10000"))
+_token_cache: "OrderedDict[str, Tuple[Dict[str, Any], float]]" = OrderedDict()
 
 SECRET_KEY = os.environ.get("JWT_SECRET","devsecret")
 ALGORITHM = "HS256"
@@ -22,6 +35,14 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/token", auto_error=False)
 def verify_password(plain: str, hashed: str) -> bool:
     """Compara senha em texto puro com hash."""
     return pwd_context.verify(plain, hashed)
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    """`verify_password` no pool de threads do bcrypt, sem travar o event loop."""
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, verify_password, plain, hashed)
+
+async def hash_password(plain: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, pwd_context.hash, plain)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """Gera um token JWT assinando os dados fornecidos.
 
@@ -33,10 +54,11 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def authenticate_user(username: str, password: str) -> Optional[User]:
+async def authenticate_user(username: str, password: str) -> Optional[User]:
     """Autentica um usuário e retorna um objeto User se válido."""
     raw = USERS.get(username)
-    if not raw or not verify_password(password, raw["hashed_password"]):
+    valid = await verify_password_async(password, raw["hashed_password"] if raw else _DUMMY_HASH)
+    if not raw or not valid:
         return None
     return User(
         username=raw["username"],
@@ -45,6 +67,29 @@ def authenticate_user(username: str, password: str) -> Optional[User]:
         disabled=raw["disabled"],
     )
 
+def decode_token(token: str) -> Dict[str, Any]:
+    """Decodifica e valida o JWT, reaproveitando o resultado de tokens recentes.
+
+    O cache nunca passa da expiração (`exp`) do próprio token; tokens
+    inválidos não são guardados e seguem levantando `JWTError`.
+    """
+    now = time.monotonic()
+    hit = _token_cache.get(token)
+    if hit is not None:
+        if hit[1] > now:
+            _token_cache.move_to_end(token)
+            return hit[0]
+        del _token_cache[token]
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    ttl = TOKEN_CACHE_TTL
+    if "exp" in payload:
+        ttl = min(ttl, float(payload["exp"]) - time.time())
+    if ttl > 0:
+        _token_cache[token] = (payload, now + ttl)
+        if len(_token_cache) > TOKEN_CACHE_SIZE:
+            _token_cache.popitem(last=False)
+    return payload
+
 async def get_current_user(request: Request, token: str | None = Depends(oauth2_scheme)) -> User:
     """Recupera o usuário atual a partir do token JWT.
 
@@ -58,7 +103,7 @@ async def get_current_user(request: Request, token: str | None = Depends(oauth2_
     if not token:
         token = request.cookies.get("access_token")
     try:
-        payload = jwt.decode(token or "", SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token or "")
         username: Optional[str] = payload.get("sub")
         role: Optional[str] = payload.get("role")
         if username is None or role is None:
@@ -86,7 +131,7 @@ async def admin_required(user: User = Depends(get_current_user)) -> User:
     return user
 
 async def get_token_for_form(form) -> Token:
-    user = authenticate_user(form.username, form.password)
+    user = await authenticate_user(form.username, form.password)
     if not user: raise HTTPException(status_code=401, detail="Incorrect username or password")
     token = create_access_token({"sub": user.username, "role": user.role})
     return Token(access_token=token)
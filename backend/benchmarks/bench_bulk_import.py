@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Benchmark da importação em lote de alocações (`bulk_import`).
+
+Gera um CSV sintético com N lotes (clientes x tickers x datas) e mede a
+vazão de `import_allocations` em linhas/s, comparando com a criação linha
+a linha via `crud.create_allocation` (um commit e um refresh por lote) numa
+amostra. Por padrão usa SQLite em arquivo temporário; passe `--url` para
+medir contra o Postgres.
+
+Uso: python benchmarks/bench_bulk_import.py [--rows 100000] [--chunk 2000] [--url postgresql+asyncpg://...]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+import bulk_import  # noqa: E402
+import crud  # noqa: E402
+import models  # noqa: E402
+import schemas  # noqa: E402
+from database import Base  # noqa: E402
+
+
+def make_csv(n_rows: int, client_ids: list[int], n_tickers: int) -> list[bytes]:
+    lines = ["client_id,ticker,quantity,purchase_price,purchase_date"]
+    start = date(2015, 1, 1)
+    for i in range(n_rows):
+        d = start + timedelta(days=i // (len(client_ids) * n_tickers))
+        lines.append(f"{client_ids[i % len(client_ids)]},BK{(i // len(client_ids)) % n_tickers},{random.randint(1, 500)},{random.uniform(5, 300):.2f},{d.isoformat()}")
+    body = "\n".join(lines).encode()
+    return [body[i:i + 65536] for i in range(0, len(body), 65536)]
+
+async def main(rows: int, chunk: int, url: str | None, sample: int) -> None:
+    tmp = None
+    if url is None:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        url = f"sqlite+aiosqlite:///{tmp.name}"
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as s:
+        clients = [models.Client(name=f"Bench {i}", email=f"bench{i}@example.com") for i in range(50)]
+        s.add_all(clients)
+        await s.commit()
+        client_ids = [c.id for c in clients]
+
+    chunks = make_csv(rows, client_ids, 40)
+    async def body():
+        for c in chunks:
+            yield c
+    async with Session() as s:
+        rep = await bulk_import.import_allocations(s, body(), "csv", chunk_size=chunk)
+    print(f"bulk:        {rep.inserted:>8} inseridas em {rep.elapsed_seconds:8.2f}s  {rep.rows_per_second:>10.0f} linhas/s  (erros={rep.failed}, duplicadas={rep.duplicates})")
+
+    async with Session() as s:
+        asset = models.Asset(ticker="ONEBYONE")
+        s.add(asset)
+        await s.commit()
+        t0 = time.perf_counter()
+        for i in range(sample):
+            await crud.create_allocation(s, schemas.AllocationCreate(
+                client_id=client_ids[i % len(client_ids)], asset_id=asset.id, quantity=1,
+                purchase_price=10, purchase_date=date(2000, 1, 1) + timedelta(days=i)))
+        elapsed = time.perf_counter() - t0
+    print(f"uma a uma:   {sample:>8} inseridas em {elapsed:8.2f}s  {sample / elapsed:>10.0f} linhas/s")
+    await engine.dispose()
+    if tmp is not None:
+        os.unlink(tmp.name)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--chunk", type=int, default=bulk_import.CHUNK_SIZE)
+    parser.add_argument("--sample", type=int, default=2000, help="linhas para a comparação uma a uma")
+    parser.add_argument("--url", default=None)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.chunk, args.url, args.sample))
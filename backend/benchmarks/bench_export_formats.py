@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos formatos de exportação (`exports.WRITERS`) para o histórico de preços.
+
+Gera N fechamentos (ticker, date, close) de alguns tickers e mede, por
+formato, bytes do arquivo, tempo de escrita e tempo de leitura de volta
+(csv.reader / openpyxl / pyarrow). Parquet e Arrow exigem pyarrow.
+
+Uso: python benchmarks/bench_export_formats.py [--rows 200000] [--tickers 50]
+"""
+import argparse
+import csv
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import exports  # noqa: E402
+
+
+def make_rows(n: int, tickers: int) -> list:
+    names = [f"TCK{i:03d}3" for i in range(tickers)]
+    per = max(1, n // tickers)
+    start = date(2000, 1, 3)
+    rows = []
+    for t in names:
+        price = random.uniform(5, 100)
+        for d in range(per):
+            price *= 1 + random.gauss(0, 0.01)
+            rows.append([t, start + timedelta(days=d), round(price, 4)])
+    return rows[:n]
+
+def read_back(fmt: str, path: str) -> int:
+    if fmt == "csv":
+        with open(path, newline="") as f:
+            return sum(1 for _ in csv.reader(f)) - 1
+    if fmt == "xlsx":
+        from openpyxl import load_workbook
+        return sum(1 for _ in load_workbook(path, read_only=True).active.iter_rows(values_only=True)) - 1
+    if fmt == "parquet":
+        return exports.pq.read_table(path).num_rows
+    with exports.pa.OSFile(path) as f:
+        return exports.pa.ipc.open_stream(f).read_all().num_rows
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--tickers", type=int, default=50)
+    parser.add_argument("--formats", default="csv,xlsx,parquet,arrow")
+    args = parser.parse_args()
+    rows = make_rows(args.rows, args.tickers)
+    print(f"{len(rows)} fechamentos de {args.tickers} tickers")
+    print(f"{'formato':<10}{'bytes':>12}{'escrita ms':>12}{'leitura ms':>12}")
+    for fmt in args.formats.split(","):
+        if not exports.available(fmt):
+            print(f"{fmt:<10}{'(pyarrow ausente)':>36}")
+            continue
+        fd, path = tempfile.mkstemp(suffix="." + exports.EXTENSIONS[fmt])
+        os.close(fd)
+        try:
+            started = time.perf_counter()
+            writer = exports.WRITERS[fmt](path, exports.COLUMNS["prices"], "prices")
+            for row in rows:
+                writer.append(row)
+            writer.close()
+            write_ms = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            assert read_back(fmt, path) == len(rows)
+            read_ms = (time.perf_counter() - started) * 1000
+            print(f"{fmt:<10}{os.path.getsize(path):>12}{write_ms:>12.0f}{read_ms:>12.0f}")
+        finally:
+            os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Benchmark da serialização de séries de performance (`/clients/{id}/performance`).
+
+Compara, por 10k pontos, o caminho padrão do FastAPI (um `PerformancePoint`
+por dia, validação pelo `response_model` e `JSONResponse`) com o caminho
+rápido (`fast_json`) nas formas por linha e colunar (`?shape=columnar`).
+Mede bytes da resposta, bytes com gzip e tempo de montagem + codificação.
+
+Uso: python benchmarks/bench_json_series.py [--points 10000] [--repeat 20]
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+import fast_json  # noqa: E402
+import schemas  # noqa: E402
+
+
+def make_series(n: int) -> tuple[list[date], list[float]]:
+    start = date(2000, 1, 3)
+    dates = [start + timedelta(days=i) for i in range(n)]
+    value, returns = 1.0, []
+    for _ in range(n):
+        value *= 1 + random.gauss(0.0003, 0.01)
+        returns.append(value - 1)
+    return dates, returns
+
+FIELD = create_response_field(name="response", type_=schemas.PerformanceOut)
+
+async def pydantic_path(dates, returns) -> bytes:
+    perf = schemas.PerformanceOut(client_id=1, points=[schemas.PerformancePoint(date=d, cumulative_return=r) for d, r in zip(dates, returns)])
+    content = await serialize_response(field=FIELD, response_content=perf)
+    return JSONResponse(content).body
+
+async def rows_path(dates, returns) -> bytes:
+    return fast_json.dumps({"client_id": 1, "points": [{"date": d, "cumulative_return": r} for d, r in zip(dates, returns)]})
+
+async def columnar_path(dates, returns) -> bytes:
+    return fast_json.dumps({"client_id": 1, "dates": dates, "returns": returns})
+
+async def columnar_stdlib(dates, returns) -> bytes:
+    content = {"client_id": 1, "dates": [d.isoformat() for d in dates], "returns": returns}
+    return json.dumps(content, separators=(",", ":")).encode()
+
+VARIANTS = {
+    "pydantic (response_model)": pydantic_path,
+    "linhas (fast_json)": rows_path,
+    "colunar (fast_json)": columnar_path,
+    "colunar (json stdlib)": columnar_stdlib,
+}
+
+async def run(points: int, repeat: int) -> None:
+    dates, returns = make_series(points)
+    backend = "orjson" if fast_json.orjson is not None else "json (orjson ausente)"
+    print(f"{points} pontos, melhor de {repeat} execuções; fast_json usa {backend}")
+    print(f"{'caminho':<28}{'bytes':>10}{'gzip':>9}{'ms':>9}{'ms/10k':>9}")
+    for name, fn in VARIANTS.items():
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            body = await fn(dates, returns)
+            best = min(best, time.perf_counter() - started)
+        ms = best * 1000
+        print(f"{name:<28}{len(body):>10}{len(gzip.compress(body)):>9}{ms:>9.2f}{ms * 10_000 / points:>9.2f}")
+
+def main() -> None:
+    import asyncio
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.points, args.repeat))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark do autocomplete de ativos (`search.search`) respondido pelo índice.
+
+Indexa N tickers sintéticos com nomes e mede a latência (p50/p99/máx) de
+buscas por tickers conhecidos, por prefixos e por trechos do nome. O Yahoo e
+o Redis são substituídos por stubs e cada termo passa uma vez antes da
+medição, então os números são do caminho local (termos já vistos).
+
+Uso: python benchmarks/bench_search.py [--assets 20000] [--queries 20000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pricing  # noqa: E402
+import search  # noqa: E402
+
+WORDS = ["BANCO", "PETRO", "ENERGIA", "MINERACAO", "VAREJO", "SAUDE", "AGRO", "LOGISTICA", "SEGUROS", "TELECOM"]
+
+def make_assets(n: int) -> list:
+    out = set()
+    while len(out) < n:
+        root = "".join(random.choices(string.ascii_uppercase, k=4))
+        out.add((f"{root}{random.choice('3456')}.SA", f"{random.choice(WORDS)} {root} S.A."))
+    return sorted(out)
+
+def percentile(samples: list, p: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * p))]
+
+async def _no_redis():
+    raise ConnectionError("bench")
+
+async def _no_results(q, retries=3):
+    return []
+
+async def run(assets: int, queries: int) -> None:
+    pricing._get_redis, pricing.yahoo_search = _no_redis, _no_results
+    logging.disable(logging.WARNING)
+    items = make_assets(assets)
+    search.index.add_many(items)
+    cases = {
+        "ticker exato": [s for s, _ in random.choices(items, k=queries)],
+        "prefixo (4)": [s[:4] for s, _ in random.choices(items, k=queries)],
+        "trecho do nome": [n.split()[1][:3] + " S" for _, n in random.choices(items, k=queries)],
+    }
+    print(f"{assets} ativos no índice, {queries} buscas por caso")
+    print(f"{'caso':<18}{'p50 µs':>10}{'p99 µs':>10}{'máx µs':>10}")
+    for name, qs in cases.items():
+        for q in set(qs):  # aquecimento: termos novos passam pelo stub do Yahoo
+            await search.search(q)
+        samples = []
+        for q in qs:
+            started = time.perf_counter()
+            await search.search(q)
+            samples.append((time.perf_counter() - started) * 1e6)
+        samples.sort()
+        print(f"{name:<18}{percentile(samples, .5):>10.1f}{percentile(samples, .99):>10.1f}{samples[-1]:>10.1f}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assets", type=int, default=20_000)
+    parser.add_argument("--queries", type=int, default=20_000)
+    args = parser.parse_args()
+    asyncio.run(run(args.assets, args.queries))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark das codificações de ticks WebSocket (json, msgpack, columnar).
+
+Para cada codificação mede bytes por tick (frame de um assinante, com e sem
+permessage-deflate) e CPU de codificação por tick somando todos os
+assinantes, para 1k e 10k conexões. Codificadores sem estado codificam uma
+vez por tick (como em `ConnectionManager.broadcast`); o colunar mantém um
+dicionário de símbolos por conexão e é codificado para cada uma.
+
+Uso: python benchmarks/bench_ws_encoding.py [--ticks 20] [--symbols 20]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import zlib
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ws_encoding  # noqa: E402
+
+SYMBOLS = ["AAPL", "GOOGL", "MSFT", "TSLA", "AMZN", "PETR4.SA", "VALE3.SA", "ITUB4.SA", "BBDC4.SA", "ABEV3.SA"]
+
+def make_ticks(n_ticks: int, n_symbols: int) -> list[dict]:
+    symbols = (SYMBOLS * (n_symbols // len(SYMBOLS) + 1))[:n_symbols]
+    symbols = [s if i < len(SYMBOLS) else f"{s}{i}" for i, s in enumerate(symbols)]
+    prices = {s: random.uniform(10, 500) for s in symbols}
+    ticks = []
+    for _ in range(n_ticks):
+        data = []
+        for s in symbols:
+            prices[s] *= 1 + random.uniform(-0.002, 0.002)
+            data.append({"ticker": s, "price": round(prices[s], 2), "change": round(random.uniform(-5, 5), 2), "change_percent": round(random.uniform(-3, 3), 2), "timestamp": datetime.now()})
+        ticks.append({"type": "delta", "seq": len(ticks) + 1, "timestamp": datetime.now(), "data": data})
+    return ticks
+
+def deflated_size(frames: list) -> float:
+    """Tamanho médio com permessage-deflate (contexto mantido entre mensagens)."""
+    comp = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+    total = 0
+    for f in frames:
+        raw = f.encode() if isinstance(f, str) else f
+        total += len(comp.compress(raw) + comp.flush(zlib.Z_SYNC_FLUSH)) - 4
+    return total / len(frames)
+
+def bench(name: str, ticks: list[dict], subscribers: int) -> tuple[float, float, float]:
+    cls = ws_encoding.ENCODERS[name]
+    shared = cls.stateless
+    encoders = [cls()] if shared else [cls() for _ in range(subscribers)]
+    frames = []
+    start = time.perf_counter()
+    for tick in ticks:
+        for enc in encoders:
+            frame = enc.encode(tick)
+        frames.append(frame)
+    elapsed = time.perf_counter() - start
+    raw = sum(len(f.encode() if isinstance(f, str) else f) for f in frames) / len(frames)
+    return raw, deflated_size(frames), elapsed / len(ticks) * 1e6
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--symbols", type=int, default=20)
+    args = parser.parse_args()
+    ticks = make_ticks(args.ticks, args.symbols)
+    print(f"{args.symbols} símbolos por tick, {args.ticks} ticks")
+    print(f"{'codificação':<12}{'assinantes':>11}{'bytes/tick':>12}{'deflate':>10}{'CPU µs/tick':>14}")
+    for subscribers in (1_000, 10_000):
+        for name in ws_encoding.ENCODERS:
+            raw, deflated, cpu = bench(name, ticks, subscribers)
+            print(f"{name:<12}{subscribers:>11}{raw:>12.0f}{deflated:>10.0f}{cpu:>14.0f}")
+    print("deflate: tamanho médio por frame de um assinante; o custo de CPU da compressão é por conexão.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+from __future__ import annotations
+
+import codecs
+import csv
+import json
+import os
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Iterable
+from typing import Any
+
+from pydantic import ValidationError
+from sqlalchemy import or_, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import http_cache
+import models
+import rollups
+import schemas
+
+# Importação em lote de alocações (`POST /api/allocations:bulk`). O corpo é
+# lido em streaming e processado em blocos de CHUNK_SIZE linhas: cada bloco
+# resolve tickers/clientes com uma consulta, cria os ativos que faltam e
+# grava tudo num INSERT multi-linha com ON CONFLICT, em uma transação.
+CHUNK_SIZE = int(os.environ.get("BULK_CHUNK_SIZE", "2000"))
+MAX_REPORTED_ERRORS = int(os.environ.get("BULK_MAX_ERRORS", "1000"))
+FORMATS = ("csv", "ndjson")
+
+Record = tuple[int, Any]  # (número da linha, linha bruta)
+
+def detect_format(content_type: str | None, requested: str | None = None) -> str | None:
+    if requested:
+        return requested if requested in FORMATS else None
+    ct = (content_type or "").split(";")[0].strip().lower()
+    if ct in ("text/csv", "application/csv"):
+        return "csv"
+    if ct in ("application/x-ndjson", "application/ndjson", "application/jsonl", "application/json-lines"):
+        return "ndjson"
+    return None
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Quebra o corpo em linhas sem carregá-lo inteiro na memória."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+class _LineFeed:
+    """Iterador síncrono abastecido aos poucos, para um único `csv.reader`.
+
+    O reader só é chamado quando as linhas recebidas fecham um registro
+    (aspas balanceadas), então nunca fica sem linha no meio de um campo.
+    """
+
+    def __init__(self) -> None:
+        self.lines: deque = deque()
+
+    def __iter__(self) -> _LineFeed:
+        return self
+
+    def __next__(self) -> str:
+        if not self.lines:
+            raise StopIteration
+        return self.lines.popleft()
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Record]:
+    """Gera `(linha, registro)`; no CSV a primeira linha é o cabeçalho.
+
+    Registros que não puderem ser decodificados saem como `Exception`,
+    para virarem erro daquela linha sem interromper a importação. No CSV um
+    campo entre aspas pode conter quebras de linha; o número informado é o
+    da primeira linha do registro.
+    """
+    header: list[str] | None = None
+    feed = _LineFeed()
+    reader = csv.reader(feed)
+    n = start = quotes = 0
+    async for line in iter_lines(chunks):
+        n += 1
+        if fmt == "ndjson":
+            if not line.strip():
+                continue
+            try:
+                yield n, json.loads(line)
+            except ValueError as e:
+                yield n, ValueError(f"JSON inválido: {e}")
+            continue
+        if not quotes and not line.strip():
+            continue
+        if not quotes:
+            start = n
+        feed.lines.append(line + "\n")
+        quotes += line.count('"')
+        if quotes % 2:
+            continue  # campo entre aspas segue na próxima linha
+        quotes = 0
+        values = next(reader)
+        if header is None:
+            header = [h.strip().lower() for h in values]
+            continue
+        if len(values) != len(header):
+            yield start, ValueError(f"esperadas {len(header)} colunas, recebidas {len(values)}")
+            continue
+        yield start, {k: (v.strip() or None) for k, v in zip(header, values)}
+    if quotes:
+        yield start, ValueError("aspas não fechadas no fim do arquivo")
+
+def _insert(session: AsyncSession):
+    return pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+
+def _format_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc']) or 'linha'}: {err['msg']}" for err in e.errors())
+
+class AllocationImporter:
+    """Acumula o relatório enquanto grava os blocos de uma importação."""
+
+    def __init__(self, session: AsyncSession, on_conflict: str = "skip", chunk_size: int = CHUNK_SIZE) -> None:
+        self.session = session
+        self.on_conflict = on_conflict
+        self.chunk_size = chunk_size
+        self.report = schemas.BulkImportReport()
+
+    def _error(self, line: int, message: str, failed: bool = True) -> None:
+        self.report.failed += failed
+        if len(self.report.errors) < MAX_REPORTED_ERRORS:
+            self.report.errors.append(schemas.BulkRowError(line=line, error=message))
+        else:
+            self.report.errors_truncated = True
+
+    async def run(self, records: AsyncIterator[Record]) -> schemas.BulkImportReport:
+        started = time.perf_counter()
+        batch: list[tuple[int, schemas.AllocationImportRow]] = []
+        async for line, raw in records:
+            self.report.received += 1
+            if isinstance(raw, Exception):
+                self._error(line, str(raw))
+                continue
+            if not isinstance(raw, dict):
+                self._error(line, "registro deve ser um objeto")
+                continue
+            try:
+                batch.append((line, schemas.AllocationImportRow.model_validate(raw)))
+            except ValidationError as e:
+                self._error(line, _format_error(e))
+                continue
+            if len(batch) >= self.chunk_size:
+                await self._flush(batch)
+                batch = []
+        if batch:
+            await self._flush(batch)
+        if self.report.assets_created:
+            await http_cache.bump(http_cache.ASSETS_KEY)
+        self.report.errors.sort(key=lambda e: e.line)
+        elapsed = time.perf_counter() - started
+        self.report.elapsed_seconds = round(elapsed, 4)
+        self.report.rows_per_second = round(self.report.received / elapsed, 1) if elapsed else 0.0
+        return self.report
+
+    async def _resolve_assets(self, rows: Iterable[schemas.AllocationImportRow]) -> tuple[dict[str, int], set]:
+        """Uma consulta por bloco para tickers e ids; cria os tickers ausentes."""
+        names = {r.ticker: r.name for r in rows if r.ticker}
+        ids = {r.asset_id for r in rows if not r.ticker}
+        conds = []
+        if names:
+            conds.append(models.Asset.ticker.in_(names))
+        if ids:
+            conds.append(models.Asset.id.in_(ids))
+        found = (await self.session.execute(select(models.Asset.id, models.Asset.ticker).where(or_(*conds)))).all() if conds else []
+        by_ticker = {t: i for i, t in found}
+        known_ids = {i for i, _ in found}
+        missing = [t for t in names if t not in by_ticker]
+        if missing:
+            stmt = _insert(self.session)(models.Asset.__table__).on_conflict_do_nothing(index_elements=["ticker"])
+            created = (await self.session.execute(
+                stmt.returning(models.Asset.id, models.Asset.ticker), [{"ticker": t, "name": names[t]} for t in missing]
+            )).all()
+            self.report.assets_created += len(created)
+            by_ticker.update({t: i for i, t in created})
+            if len(created) < len(missing):  # criados em paralelo por outra importação
+                rest = [t for t in missing if t not in by_ticker]
+                by_ticker.update({t: i for i, t in (await self.session.execute(
+                    select(models.Asset.id, models.Asset.ticker).where(models.Asset.ticker.in_(rest))
+                )).all()})
+        return by_ticker, known_ids
+
+    async def _flush(self, batch: list[tuple[int, schemas.AllocationImportRow]]) -> None:
+        rows = [r for _, r in batch]
+        by_ticker, asset_ids = await self._resolve_assets(rows)
+        client_ids = set((await self.session.execute(
+            select(models.Client.id).where(models.Client.id.in_({r.client_id for r in rows}))
+        )).scalars())
+        values: list[dict[str, Any]] = []
+        lines: dict[tuple[int, int, Any], int] = {}
+        for line, r in batch:
+            asset_id = by_ticker.get(r.ticker) if r.ticker else (r.asset_id if r.asset_id in asset_ids else None)
+            if r.client_id not in client_ids:
+                self._error(line, f"cliente {r.client_id} não encontrado")
+                continue
+            if asset_id is None:
+                self._error(line, f"ativo {r.ticker or r.asset_id} não encontrado")
+                continue
+            key = (r.client_id, asset_id, r.purchase_date)
+            if key in lines:
+                self._error(line, f"duplicada da linha {lines[key]} no mesmo arquivo")
+                continue
+            lines[key] = line
+            values.append({"client_id": r.client_id, "asset_id": asset_id, "quantity": r.quantity,
+                           "purchase_price": r.purchase_price, "purchase_date": r.purchase_date})
+        if values:
+            table = models.Allocation.__table__
+            # executemany: o SQLAlchemy agrupa as linhas em INSERTs multi-linha
+            # ("insertmanyvalues") reaproveitando o SQL compilado entre blocos
+            stmt = _insert(self.session)(table)
+            index = ["client_id", "asset_id", "purchase_date"]
+            if self.on_conflict == "update":
+                stmt = stmt.on_conflict_do_update(index_elements=index, set_={
+                    "quantity": stmt.excluded.quantity, "purchase_price": stmt.excluded.purchase_price,
+                })
+                # Linhas já existentes antes deste bloco contam como atualizadas
+                existing = await self._existing(values)
+                await self.session.execute(stmt, values)
+                self.report.updated += len(existing)
+                self.report.inserted += len(values) - len(existing)
+                deltas: dict[int, float] = {}
+                for v in values:
+                    key = (v["client_id"], v["asset_id"], v["purchase_date"])
+                    deltas[v["asset_id"]] = deltas.get(v["asset_id"], 0) + v["quantity"] - existing.get(key, 0)
+            else:
+                written = (await self.session.execute(
+                    stmt.on_conflict_do_nothing(index_elements=index).returning(table.c.client_id, table.c.asset_id, table.c.purchase_date, table.c.quantity),
+                    values,
+                )).all()
+                self.report.inserted += len(written)
+                written_keys = {tuple(w[:3]) for w in written}
+                deltas = {}
+                for w in written:
+                    deltas[w.asset_id] = deltas.get(w.asset_id, 0) + w.quantity
+                for key, line in lines.items():
+                    if key not in written_keys:
+                        self.report.duplicates += 1
+                        self._error(line, "alocação já existe para este cliente, ativo e data", failed=False)
+            await rollups.adjust_positions(self.session, deltas)
+        await self.session.commit()
+        if values:
+            await http_cache.bump(*(http_cache.client_key(c) for c in {v["client_id"] for v in values}))
+
+    async def _existing(self, values: list[dict[str, Any]]) -> dict[tuple[int, int, Any], float]:
+        """Quantidade atual das linhas do bloco que já existem no banco."""
+        t = models.Allocation
+        keys = {(v["client_id"], v["asset_id"], v["purchase_date"]) for v in values}
+        res = await self.session.execute(select(t.client_id, t.asset_id, t.purchase_date, t.quantity).where(
+            t.client_id.in_({k[0] for k in keys}), t.asset_id.in_({k[1] for k in keys})
+        ))
+        return {(c, a, d): q for c, a, d, q in res.all() if (c, a, d) in keys}
+
+async def import_allocations(session: AsyncSession, chunks: AsyncIterator[bytes], fmt: str,
+                             on_conflict: str = "skip", chunk_size: int = CHUNK_SIZE) -> schemas.BulkImportReport:
+    return await AllocationImporter(session, on_conflict, chunk_size).run(iter_records(chunks, fmt))
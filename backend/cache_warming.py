@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import logging
+import math
+import os
+import time
+from collections.abc import Sequence
+from datetime import UTC, datetime, timedelta
+from datetime import time as dtime
+from typing import Any, NamedTuple
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import select
+
+import models
+import pricing
+
+logger = logging.getLogger("cache_warming")
+
+# Aquecimento das chaves `price:`/`prev:` dos tickers em carteira, para que a
+# primeira visita do dia não pague a latência do Yahoo. A task de beat roda a
+# cada WARM_TICK segundos: sincroniza o conjunto `warm:due` (score = instante
+# da próxima atualização de cada ticker) com os tickers de `allocations`, pega
+# os vencidos e os divide em lotes de QUOTE_BATCH_SIZE espaçados igualmente
+# dentro do tick, no máximo WARM_MAX_RPS requisições por segundo ao Yahoo.
+# O que não couber no orçamento fica vencido para o próximo tick, mais antigo
+# primeiro. Com o pregão aberto (ou prestes a abrir) o ticker é atualizado a
+# cada WARM_OPEN_INTERVAL; fora dele, a cada WARM_CLOSED_INTERVAL, o bastante
+# para as chaves não expirarem (PRICE_CACHE_TTL). Feriados não são tratados:
+# contam como pregão aberto.
+ENABLED = os.environ.get("WARM_ENABLED", "true").lower() in ("1", "true", "yes")
+TICK = float(os.environ.get("WARM_TICK", "60"))
+OPEN_INTERVAL = float(os.environ.get("WARM_OPEN_INTERVAL", "60"))
+CLOSED_INTERVAL = float(os.environ.get("WARM_CLOSED_INTERVAL", str(min(1800, pricing.CACHE_TTL * 0.8))))
+PREOPEN = timedelta(minutes=float(os.environ.get("WARM_PREOPEN_MINUTES", "30")))
+MAX_RPS = float(os.environ.get("WARM_MAX_RPS", "0.5"))
+DUE_KEY = "warm:due"
+
+class Market(NamedTuple):
+    name: str
+    tz: ZoneInfo
+    open: dtime
+    close: dtime
+
+def _hours(env: str, default: str) -> tuple[dtime, dtime]:
+    start, end = os.environ.get(env, default).split("-")
+    return dtime.fromisoformat(start.strip()), dtime.fromisoformat(end.strip())
+
+B3 = Market("B3", ZoneInfo("America/Sao_Paulo"), *_hours("WARM_B3_HOURS", "10:00-17:00"))
+US = Market("US", ZoneInfo("America/New_York"), *_hours("WARM_US_HOURS", "09:30-16:00"))
+
+def market_for(ticker: str) -> Market:
+    """B3 para tickers `.SA` do Yahoo; NYSE/Nasdaq para os demais."""
+    return B3 if ticker.upper().endswith(".SA") else US
+
+def is_active(market: Market, now: datetime | None = None) -> bool:
+    """Pregão aberto, ou até WARM_PREOPEN_MINUTES antes da abertura, em dia útil."""
+    local = (now or datetime.now(UTC)).astimezone(market.tz)
+    if local.weekday() >= 5:
+        return False
+    opens = datetime.combine(local.date(), market.open, market.tz) - PREOPEN
+    closes = datetime.combine(local.date(), market.close, market.tz)
+    return opens <= local <= closes
+
+def interval_for(ticker: str, now: datetime | None = None) -> float:
+    return OPEN_INTERVAL if is_active(market_for(ticker), now) else CLOSED_INTERVAL
+
+def plan(due: Sequence[str], tick: float = TICK, batch_size: int | None = None,
+         max_rps: float = MAX_RPS) -> list[tuple[float, list[str]]]:
+    """Lotes (atraso em s, tickers) espaçados igualmente dentro de `tick`.
+
+    No máximo `max_rps * tick` lotes; os tickers que sobrarem ficam de fora.
+    """
+    batch_size = batch_size or pricing.QUOTE_BATCH_SIZE
+    budget = max(1, math.floor(max_rps * tick))
+    batches = [list(due[i:i + batch_size]) for i in range(0, len(due), batch_size)][:budget]
+    step = tick / len(batches) if batches else 0
+    return [(round(i * step, 3), b) for i, b in enumerate(batches)]
+
+async def held_tickers(session: Any) -> list[str]:
+    q = (select(models.Asset.ticker).join(models.Allocation, models.Allocation.asset_id == models.Asset.id)
+         .where(models.Allocation.quantity > 0).distinct())
+    return sorted({t.upper() for t in (await session.execute(q)).scalars()})
+
+async def schedule(session: Any, now: float | None = None, tick: float = TICK) -> list[tuple[float, list[str]]]:
+    """Sincroniza `warm:due` com as carteiras e devolve os lotes deste tick.
+
+    Tickers novos entram vencidos; os planejados já recebem o próximo
+    vencimento (pelo pregão da sua bolsa), então um tick seguinte não os
+    repete enquanto o lote ainda aguarda a vez.
+    """
+    now = time.time() if now is None else now
+    held = await held_tickers(session)
+    r = await pricing._get_redis()
+    tracked = set(await r.zrange(DUE_KEY, 0, -1))
+    gone = tracked.difference(held)
+    if gone:
+        await r.zrem(DUE_KEY, *gone)
+    if held:
+        await r.zadd(DUE_KEY, {t: now for t in held}, nx=True)
+    due = await r.zrangebyscore(DUE_KEY, "-inf", now)
+    batches = plan(due, tick)
+    if batches:
+        at = datetime.fromtimestamp(now, UTC)
+        await r.zadd(DUE_KEY, {t: now + delay + interval_for(t, at) for delay, batch in batches for t in batch})
+    logger.info("cache_warming: %d tickers em carteira, %d vencidos, %d em %d lotes",
+                len(held), len(due), sum(len(b) for _, b in batches), len(batches))
+    return batches
+
+async def refresh_batch(symbols: list[str]) -> int:
+    """Atualiza um lote; se o Yahoo falhar, os tickers voltam a vencer no próximo tick."""
+    try:
+        return await pricing.refresh_quotes(symbols)
+    except Exception as e:
+        logger.warning("cache_warming: falha ao atualizar %s: %s", ", ".join(symbols[:5]), e)
+        r = await pricing._get_redis()
+        await r.zadd(DUE_KEY, {s: time.time() for s in symbols})
+        return 0
@@ -1,13 +1,16 @@
 from __future__ import annotations
-from typing import Optional, Sequence
-from sqlalchemy import select
+from datetime import date
+from typing import List, Optional, Sequence, Tuple
+from sqlalchemy import delete, func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload
-import models, schemas
+import http_cache, models, price_store, rollups, schemas
 
 async def create_client(session: AsyncSession, client_in: schemas.ClientCreate) -> models.Client:
     client = models.Client(name=client_in.name, email=client_in.email)
-    session.add(client); await session.commit(); await session.refresh(client); return client
+    session.add(client)
+    await rollups.adjust_clients(session, total=1, active=1 if client.is_active is not False else 0)
+    await session.commit(); await session.refresh(client); return client
 
 async def get_client(session: AsyncSession, client_id: int) -> Optional[models.Client]:
     res = await session.execute(select(models.Client).where(models.Client.id == client_id))
@@ -20,15 +23,35 @@ async def list_clients(session: AsyncSession, skip=0, limit=20, search: Optional
         q = q.where((models.Client.name.ilike(like)) | (models.Client.email.ilike(like)))
     if is_active is not None:
         q = q.where(models.Client.is_active == is_active)
-    q = q.order_by(models.Client.created_at.desc()).offset(skip).limit(limit)
+    # Desempate por id mantém a paginação estável e casa com ix_clients_created_at_id
+    q = q.order_by(models.Client.created_at.desc(), models.Client.id).offset(skip).limit(limit)
     return (await session.execute(q)).scalars().all()
 
 async def update_client(session: AsyncSession, client: models.Client, updates: schemas.ClientUpdate) -> models.Client:
+    was_active = client.is_active
     for f, v in updates.model_dump(exclude_unset=True).items(): setattr(client, f, v)
-    session.add(client); await session.commit(); await session.refresh(client); return client
+    if client.is_active != was_active:
+        await rollups.adjust_clients(session, active=1 if client.is_active else -1)
+    session.add(client); await session.commit(); await session.refresh(client)
+    await http_cache.bump(http_cache.client_key(client.id))
+    return client
 
-async def delete_client(session: AsyncSession, client: models.Client) -> None:
-    await session.delete(client); await session.commit()
+async def delete_client(session: AsyncSession, client_id: int) -> bool:
+    """Remove o cliente (e, pelo banco, suas alocações); False se não existir."""
+    a = models.Allocation
+    held = (await session.execute(
+        select(a.asset_id, func.sum(a.quantity)).where(a.client_id == client_id).group_by(a.asset_id)
+    )).all()
+    row = (await session.execute(
+        delete(models.Client).where(models.Client.id == client_id).returning(models.Client.is_active)
+    )).first()
+    if row is not None:
+        await rollups.adjust_clients(session, total=-1, active=-1 if row.is_active else 0)
+        await rollups.adjust_positions(session, {asset_id: -qty for asset_id, qty in held})
+    await session.commit()
+    if row is not None:
+        await http_cache.bump(http_cache.client_key(client_id))
+    return row is not None
 
 async def create_asset(session: AsyncSession, asset_in: schemas.AssetCreate) -> models.Asset:
     q = await session.execute(select(models.Asset).where(models.Asset.ticker == asset_in.ticker))
@@ -36,8 +59,11 @@ async def create_asset(session: AsyncSession, asset_in: schemas.AssetCreate) ->
     if ex:
         if asset_in.name and ex.name != asset_in.name:
             ex.name = asset_in.name; session.add(ex); await session.commit(); await session.refresh(ex)
+            await http_cache.bump(http_cache.asset_key(ex.id), http_cache.ASSETS_KEY)
         return ex
-    a = models.Asset(ticker=asset_in.ticker, name=asset_in.name); session.add(a); await session.commit(); await session.refresh(a); return a
+    a = models.Asset(ticker=asset_in.ticker, name=asset_in.name); session.add(a); await session.commit(); await session.refresh(a)
+    await http_cache.bump(http_cache.ASSETS_KEY)
+    return a
 
 async def list_assets(session: AsyncSession, skip=0, limit=100, search: Optional[str]=None) -> Sequence[models.Asset]:
     q = select(models.Asset)
@@ -50,32 +76,84 @@ async def get_asset(session: AsyncSession, asset_id: int) -> Optional[models.Ass
 
 async def update_asset(session: AsyncSession, asset: models.Asset, updates: schemas.AssetUpdate) -> models.Asset:
     for f, v in updates.model_dump(exclude_unset=True).items(): setattr(asset, f, v)
-    session.add(asset); await session.commit(); await session.refresh(asset); return asset
+    session.add(asset); await session.commit(); await session.refresh(asset)
+    await http_cache.bump(http_cache.asset_key(asset.id), http_cache.ASSETS_KEY)
+    return asset
 
-async def delete_asset(session: AsyncSession, asset: models.Asset) -> None:
-    await session.delete(asset); await session.commit()
+async def delete_asset(session: AsyncSession, asset_id: int) -> bool:
+    """Remove o ativo com alocações e histórico num único DELETE; False se não existir."""
+    res = await session.execute(delete(models.Asset).where(models.Asset.id == asset_id))
+    await session.commit()
+    if res.rowcount:
+        # As alocações removidas em cascata somem das carteiras pela versão do ativo
+        await http_cache.bump(http_cache.asset_key(asset_id), http_cache.ASSETS_KEY)
+    store = price_store.get_store()
+    if store is not None and res.rowcount:
+        store.invalidate(asset_id)
+    return res.rowcount > 0
 
 async def create_allocation(session: AsyncSession, allocation_in: schemas.AllocationCreate) -> models.Allocation:
-    a = models.Allocation(**allocation_in.model_dump()); session.add(a); await session.commit(); await session.refresh(a); return a
+    a = models.Allocation(**allocation_in.model_dump()); session.add(a)
+    await rollups.adjust_positions(session, {a.asset_id: a.quantity})
+    await session.commit(); await session.refresh(a)
+    await http_cache.bump(http_cache.client_key(a.client_id))
+    return a
 
 async def get_allocation(session: AsyncSession, allocation_id: int) -> Optional[models.Allocation]:
     return (await session.execute(select(models.Allocation).where(models.Allocation.id == allocation_id))).scalar_one_or_none()
 
 async def update_allocation(session: AsyncSession, allocation: models.Allocation, updates: schemas.AllocationUpdate) -> models.Allocation:
     # Permite atualizar asset_id (troca de ativo) e demais campos
+    before = (allocation.asset_id, allocation.quantity)
+    previous_client = allocation.client_id
     for f, v in updates.model_dump(exclude_unset=True).items():
         setattr(allocation, f, v)
-    session.add(allocation); await session.commit(); await session.refresh(allocation); return allocation
+    if (allocation.asset_id, allocation.quantity) != before:
+        deltas = {before[0]: -before[1]}
+        deltas[allocation.asset_id] = deltas.get(allocation.asset_id, 0) + allocation.quantity
+        await rollups.adjust_positions(session, deltas)
+    session.add(allocation); await session.commit(); await session.refresh(allocation)
+    await http_cache.bump(http_cache.client_key(previous_client), http_cache.client_key(allocation.client_id))
+    return allocation
 
-async def delete_allocation(session: AsyncSession, allocation: models.Allocation) -> None:
-    await session.delete(allocation); await session.commit()
+async def delete_allocation(session: AsyncSession, allocation_id: int) -> bool:
+    row = (await session.execute(
+        delete(models.Allocation).where(models.Allocation.id == allocation_id)
+        .returning(models.Allocation.client_id, models.Allocation.asset_id, models.Allocation.quantity)
+    )).first()
+    if row is not None:
+        await rollups.adjust_positions(session, {row.asset_id: -row.quantity})
+    await session.commit()
+    if row is not None:
+        await http_cache.bump(http_cache.client_key(row.client_id))
+    return row is not None
+
+async def get_last_close(session: AsyncSession, ticker: str) -> Optional[float]:
+    """Último fechamento gravado em `daily_returns` para o ticker (ou None)."""
+    q = (
+        select(models.DailyReturn.close_price)
+        .join(models.Asset, models.Asset.id == models.DailyReturn.asset_id)
+        .where(models.Asset.ticker == ticker)
+        .order_by(models.DailyReturn.date.desc())
+        .limit(1)
+    )
+    return (await session.execute(q)).scalar_one_or_none()
 
 async def list_allocations_for_client(session: AsyncSession, client_id: int):
     q = select(models.Allocation).options(joinedload(models.Allocation.asset)).where(models.Allocation.client_id == client_id)
     return (await session.execute(q)).scalars().all()
 
 # === Lógica de performance e rentabilidade ===
-async def compute_client_performance(session: AsyncSession, client_id: int) -> schemas.PerformanceOut:
+async def compute_client_performance(session: AsyncSession, client_id: int, start: Optional[date] = None, end: Optional[date] = None,
+                                     allocations: Optional[Sequence[models.Allocation]] = None) -> schemas.PerformanceOut:
+    """Curva de rentabilidade do cliente como `PerformanceOut` (ver `performance_series`)."""
+    dates, returns = await performance_series(session, client_id, start, end, allocations)
+    return schemas.PerformanceOut(client_id=client_id, points=[
+        schemas.PerformancePoint(date=d, cumulative_return=r) for d, r in zip(dates, returns)
+    ])
+
+async def performance_series(session: AsyncSession, client_id: int, start: Optional[date] = None, end: Optional[date] = None,
+                             allocations: Optional[Sequence[models.Allocation]] = None) -> Tuple[List[date], List[float]]:
     """Calcula a curva de rentabilidade diária acumulada de um cliente.
 
     A rentabilidade é calculada a partir da série de preços de fechamento armazenada
@@ -83,11 +161,18 @@ async def compute_client_performance(session: AsyncSession, client_id: int) -> s
     existe um fechamento registrado, calculamos o valor de mercado
     das alocações ativas naquele dia e comparamos com o valor de compra
     (custo). A rentabilidade é dada por (valorAtual - valorInicial) / valorInicial.
+
+    A série é limitada a `[start, end]` e nunca começa antes da primeira
+    compra, o que permite ao Postgres descartar as partições anuais fora da faixa.
+    `allocations` evita reler as alocações quando o chamador já as carregou.
+    Retorna listas paralelas de datas e retornos, sem um objeto por ponto,
+    para que a rota possa serializá-las direto (`fast_json`).
     """
     # Obtém alocações do cliente
-    allocations = await list_allocations_for_client(session, client_id)
+    if allocations is None:
+        allocations = await list_allocations_for_client(session, client_id)
     if not allocations:
-        return schemas.PerformanceOut(client_id=client_id, points=[])
+        return [], []
     # Map asset_id -> list of allocations (quantity, purchase_price)
     from collections import defaultdict
     alloc_map: dict[int, list[tuple[float, float, models.Allocation]]] = defaultdict(list)
@@ -97,22 +182,34 @@ async def compute_client_performance(session: AsyncSession, client_id: int) -> s
         total_initial_cost += alloc.quantity * alloc.purchase_price
     # Se custo total for zero, não é possível calcular retorno
     if total_initial_cost == 0:
-        return schemas.PerformanceOut(client_id=client_id, points=[])
-    # Coleta série de preços para todos os ativos alocados
+        return [], []
+    # Coleta série de preços para todos os ativos alocados. Só as colunas do
+    # índice ix_daily_returns_asset_date_desc são lidas (index-only scan); a
+    # ordenação por data é feita abaixo.
     asset_ids = list(alloc_map.keys())
-    rows = (await session.execute(
-        select(models.DailyReturn).where(models.DailyReturn.asset_id.in_(asset_ids)).order_by(models.DailyReturn.date)
-    )).scalars().all()
+    first_purchase = min(alloc.purchase_date for alloc in allocations)
+    lower = max(first_purchase, start or first_purchase)
+    store = price_store.get_store()
+    if store is not None:
+        return await _performance_from_store(session, store, alloc_map, total_initial_cost, lower, end)
+    q = (
+        select(models.DailyReturn.asset_id, models.DailyReturn.date, models.DailyReturn.close_price)
+        .where(models.DailyReturn.asset_id.in_(asset_ids), models.DailyReturn.date >= lower)
+    )
+    if end is not None:
+        q = q.where(models.DailyReturn.date <= end)
+    rows = (await session.execute(q)).all()
     if not rows:
-        return schemas.PerformanceOut(client_id=client_id, points=[])
+        return [], []
     # Organiza preços por data -> asset_id -> close_price
     from collections import defaultdict as dd
     prices_by_date: dict = dd(dict)
-    for dr in rows:
-        prices_by_date[dr.date][dr.asset_id] = dr.close_price
+    for asset_id, dt, close_price in rows:
+        prices_by_date[dt][asset_id] = close_price
     # Calcula retorno acumulado para cada data
-    points: list[schemas.PerformancePoint] = []
-    for dt in sorted(prices_by_date.keys()):
+    dates = sorted(prices_by_date.keys())
+    returns: list[float] = []
+    for dt in dates:
         total_value = 0.0
         # Soma valor de cada alocação ativa no dia
         for asset_id, positions in alloc_map.items():
@@ -126,6 +223,48 @@ async def compute_client_performance(session: AsyncSession, client_id: int) -> s
                     continue
                 total_value += qty * price
         # Calcula retorno
-        cumulative_return = (total_value - total_initial_cost) / total_initial_cost
-        points.append(schemas.PerformancePoint(date=dt, cumulative_return=cumulative_return))
-    return schemas.PerformanceOut(client_id=client_id, points=points)
+        returns.append((total_value - total_initial_cost) / total_initial_cost)
+    return dates, returns
+
+async def _performance_from_store(session: AsyncSession, store: "price_store.PriceStore", alloc_map: dict, total_initial_cost: float,
+                                  lower: date, end: Optional[date]) -> Tuple[List[date], List[float]]:
+    """Mesmo cálculo de `compute_client_performance`, vetorizado sobre o price_store.
+
+    O histórico encerrado vem das fatias mapeadas em memória; só os pregões
+    ainda não gravados nos arquivos (em geral o do dia) são lidos do banco.
+    """
+    np = price_store.np
+    series = {aid: store.series(aid, lower, end) for aid in alloc_map}
+    # Primeiro dia que cada ativo precisa buscar no banco
+    tail_from = {}
+    for aid in alloc_map:
+        last = store.last_date(aid)
+        tail_from[aid] = max(lower, date.fromordinal(last.toordinal() + 1)) if last else lower
+    pending = [aid for aid, d in tail_from.items() if end is None or d <= end]
+    if pending:
+        q = select(models.DailyReturn.asset_id, models.DailyReturn.date, models.DailyReturn.close_price).where(
+            models.DailyReturn.asset_id.in_(pending), models.DailyReturn.date >= min(tail_from[aid] for aid in pending)
+        )
+        if end is not None:
+            q = q.where(models.DailyReturn.date <= end)
+        tail: dict = {}
+        for aid, dt, close in (await session.execute(q)).all():
+            if dt >= tail_from[aid]:
+                tail.setdefault(aid, []).append((dt.toordinal(), close))
+        for aid, extra in tail.items():
+            extra.sort()
+            d, c = series[aid]
+            series[aid] = (np.concatenate([d, np.array([e[0] for e in extra], dtype=d.dtype)]),
+                           np.concatenate([c, np.array([e[1] for e in extra], dtype=c.dtype)]))
+    dates = np.unique(np.concatenate([d for d, _ in series.values()]))
+    if not len(dates):
+        return [], []
+    total_value = np.zeros(len(dates))
+    for aid, positions in alloc_map.items():
+        d, c = series[aid]
+        idx = np.searchsorted(dates, d)
+        for qty, purchase_price, alloc in positions:
+            active = d >= alloc.purchase_date.toordinal()
+            total_value[idx[active]] += qty * c[active]
+    cumulative = (total_value - total_initial_cost) / total_initial_cost
+    return [date.fromordinal(o) for o in dates.tolist()], cumulative.tolist()
@@ -1,13 +1,66 @@
 from __future__ import annotations
-import os
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+import logging, os, time
+from typing import Any, Dict
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
 
+logger = logging.getLogger("database")
+
 DATABASE_URL: str = os.environ.get(
     "DATABASE_URL", "postgresql+asyncpg://invest:investpw@db:5432/investdb"
 )
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
+# Réplica de leitura (opcional). Vazio = todas as leituras vão ao primário.
+READ_DATABASE_URL: str = os.environ.get("READ_DATABASE_URL", "")
+
+# Pool de conexões (por processo)
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "20"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Cache de prepared statements do asyncpg (por conexão)
+STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", "500"))
+# Atraso máximo tolerado da réplica (s) e intervalo entre verificações
+REPLICA_MAX_LAG = float(os.environ.get("DB_REPLICA_MAX_LAG", "5"))
+REPLICA_CHECK_INTERVAL = float(os.environ.get("DB_REPLICA_CHECK_INTERVAL", "5"))
+
+def _create_engine(url: str) -> AsyncEngine:
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite":
+        return create_async_engine(url, echo=False, future=True)
+    if u.get_driver_name() == "asyncpg" and "prepared_statement_cache_size" not in u.query:
+        u = u.update_query_dict({"prepared_statement_cache_size": str(STATEMENT_CACHE_SIZE)})
+    eng = create_async_engine(
+        u, echo=False, future=True,
+        pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_timeout=POOL_TIMEOUT,
+        pool_recycle=POOL_RECYCLE, pool_pre_ping=POOL_PRE_PING,
+    )
+    _track_pool(eng)
+    return eng
+
+# Pico de conexões em uso por engine, para as métricas de saturação
+_peak: Dict[int, int] = {}
+
+def _track_pool(eng: AsyncEngine) -> None:
+    pool = eng.sync_engine.pool
+    @event.listens_for(pool, "checkout")
+    def _on_checkout(*_: Any) -> None:
+        _peak[id(pool)] = max(_peak.get(id(pool), 0), pool.checkedout())
+
+# SQLite só aplica ON DELETE CASCADE com foreign_keys ligado (por conexão)
+@event.listens_for(Engine, "connect")
+def _sqlite_foreign_keys(dbapi_conn: Any, _: Any) -> None:
+    if "sqlite" in type(dbapi_conn).__module__:
+        cursor = dbapi_conn.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+engine = _create_engine(DATABASE_URL)
 async_session = async_sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+read_engine = _create_engine(READ_DATABASE_URL) if READ_DATABASE_URL else engine
+read_session = async_sessionmaker(read_engine, expire_on_commit=False, class_=AsyncSession)
 
 class Base(DeclarativeBase):
     pass
@@ -15,3 +68,67 @@ class Base(DeclarativeBase):
 async def get_session() -> AsyncSession:
     async with async_session() as session:  # type: ignore[call-arg]
         yield session
+
+# Estado da última verificação de atraso da réplica
+_replica: Dict[str, Any] = {"checked_at": 0.0, "lag": None, "healthy": True, "fallbacks": 0}
+
+async def replica_healthy() -> bool:
+    """Indica se a réplica está dentro de `REPLICA_MAX_LAG` segundos do primário.
+
+    O resultado fica em cache por `REPLICA_CHECK_INTERVAL`; falha na consulta
+    conta como réplica indisponível. Sem réplica configurada retorna False.
+    """
+    if read_engine is engine:
+        return False
+    now = time.monotonic()
+    if now - _replica["checked_at"] >= REPLICA_CHECK_INTERVAL:
+        _replica["checked_at"] = now
+        try:
+            async with read_engine.connect() as conn:
+                # Réplica em dia (tudo recebido já aplicado) tem atraso zero mesmo com o primário ocioso
+                lag = (await conn.execute(text(
+                    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                    "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                ))).scalar()
+            _replica["lag"] = float(lag or 0)
+            _replica["healthy"] = _replica["lag"] <= REPLICA_MAX_LAG
+        except Exception as e:
+            logger.warning("Réplica de leitura indisponível: %s", e)
+            _replica["lag"], _replica["healthy"] = None, False
+    return _replica["healthy"]
+
+async def get_read_session() -> AsyncSession:
+    """Sessão para rotas somente leitura (listagens, performance, exportações).
+
+    Usa a réplica quando configurada e em dia; caso contrário, o primário.
+    """
+    factory = read_session
+    if read_engine is not engine and not await replica_healthy():
+        _replica["fallbacks"] += 1
+        factory = async_session
+    async with factory() as session:  # type: ignore[call-arg]
+        yield session
+
+def _pool_stats(eng: AsyncEngine) -> Dict[str, Any]:
+    pool = eng.sync_engine.pool
+    if not hasattr(pool, "checkedout") or not hasattr(pool, "overflow"):
+        return {"pool": type(pool).__name__}
+    capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0)
+    return {
+        "pool": type(pool).__name__,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "capacity": capacity,
+        "saturation": round(pool.checkedout() / capacity, 3) if capacity else None,
+        "peak_checked_out": _peak.get(id(pool), 0),
+    }
+
+def pool_stats() -> Dict[str, Any]:
+    """Uso dos pools do primário e da réplica, com o estado da réplica."""
+    stats: Dict[str, Any] = {"primary": _pool_stats(engine)}
+    if read_engine is not engine:
+        stats["replica"] = {**_pool_stats(read_engine), "lag_seconds": _replica["lag"],
+                            "healthy": _replica["healthy"], "fallbacks": _replica["fallbacks"]}
+    return stats
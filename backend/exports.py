@@ -0,0 +1,557 @@
+from __future__ import annotations
+
+import asyncio
+import csv
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from collections.abc import AsyncIterator, Callable, Iterable, Iterator, Sequence
+from datetime import date, datetime
+from typing import (
+    Any,
+    BinaryIO,
+)
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import joinedload
+
+import crud
+import database
+import models
+import pricing
+
+try:  # armazenamento em objeto (S3/MinIO) é opcional
+    import boto3
+except ImportError:  # pragma: no cover - depende do ambiente
+    boto3 = None
+
+try:  # Parquet e Arrow IPC são opcionais (pyarrow)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depende do ambiente
+    pa = pq = None
+
+logger = logging.getLogger("exports")
+
+# Exportações assíncronas: `POST /api/exports` grava o job no Redis e enfileira
+# `backend.tasks.run_export`; o worker gera o arquivo em disco temporário,
+# publica no armazenamento configurado e atualiza o progresso no mesmo registro
+# (`export:{id}`), que a API lê em `GET /api/exports/{id}`. O web worker não
+# segura conexão com o banco nem memória enquanto o arquivo é montado.
+STORAGE = os.environ.get("EXPORT_STORAGE", "local").lower()  # local|s3
+EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join(tempfile.gettempdir(), "invest-exports"))
+S3_BUCKET = os.environ.get("EXPORT_S3_BUCKET", "")
+S3_PREFIX = os.environ.get("EXPORT_S3_PREFIX", "exports/")
+S3_ENDPOINT_URL = os.environ.get("EXPORT_S3_ENDPOINT_URL") or None
+TTL = int(float(os.environ.get("EXPORT_TTL_HOURS", "24")) * 3600)
+PAGE_SIZE = int(os.environ.get("EXPORT_PAGE_SIZE", "1000"))
+PROGRESS_INTERVAL = float(os.environ.get("EXPORT_PROGRESS_INTERVAL", "1"))
+BATCH_ROWS = int(os.environ.get("EXPORT_BATCH_ROWS", "65536"))  # linhas por RecordBatch/row group
+PARQUET_COMPRESSION = os.environ.get("EXPORT_PARQUET_COMPRESSION", "zstd")
+CHUNK_SIZE = 64 * 1024
+TASK_NAME = "backend.tasks.run_export"
+
+XLSX_MEDIA = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+FORMATS = {
+    "csv": "text/csv",
+    "xlsx": XLSX_MEDIA,
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+EXTENSIONS = {"csv": "csv", "xlsx": "xlsx", "parquet": "parquet", "arrow": "arrows"}
+ARROW_FORMATS = ("parquet", "arrow")  # exigem pyarrow
+KINDS = ("positions", "clients", "performance", "all_positions", "prices")
+CLIENT_KINDS = ("positions", "performance")  # exigem client_id
+
+POSITION_COLUMNS = ["asset_id", "ticker", "quantity", "purchase_price", "current_price", "profit_pct", "daily_change_pct"]
+COLUMNS = {
+    "positions": POSITION_COLUMNS,
+    "clients": ["id", "name", "email", "is_active", "created_at"],
+    "performance": ["date", "cumulative_return"],
+    "all_positions": ["client_id", "client_name", *POSITION_COLUMNS],
+    "prices": ["ticker", "date", "close"],
+}
+# Tipos das colunas em Parquet/Arrow; as demais são float64. O ticker vai
+# codificado em dicionário (índices int32 + valores distintos).
+COLUMN_TYPES = {
+    "asset_id": "int64", "client_id": "int64", "id": "int64",
+    "ticker": "dictionary", "client_name": "string", "name": "string", "email": "string",
+    "is_active": "bool", "created_at": "timestamp", "date": "date32",
+}
+
+def available(format: str) -> bool:
+    return format not in ARROW_FORMATS or pa is not None
+
+# === Armazenamento dos arquivos ===
+class LocalStorage:
+    """Arquivos em `root`; a API serve o download com suporte a Range."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, os.path.basename(key))
+
+    def save(self, key: str, src: str) -> int:
+        os.makedirs(self.root, exist_ok=True)
+        dest = self.path(key)
+        shutil.move(src, dest)
+        return os.path.getsize(dest)
+
+    def size(self, key: str) -> int | None:
+        try:
+            return os.path.getsize(self.path(key))
+        except OSError:
+            return None
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self.path(key), "rb")
+
+    def url(self, key: str) -> str | None:
+        return None
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def purge(self, max_age: float) -> int:
+        """Remove arquivos mais antigos que `max_age` segundos (o job já expirou no Redis)."""
+        limit, removed = time.time() - max_age, 0
+        try:
+            names = os.listdir(self.root)
+        except OSError:
+            return 0
+        for name in names:
+            p = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(p) < limit:
+                    os.remove(p)
+                    removed += 1
+            except OSError:
+                continue
+        return removed
+
+class S3Storage:
+    """Bucket S3 (ou compatível, ex.: MinIO); o download é redirecionado a uma URL assinada.
+
+    O próprio S3 atende requisições Range. A expiração dos arquivos fica a
+    cargo de uma regra de ciclo de vida no bucket.
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str | None = None):
+        if boto3 is None:
+            raise RuntimeError("boto3 não instalado; necessário para EXPORT_STORAGE=s3")
+        self.bucket, self.prefix = bucket, prefix
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    def save(self, key: str, src: str) -> int:
+        size = os.path.getsize(src)
+        self.client.upload_file(src, self.bucket, self._key(key))
+        os.remove(src)
+        return size
+
+    def size(self, key: str) -> int | None:
+        try:
+            return int(self.client.head_object(Bucket=self.bucket, Key=self._key(key))["ContentLength"])
+        except Exception:
+            return None
+
+    def open(self, key: str) -> BinaryIO:
+        return self.client.get_object(Bucket=self.bucket, Key=self._key(key))["Body"]
+
+    def url(self, key: str) -> str | None:
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self._key(key)}, ExpiresIn=min(TTL, 7 * 24 * 3600))
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def purge(self, max_age: float) -> int:
+        return 0
+
+_storage: Any = None
+
+def get_storage() -> Any:
+    """Backend configurado em EXPORT_STORAGE (`local` em EXPORT_DIR ou `s3`)."""
+    global _storage
+    if _storage is None:
+        _storage = S3Storage(S3_BUCKET, S3_PREFIX, S3_ENDPOINT_URL) if STORAGE == "s3" else LocalStorage(EXPORT_DIR)
+    return _storage
+
+# === Registro dos jobs (Redis) ===
+def _job_key(job_id: str) -> str:
+    return f"export:{job_id}"
+
+async def get_job(job_id: str) -> dict[str, Any] | None:
+    r = await pricing._get_redis()
+    raw = await r.get(_job_key(job_id))
+    return json.loads(raw) if raw else None
+
+async def _save(job: dict[str, Any]) -> None:
+    r = await pricing._get_redis()
+    await r.set(_job_key(job["id"]), json.dumps(job), ex=TTL)
+
+async def create_job(kind: str, format: str, owner: str, client_id: int | None = None,
+                     start: date | None = None, end: date | None = None, tickers: list[str] | None = None) -> dict[str, Any]:
+    """Registra um job `queued` (ver `submit`).
+
+    `start`/`end` limitam performance e histórico de preços; `tickers`
+    restringe o histórico de preços (padrão: todos os ativos).
+    """
+    job_id = uuid.uuid4().hex
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    name = f"{kind}-{client_id}" if client_id is not None else kind
+    job = {
+        "id": job_id, "kind": kind, "format": format, "client_id": client_id, "owner": owner,
+        "status": "queued", "progress": 0.0, "rows": 0, "total": None, "size": None, "error": None,
+        "start": start.isoformat() if start else None, "end": end.isoformat() if end else None,
+        "tickers": [t.upper() for t in tickers] if tickers else None,
+        "filename": f"{name}-{stamp}.{EXTENSIONS[format]}", "key": f"{job_id}.{EXTENSIONS[format]}",
+        "created_at": datetime.utcnow().isoformat(), "finished_at": None,
+    }
+    await _save(job)
+    return job
+
+_celery: Any = None
+
+def enqueue(job_id: str) -> None:
+    """Envia o job ao worker pelo nome da task, sem importar `tasks` na API."""
+    global _celery
+    if _celery is None:
+        from celery import Celery
+        _celery = Celery("exports", broker=pricing.REDIS_URL)
+    _celery.send_task(TASK_NAME, args=[job_id])
+
+async def submit(kind: str, format: str, owner: str, client_id: int | None = None, **options: Any) -> dict[str, Any]:
+    """Cria e enfileira o job; se a fila recusar, o job fica `failed` e o erro propaga."""
+    job = await create_job(kind, format, owner, client_id, **options)
+    try:
+        await asyncio.to_thread(enqueue, job["id"])
+    except Exception as e:
+        job.update(status="failed", error=f"fila indisponível: {e}", finished_at=datetime.utcnow().isoformat())
+        await _save(job)
+        raise
+    return job
+
+# === Fontes de linhas ===
+class _Quotes:
+    """Preço atual e fechamento anterior por ticker, memorizados durante o job.
+
+    Lê o cache do `price_feed` em lote e só consulta o Yahoo para os tickers
+    que não estão lá.
+    """
+
+    def __init__(self) -> None:
+        self.known: dict[str, tuple[float | None, float | None]] = {}
+
+    async def load(self, tickers: Sequence[str]) -> None:
+        missing = sorted({t.upper() for t in tickers if t} - self.known.keys())
+        if not missing:
+            return
+        try:
+            cached = await pricing.get_cached_quotes(missing)
+        except Exception:
+            cached = {}
+        for t in missing:
+            q = cached.get(t)
+            if q is not None and q["previous_close"] is not None:
+                self.known[t] = (q["price"], q["previous_close"])
+                continue
+            try:
+                cur = await pricing.get_current_price(t)
+            except Exception:
+                cur = None
+            try:
+                prev = await pricing.get_previous_close(t)
+            except Exception:
+                prev = None
+            self.known[t] = (cur, prev)
+
+    def get(self, ticker: str) -> tuple[float | None, float | None]:
+        return self.known.get(ticker.upper(), (None, None))
+
+def position_row(a: models.Allocation, cur: float | None, prev: float | None) -> list[Any]:
+    """Linha de posição; sem preço atual (ex.: rate-limit) o lucro usa o fechamento anterior."""
+    eff_current = cur if cur is not None else prev
+    profit = ((eff_current - a.purchase_price) / a.purchase_price) if eff_current is not None and a.purchase_price else None
+    daily = (eff_current - prev) / prev if prev and eff_current is not None else None
+    return [a.asset_id, a.asset.ticker if a.asset else "", a.quantity, a.purchase_price, cur, profit, daily]
+
+Source = tuple[int, AsyncIterator[list[Any]]]
+
+async def _positions(session: Any, job: dict[str, Any]) -> Source:
+    allocations = await crud.list_allocations_for_client(session, job["client_id"])
+    async def rows() -> AsyncIterator[list[Any]]:
+        quotes = _Quotes()
+        await quotes.load([a.asset.ticker for a in allocations if a.asset])
+        for a in allocations:
+            yield position_row(a, *quotes.get(a.asset.ticker if a.asset else ""))
+    return len(allocations), rows()
+
+async def _clients(session: Any, job: dict[str, Any]) -> Source:
+    total = (await session.execute(select(func.count()).select_from(models.Client))).scalar_one()
+    async def rows() -> AsyncIterator[list[Any]]:
+        last = 0
+        while True:  # paginação por chave: cada página é uma consulta curta pelo PK
+            page = (await session.execute(
+                select(models.Client).where(models.Client.id > last).order_by(models.Client.id).limit(PAGE_SIZE))).scalars().all()
+            if not page:
+                return
+            for c in page:
+                yield [c.id, c.name, c.email, c.is_active, c.created_at]
+            last = page[-1].id
+    return total, rows()
+
+def _period(job: dict[str, Any]) -> tuple[date | None, date | None]:
+    start, end = job.get("start"), job.get("end")
+    return (date.fromisoformat(start) if start else None, date.fromisoformat(end) if end else None)
+
+async def _performance(session: Any, job: dict[str, Any]) -> Source:
+    dates, returns = await crud.performance_series(session, job["client_id"], *_period(job))
+    async def rows() -> AsyncIterator[list[Any]]:
+        for d, r in zip(dates, returns):
+            yield [d, r]
+    return len(dates), rows()
+
+async def _prices(session: Any, job: dict[str, Any]) -> Source:
+    """Fechamentos por ativo em ordem de ticker e data (índice asset_id, date)."""
+    start, end = _period(job)
+    q = select(models.Asset.id, models.Asset.ticker).order_by(models.Asset.ticker)
+    if job.get("tickers"):
+        q = q.where(models.Asset.ticker.in_(job["tickers"]))
+    assets = (await session.execute(q)).all()
+    period = []
+    if start:
+        period.append(models.DailyReturn.date >= start)
+    if end:
+        period.append(models.DailyReturn.date <= end)
+    count = select(func.count()).select_from(models.DailyReturn).where(*period)
+    if job.get("tickers"):
+        count = count.where(models.DailyReturn.asset_id.in_([a.id for a in assets]))
+    total = (await session.execute(count)).scalar_one() if assets else 0
+    async def rows() -> AsyncIterator[list[Any]]:
+        for asset_id, ticker in assets:
+            closes = await session.execute(
+                select(models.DailyReturn.date, models.DailyReturn.close_price)
+                .where(models.DailyReturn.asset_id == asset_id, *period).order_by(models.DailyReturn.date))
+            for d, close in closes:
+                yield [ticker, d, close]
+    return total, rows()
+
+async def _all_positions(session: Any, job: dict[str, Any]) -> Source:
+    total = (await session.execute(select(func.count()).select_from(models.Allocation))).scalar_one()
+    async def rows() -> AsyncIterator[list[Any]]:
+        quotes, last = _Quotes(), 0
+        while True:
+            page = (await session.execute(
+                select(models.Allocation).options(joinedload(models.Allocation.asset), joinedload(models.Allocation.client))
+                .where(models.Allocation.id > last).order_by(models.Allocation.id).limit(PAGE_SIZE))).scalars().all()
+            if not page:
+                return
+            await quotes.load([a.asset.ticker for a in page if a.asset])
+            for a in page:
+                yield [a.client_id, a.client.name if a.client else "", *position_row(a, *quotes.get(a.asset.ticker if a.asset else ""))]
+            last = page[-1].id
+    return total, rows()
+
+SOURCES: dict[str, Callable[[Any, dict[str, Any]], Any]] = {
+    "positions": _positions,
+    "clients": _clients,
+    "performance": _performance,
+    "all_positions": _all_positions,
+    "prices": _prices,
+}
+
+# === Escrita do arquivo ===
+class _CsvWriter:
+    def __init__(self, path: str, columns: list[str], kind: str):
+        self.f = open(path, "w", newline="", encoding="utf-8")
+        self.w = csv.writer(self.f)
+        self.w.writerow(columns)
+
+    def append(self, row: list[Any]) -> None:
+        self.w.writerow([v.isoformat() if isinstance(v, datetime) else v for v in row])
+
+    def close(self) -> None:
+        self.f.close()
+
+class _XlsxWriter:
+    """Planilha em modo write_only: as linhas vão para disco, não ficam em memória."""
+
+    def __init__(self, path: str, columns: list[str], kind: str):
+        from openpyxl import Workbook
+        self.path = path
+        self.wb = Workbook(write_only=True)
+        self.ws = self.wb.create_sheet(kind)
+        self.ws.append(columns)
+
+    def append(self, row: list[Any]) -> None:
+        self.ws.append(row)
+
+    def close(self) -> None:
+        self.wb.save(self.path)
+
+def arrow_schema(columns: list[str]) -> Any:
+    types = {
+        "int64": pa.int64(), "string": pa.string(), "bool": pa.bool_(), "date32": pa.date32(),
+        "timestamp": pa.timestamp("us"), "dictionary": pa.dictionary(pa.int32(), pa.string()),
+    }
+    return pa.schema([pa.field(c, types.get(COLUMN_TYPES.get(c, ""), pa.float64())) for c in columns])
+
+class _ArrowWriter:
+    """Base dos formatos colunares: acumula até BATCH_ROWS linhas e grava cada
+    lote como um RecordBatch tipado, sem passar por texto."""
+
+    def __init__(self, sink: Any, columns: list[str], kind: str):
+        if pa is None:
+            raise RuntimeError("pyarrow não instalado: Parquet/Arrow indisponível")
+        self.schema = arrow_schema(columns)
+        self.rows: list[list[Any]] = []
+        self.writer = self._open(sink)
+
+    def append(self, row: list[Any]) -> None:
+        self.rows.append(row)
+        if len(self.rows) >= BATCH_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.rows:
+            return
+        arrays = []
+        for values, field in zip(zip(*self.rows), self.schema):
+            if pa.types.is_dictionary(field.type):
+                arrays.append(pa.array(values, type=field.type.value_type).dictionary_encode())
+            else:
+                arrays.append(pa.array(values, type=field.type))
+        self.rows = []
+        self._write(pa.RecordBatch.from_arrays(arrays, schema=self.schema))
+
+    def close(self) -> None:
+        self.flush()
+        self.writer.close()
+
+class _ParquetWriter(_ArrowWriter):
+    """Um row group por lote, comprimido com EXPORT_PARQUET_COMPRESSION."""
+
+    def _open(self, sink: Any) -> Any:
+        return pq.ParquetWriter(sink, self.schema, compression=PARQUET_COMPRESSION)
+
+    def _write(self, batch: Any) -> None:
+        self.writer.write_table(pa.Table.from_batches([batch]))
+
+class _ArrowStreamWriter(_ArrowWriter):
+    """Formato de stream do Arrow IPC (`.arrows`), lido por `pyarrow.ipc.open_stream`."""
+
+    def _open(self, sink: Any) -> Any:
+        return pa.ipc.new_stream(sink, self.schema)
+
+    def _write(self, batch: Any) -> None:
+        self.writer.write_batch(batch)
+
+WRITERS = {"csv": _CsvWriter, "xlsx": _XlsxWriter, "parquet": _ParquetWriter, "arrow": _ArrowStreamWriter}
+
+def encode(kind: str, format: str, rows: Iterable[Sequence[Any]]) -> bytes:
+    """Arquivo Parquet/Arrow em memória, para exportações pequenas feitas na própria requisição."""
+    sink = pa.BufferOutputStream()
+    writer = WRITERS[format](sink, COLUMNS[kind], kind)
+    for row in rows:
+        writer.append(list(row))
+    writer.close()
+    return sink.getvalue().to_pybytes()
+
+async def run_job(job_id: str, session_factory: Callable[[], Any] | None = None) -> dict[str, Any] | None:
+    """Gera o arquivo do job e publica no armazenamento, atualizando o progresso.
+
+    O progresso é gravado no Redis no máximo a cada PROGRESS_INTERVAL segundos.
+    Falhas ficam no registro (`status=failed`, `error`) em vez de propagar.
+    """
+    job = await get_job(job_id)
+    if job is None:
+        logger.warning("Exportação %s expirou antes de ser processada", job_id)
+        return None
+    job.update(status="running", started_at=datetime.utcnow().isoformat())
+    await _save(job)
+    storage = get_storage()
+    fd, tmp = tempfile.mkstemp(suffix="." + EXTENSIONS[job["format"]])
+    os.close(fd)
+    try:
+        async with (session_factory or database.async_session)() as session:
+            total, rows = await SOURCES[job["kind"]](session, job)
+            job["total"] = total
+            writer = WRITERS[job["format"]](tmp, COLUMNS[job["kind"]], job["kind"])
+            try:
+                n, last_save = 0, time.monotonic()
+                async for row in rows:
+                    writer.append(row)
+                    n += 1
+                    if time.monotonic() - last_save >= PROGRESS_INTERVAL:
+                        job.update(rows=n, progress=round(min(n / total, 0.99), 4) if total else 0.0)
+                        await _save(job)
+                        last_save = time.monotonic()
+            finally:
+                await asyncio.to_thread(writer.close)
+        job["size"] = await asyncio.to_thread(storage.save, job["key"], tmp)
+        job.update(status="done", rows=n, progress=1.0)
+    except Exception as e:
+        logger.exception("Falha na exportação %s", job_id)
+        job.update(status="failed", error=str(e) or type(e).__name__)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    job["finished_at"] = datetime.utcnow().isoformat()
+    await _save(job)
+    storage.purge(TTL)
+    return job
+
+# === Download com Range ===
+def parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """Intervalo (início, fim inclusivo) de um cabeçalho `Range: bytes=...`.
+
+    Retorna None quando o arquivo deve ir inteiro (sem cabeçalho, unidade
+    desconhecida ou vários intervalos) e levanta ValueError quando o intervalo
+    não pode ser atendido (416).
+    """
+    if not header:
+        return None
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        raise ValueError(header)
+    try:
+        if first == "":  # sufixo: últimos N bytes
+            n = int(last)
+            if n <= 0 or size == 0:
+                raise ValueError(header)
+            return max(0, size - n), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        raise ValueError(header)
+    if start < 0 or start >= size or end < start:
+        raise ValueError(header)
+    return start, min(end, size - 1)
+
+def iter_file(f: BinaryIO, start: int, end: int) -> Iterator[bytes]:
+    """Bytes de `start` a `end` (inclusivo) em blocos de CHUNK_SIZE; fecha o arquivo ao final."""
+    try:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
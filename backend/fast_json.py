@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+try:  # orjson é opcional: sem ele o caminho rápido usa o json da biblioteca padrão
+    import orjson
+except ImportError:  # pragma: no cover - depende do ambiente
+    orjson = None
+
+# Serialização direta para resultados internos confiáveis (listas, dicts,
+# datas, floats), sem o `response_model` validar e o `jsonable_encoder`
+# percorrer cada ponto de novo. A saída é a mesma do JSONResponse do FastAPI
+# (JSON compacto, UTF-8, datas em ISO 8601). Modelos Pydantic ainda são aceitos,
+# mas passam por `model_dump`; o ganho está em montar o conteúdo sem eles.
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    if isinstance(obj, date | datetime):
+        return obj.isoformat()
+    if hasattr(obj, "tolist"):  # arrays e escalares numpy
+        return obj.tolist()
+    raise TypeError(f"Tipo não serializável: {type(obj).__name__}")
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    def dumps(content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=_OPTIONS)
+else:  # pragma: no cover - depende do ambiente
+    def dumps(content: Any) -> bytes:
+        return json.dumps(content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+class FastJSONResponse(JSONResponse):
+    """`JSONResponse` que serializa com `dumps`; use com conteúdo já pronto."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import uuid
+from collections.abc import Awaitable, Callable, Iterable
+from datetime import date
+from typing import Any
+
+from fastapi import Request, Response
+
+import database
+import fast_json
+import pricing
+
+logger = logging.getLogger("http_cache")
+
+# GET condicional e cache compartilhado das rotas de leitura mais consultadas.
+# Cada resposta depende de contadores de versão no Redis:
+#   ver:client:{id}     cliente e suas alocações (mutadores do crud, importação em lote)
+#   ver:asset:{id}      cadastro e histórico de fechamentos do ativo
+#   ver:quote:{TICKER}  cotação atual (refresh_quotes)
+#   ver:assets          lista de ativos
+# O ETag é um hash das versões de que a resposta depende e o corpo serializado
+# fica em `http:{rota}` junto com essas versões. Uma requisição repetida custa
+# um GET e um MGET no Redis: 304 se o navegador já tem o ETag, o corpo em cache
+# caso contrário, sem consultas ao banco nem serialização. Sem Redis, as rotas
+# respondem normalmente, sem ETag.
+ENABLED = os.environ.get("HTTP_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+TTL = int(os.environ.get("HTTP_CACHE_TTL", "300"))
+CACHE_CONTROL = "private, no-cache"  # o navegador guarda, mas sempre revalida
+ASSETS_KEY = "ver:assets"
+# Época das versões: se o Redis perder os contadores, eles recomeçam do zero e
+# ETags antigos não podem voltar a valer
+_EPOCH_KEY = "ver:epoch"
+
+def client_key(client_id: int) -> str:
+    return f"ver:client:{client_id}"
+
+def asset_key(asset_id: int) -> str:
+    return f"ver:asset:{asset_id}"
+
+def quote_key(ticker: str) -> str:
+    return f"ver:quote:{ticker.upper()}"
+
+async def bump(*keys: str) -> None:
+    """Invalida as respostas que dependem de `keys` (INCR de cada contador)."""
+    keys = tuple(dict.fromkeys(keys))
+    if not keys or not ENABLED:
+        return
+    try:
+        r = await pricing._get_redis()
+        async with r.pipeline(transaction=False) as pipe:
+            for k in keys:
+                pipe.incr(k)
+            await pipe.execute()
+    except Exception as e:
+        logger.warning("Falha ao invalidar versões %s: %s", ", ".join(keys[:5]), e)
+
+async def get_cache_session() -> Any:
+    """Sessão das rotas servidas por `cached_response`.
+
+    Com o cache ligado, o corpo é montado no primário: ele fica guardado sob
+    as versões atuais e uma réplica atrasada gravaria dados antigos nelas (os
+    acertos nem chegam ao banco). Com o cache desligado, a rota é uma leitura
+    comum e vai para a réplica, como as demais (`get_read_session`).
+    """
+    source = database.get_session if ENABLED else database.get_read_session
+    async for session in source():
+        yield session
+
+async def on_history(affected: dict[int, date]) -> None:
+    """Listener de `price_import.history_listeners`: fechamentos novos ou corrigidos."""
+    await bump(*(asset_key(a) for a in affected))
+
+async def _versions(r: Any, keys: list[str]) -> list[str]:
+    values = await r.mget(keys) if keys else []
+    if keys and keys[0] == _EPOCH_KEY and values[0] is None:
+        await r.set(_EPOCH_KEY, uuid.uuid4().hex, nx=True)
+        values[0] = await r.get(_EPOCH_KEY)
+    return [v or "0" for v in values]
+
+def _etag(key: str, deps: list[str], versions: list[str]) -> str:
+    digest = hashlib.sha1("|".join([key, *(f"{d}={v}" for d, v in zip(deps, versions))]).encode()).hexdigest()
+    return f'"{digest[:24]}"'
+
+def _respond(request: Request, body: bytes, etag: str | None = None) -> Response:
+    if etag is None:
+        return Response(body, media_type="application/json")
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    match = request.headers.get("if-none-match", "")
+    if match.strip() == "*" or etag in (t.strip() for t in match.split(",")):
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+Build = Callable[[], Awaitable[tuple[Any, Iterable[str]]]]
+
+async def cached_response(request: Request, deps: Iterable[str], build: Build) -> Response:
+    """Responde com ETag por versões, 304 e corpo compartilhado entre workers.
+
+    `deps` são as versões conhecidas antes de montar a resposta (lidas antes
+    do banco, então uma alteração concorrente invalida o que for gravado).
+    `build()` devolve o conteúdo e as versões descobertas ao montá-lo, como os
+    ativos da carteira; exceções (ex.: 404) passam adiante sem cache. O
+    conteúdo é serializado por `fast_json`, sem passar pelo `response_model`.
+    `build()` deve ler do primário (`get_cache_session`): uma réplica atrasada
+    montaria o corpo antigo e ele ficaria em cache sob as versões novas.
+    """
+    if not ENABLED:
+        content, _ = await build()
+        return _respond(request, fast_json.dumps(content))
+    key = "http:" + request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    deps = [_EPOCH_KEY, *deps]
+    r, before = None, None
+    try:
+        r = await pricing._get_redis()
+        raw = await r.get(key)
+        if raw:
+            entry = json.loads(raw)
+            if await _versions(r, entry["deps"]) == entry["versions"]:
+                return _respond(request, entry["body"].encode(), entry["etag"])
+        before = await _versions(r, deps)
+    except Exception as e:
+        logger.warning("Cache de respostas indisponível: %s", e)
+    content, extra = await build()
+    body = fast_json.dumps(content)
+    if r is None or before is None:
+        return _respond(request, body)
+    extra = [k for k in dict.fromkeys(extra) if k not in deps]
+    try:
+        versions = before + await _versions(r, extra)
+        deps += extra
+        etag = _etag(key, deps, versions)
+        await r.set(key, json.dumps({"deps": deps, "versions": versions, "etag": etag, "body": body.decode()}), ex=TTL)
+    except Exception as e:
+        logger.warning("Falha ao gravar resposta em cache: %s", e)
+        return _respond(request, body)
+    return _respond(request, body, etag)
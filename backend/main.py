@@ -1,6 +1,6 @@
 from __future__ import annotations
 import uvicorn
-from fastapi import FastAPI, WebSocket
+from fastapi import Depends, FastAPI, Response, WebSocket
 import sys
 import os
 
@@ -8,17 +8,24 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from api import create_app
-from websocket import price_stream, dashboard_price_stream
+from websocket import manager, multiplexed_stream, price_stream, dashboard_price_stream
+from auth import admin_required
+from database import pool_stats
+import metrics
+from schemas import User
 
 app: FastAPI = create_app()
 
 @app.websocket("/ws/prices/{symbol}")
 async def ws_prices(websocket: WebSocket, symbol: str) -> None:
-    """WebSocket que transmite preços periódicos de um ticker específico.
+    """WebSocket que transmite os preços de um ticker específico.
 
     Para iniciar uma assinatura, conecte‑se a `/ws/prices/{symbol}` onde
-    `symbol` é o ticker do ativo (ex.: AAPL). A cada 5 segundos será
-    enviado um JSON contendo o ticker, o preço atual e um timestamp.
+    `symbol` é o ticker do ativo (ex.: AAPL). Sempre que o `PriceFeed`
+    compartilhado traz uma cotação nova é enviado um JSON contendo o
+    ticker, o preço atual e um timestamp.
+    Clientes podem negociar `msgpack` ou `columnar` via subprotocolo ou
+    `?encoding=` (ver `ws_encoding`).
     """
     await price_stream(websocket, symbol)
 
@@ -26,10 +33,47 @@ async def ws_prices(websocket: WebSocket, symbol: str) -> None:
 async def ws_dashboard(websocket: WebSocket) -> None:
     """WebSocket que transmite preços de múltiplos símbolos para o dashboard.
     
-    Conecte-se a `/ws/dashboard` para receber atualizações de preços
-    de vários ativos a cada 5 segundos.
+    Conecte-se a `/ws/dashboard` e envie `{"action": "subscribe", "symbols": [...]}`
+    para receber um snapshot inicial e, a cada atualização do `PriceFeed`,
+    apenas os campos alterados (`delta`) com número de sequência para
+    detecção de lacunas.
     """
     await dashboard_price_stream(websocket)
 
+@app.websocket("/ws/stream")
+async def ws_stream(websocket: WebSocket) -> None:
+    """WebSocket multiplexado: um socket para todos os tickers da página.
+
+    Envie `{"action": "subscribe", "channel": "prices", "symbols": [...]}`;
+    as cotações chegam em frames `batch` marcados com o canal, agrupando os
+    ticks de cada janela de `WS_STREAM_BATCH_MS`.
+    """
+    await multiplexed_stream(websocket)
+
+@app.get("/ws/stats", tags=["websocket"])
+async def ws_stats(_: User = Depends(admin_required)) -> dict:
+    """Estatísticas dos WebSockets deste processo (somente admin).
+
+    Retorna o número de conexões, assinantes por ticker, profundidade das
+    filas de envio e contadores de mensagens e desconexões forçadas.
+    """
+    return manager.snapshot_stats()
+
+@app.get("/db/stats", tags=["database"])
+async def db_stats(_: User = Depends(admin_required)) -> dict:
+    """Uso dos pools de conexão deste processo (somente admin).
+
+    Para o primário e a réplica: conexões em uso, ociosas, overflow,
+    saturação (em uso / capacidade) e pico; para a réplica, também o
+    atraso medido e quantas leituras caíram para o primário.
+    """
+    return pool_stats()
+
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics() -> Response:
+    """Métricas no formato de exposição do Prometheus (ver `metrics`)."""
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE_LATEST)
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    # permessage-deflate é negociado pelo servidor quando o cliente oferece a extensão
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, ws="websockets", ws_per_message_deflate=True)
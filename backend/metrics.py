@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections.abc import Callable, Iterable
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+try:  # prometheus_client é opcional: sem ele as métricas viram no-op
+    from prometheus_client import (
+        CONTENT_TYPE_LATEST,
+        REGISTRY,
+        CollectorRegistry,
+        Counter,
+        Gauge,
+        Histogram,
+        generate_latest,
+    )
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+except ImportError:  # pragma: no cover - depende do ambiente
+    Counter = Gauge = Histogram = None  # type: ignore[assignment]
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger("metrics")
+
+# Métricas Prometheus do processo (API, pricing, WebSocket, banco e Celery).
+# Cada ponto de medição custa um `perf_counter` e uma atualização em memória;
+# valores que já existem em outros módulos (pools, WebSockets) só são lidos
+# no momento da coleta.
+ENABLED = Counter is not None and os.environ.get("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+class _Noop:
+    def labels(self, *_: Any, **__: Any) -> _Noop: return self
+    def inc(self, *_: Any) -> None: pass
+    def dec(self, *_: Any) -> None: pass
+    def set(self, *_: Any) -> None: pass
+    def observe(self, *_: Any) -> None: pass
+
+def _metric(kind: Any, name: str, doc: str, labels: Iterable[str] = (), **kw: Any) -> Any:
+    if not ENABLED:
+        return _Noop()
+    try:
+        return kind(name, doc, list(labels), **kw)
+    except ValueError:  # módulo carregado duas vezes (`metrics` e `backend.metrics` no Celery)
+        return REGISTRY._names_to_collectors[name]
+
+_LATENCY = (.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+HTTP_LATENCY = _metric(Histogram, "http_request_duration_seconds", "Latência das rotas HTTP", ("method", "route", "status"), buckets=_LATENCY)
+HTTP_IN_PROGRESS = _metric(Gauge, "http_requests_in_progress", "Requisições HTTP em andamento", ("method",))
+
+YAHOO_REQUESTS = _metric(Counter, "yahoo_requests_total", "Chamadas ao Yahoo Finance", ("endpoint", "status"))
+YAHOO_LATENCY = _metric(Histogram, "yahoo_request_duration_seconds", "Latência das chamadas ao Yahoo Finance", ("endpoint",), buckets=_LATENCY)
+YAHOO_THROTTLE_WAIT = _metric(Histogram, "yahoo_throttle_wait_seconds", "Espera imposta por _throttle antes de chamar o Yahoo", buckets=(0, .1, .5, 1, 2, 5))
+BREAKER_OPEN = _metric(Gauge, "yahoo_circuit_breaker_open", "1 quando o circuit breaker do Yahoo está aberto")
+SEARCH_REQUESTS = _metric(Counter, "asset_search_requests_total", "Buscas de ativos por origem da resposta", ("source",))  # index|cache|upstream|error
+CACHE_REQUESTS = _metric(Counter, "price_cache_requests_total", "Leituras do cache de preços por camada", ("tier", "result"))
+
+DB_QUERY_LATENCY = _metric(Histogram, "db_query_duration_seconds", "Tempo das consultas SQL", ("operation",), buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 5))
+
+TASK_LATENCY = _metric(Histogram, "celery_task_duration_seconds", "Duração das tasks Celery", ("task", "state"), buckets=(.1, .5, 1, 5, 15, 60, 300, 900))
+DAILY_RETURNS_ROWS = _metric(Counter, "update_daily_returns_rows_total", "Fechamentos gravados por update_daily_returns")
+
+def cache_lookup(tier: str, value: Any) -> Any:
+    """Conta hit/miss de uma camada do cache e devolve o próprio valor."""
+    CACHE_REQUESTS.labels(tier, "hit" if value else "miss").inc()
+    return value
+
+# --- HTTP ---------------------------------------------------------------------------
+
+def _route_template(scope: dict[str, Any]) -> str:
+    """Caminho declarado da rota (ex.: /api/clients/{client_id}), sem ids na label."""
+    from starlette.routing import Match
+    app = scope.get("app")
+    for route in getattr(getattr(app, "router", None), "routes", ()):
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
+
+class MetricsMiddleware:
+    """Middleware ASGI puro que mede a latência por método, rota e status."""
+
+    def __init__(self, app: Callable) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        status = {"code": 500}
+        async def _send(message: dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+        method = scope["method"]
+        HTTP_IN_PROGRESS.labels(method).inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            HTTP_IN_PROGRESS.labels(method).dec()
+            HTTP_LATENCY.labels(method, _route_template(scope), str(status["code"])).observe(time.perf_counter() - started)
+
+# --- Banco --------------------------------------------------------------------------
+
+if ENABLED and not getattr(Engine, "_metrics_hooked", False):
+    Engine._metrics_hooked = True  # type: ignore[attr-defined]
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before_query(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        conn.info.setdefault("_metrics_started", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after_query(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        started = conn.info.get("_metrics_started")
+        if started:
+            op = statement.lstrip()[:6].upper()
+            DB_QUERY_LATENCY.labels(op if op in ("SELECT", "INSERT", "UPDATE", "DELETE") else "OTHER").observe(time.perf_counter() - started.pop())
+
+class _StateCollector:
+    """Lê pools e WebSockets na coleta, sem custo no caminho das requisições."""
+
+    def collect(self):
+        pools = GaugeMetricFamily("db_pool_connections", "Conexões do pool por estado", labels=["engine", "state"])
+        saturation = GaugeMetricFamily("db_pool_saturation", "Conexões em uso / capacidade do pool", labels=["engine"])
+        database = _module("database")
+        for name, stats in (database.pool_stats() if database is not None else {}).items():
+            for state in ("checked_out", "checked_in", "overflow"):
+                if state in stats:
+                    pools.add_metric([name, state], stats[state])
+            if stats.get("saturation") is not None:
+                saturation.add_metric([name], stats["saturation"])
+        yield pools
+        yield saturation
+        ws = _ws_metrics()
+        if ws is not None:
+            yield GaugeMetricFamily("ws_connections", "Conexões WebSocket ativas", value=ws["connections"])
+            yield GaugeMetricFamily("ws_send_queue_depth", "Mensagens pendentes somadas nas filas de envio", value=ws["queue_depth_total"])
+            yield GaugeMetricFamily("ws_send_queue_depth_max", "Maior fila de envio entre as conexões", value=ws["queue_depth_max"])
+            for key in ("messages_sent", "messages_conflated", "evictions", "heartbeat_evictions", "send_errors"):
+                yield CounterMetricFamily(f"ws_{key}", f"WebSocket: {key.replace('_', ' ')}", value=ws[key])
+
+def _module(name: str) -> Any:
+    # Importado como `database` na API e como `backend.database` no Celery
+    import sys
+    return sys.modules.get(name) or sys.modules.get(f"backend.{name}")
+
+def _ws_metrics() -> dict[str, int] | None:
+    manager = getattr(_module("websocket"), "manager", None)  # só no processo da API
+    return manager.metrics() if manager is not None else None
+
+if ENABLED:
+    try:
+        REGISTRY.register(_StateCollector())
+    except ValueError:  # já registrado por outra cópia do módulo
+        pass
+
+def _registry() -> Any:
+    """Registro a expor; com PROMETHEUS_MULTIPROC_DIR agrega todos os processos."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(_StateCollector())
+        return registry
+    return REGISTRY
+
+def render() -> bytes:
+    return generate_latest(_registry()) if ENABLED else b""
+
+# --- Celery -------------------------------------------------------------------------
+
+def instrument_celery(celery_app: Any) -> None:
+    """Mede a duração das tasks e expõe as métricas do worker via HTTP.
+
+    O exportador sobe em CELERY_METRICS_PORT (padrão 9808) quando o worker
+    fica pronto. Com o pool prefork, defina PROMETHEUS_MULTIPROC_DIR para
+    que as métricas dos processos filhos sejam agregadas.
+    """
+    if not ENABLED:
+        return
+    from celery import signals
+    started: dict[str, float] = {}
+
+    @signals.task_prerun.connect(weak=False)
+    def _prerun(task_id: str = "", **_: Any) -> None:
+        started[task_id] = time.perf_counter()
+
+    @signals.task_postrun.connect(weak=False)
+    def _postrun(task_id: str = "", task: Any = None, state: str | None = None, **_: Any) -> None:
+        t0 = started.pop(task_id, None)
+        if t0 is not None:
+            TASK_LATENCY.labels(getattr(task, "name", "unknown"), state or "UNKNOWN").observe(time.perf_counter() - t0)
+
+    @signals.worker_ready.connect(weak=False)
+    def _serve(**_: Any) -> None:
+        from prometheus_client import start_http_server
+        port = int(os.environ.get("CELERY_METRICS_PORT", "9808"))
+        start_http_server(port, registry=_registry())
+        logger.info("Métricas do worker em :%d/metrics", port)
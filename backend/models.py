@@ -1,7 +1,7 @@
 from __future__ import annotations
 from datetime import date, datetime
 from typing import List
-from sqlalchemy import Boolean, Date, DateTime, Float, ForeignKey, Integer, String, UniqueConstraint
+from sqlalchemy import Boolean, Date, DateTime, Float, ForeignKey, Index, Integer, String, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 import sys
 import os
@@ -11,6 +11,8 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from database import Base
 
+# Filhos (alocações, fechamentos) são removidos pelo banco via ON DELETE
+# CASCADE; `passive_deletes` evita que o ORM os carregue para apagar um a um.
 class Client(Base):
     __tablename__ = "clients"
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
@@ -18,7 +20,7 @@ class Client(Base):
     email: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, nullable=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
-    allocations: Mapped[List["Allocation"]] = relationship(back_populates="client", cascade="all, delete-orphan")
+    allocations: Mapped[List["Allocation"]] = relationship(back_populates="client", cascade="all, delete-orphan", passive_deletes=True)
 
 class Asset(Base):
     __tablename__ = "assets"
@@ -26,15 +28,15 @@ class Asset(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
     ticker: Mapped[str] = mapped_column(String(32), nullable=False, unique=True)
     name: Mapped[str | None] = mapped_column(String(255), nullable=True)
-    allocations: Mapped[List["Allocation"]] = relationship(back_populates="asset", cascade="all, delete-orphan")
-    daily_returns: Mapped[List["DailyReturn"]] = relationship(back_populates="asset", cascade="all, delete-orphan")
+    allocations: Mapped[List["Allocation"]] = relationship(back_populates="asset", cascade="all, delete-orphan", passive_deletes=True)
+    daily_returns: Mapped[List["DailyReturn"]] = relationship(back_populates="asset", cascade="all, delete-orphan", passive_deletes=True)
 
 class Allocation(Base):
     __tablename__ = "allocations"
     __table_args__ = (UniqueConstraint("client_id", "asset_id", "purchase_date"),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    client_id: Mapped[int] = mapped_column(ForeignKey("clients.id"), nullable=False)
-    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id"), nullable=False)
+    client_id: Mapped[int] = mapped_column(ForeignKey("clients.id", ondelete="CASCADE"), nullable=False)
+    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id", ondelete="CASCADE"), nullable=False)
     quantity: Mapped[float] = mapped_column(Float, nullable=False)
     purchase_price: Mapped[float] = mapped_column(Float, nullable=False)
     purchase_date: Mapped[date] = mapped_column(Date, nullable=False)
@@ -45,7 +47,38 @@ class DailyReturn(Base):
     __tablename__ = "daily_returns"
     __table_args__ = (UniqueConstraint("asset_id", "date"),)
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id"), nullable=False)
+    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id", ondelete="CASCADE"), nullable=False)
     date: Mapped[date] = mapped_column(Date, nullable=False)
     close_price: Mapped[float] = mapped_column(Float, nullable=False)
     asset: Mapped[Asset] = relationship(back_populates="daily_returns")
+
+# Agregados do dashboard (ver rollups.py), mantidos a cada escrita para que
+# /api/dashboard/summary não percorra clientes nem alocações.
+class ClientRollup(Base):
+    __tablename__ = "rollup_clients"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)  # linha única, id=1
+    total: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    active: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+
+class PositionRollup(Base):
+    __tablename__ = "rollup_positions"
+    asset_id: Mapped[int] = mapped_column(ForeignKey("assets.id", ondelete="CASCADE"), primary_key=True)
+    quantity: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+    last_close: Mapped[float | None] = mapped_column(Float, nullable=True)
+    prev_close: Mapped[float | None] = mapped_column(Float, nullable=True)
+    last_close_date: Mapped[date | None] = mapped_column(Date, nullable=True)
+
+class DailyRollup(Base):
+    __tablename__ = "rollup_daily"
+    date: Mapped[date] = mapped_column(Date, primary_key=True)
+    aum: Mapped[float] = mapped_column(Float, nullable=False)
+    pnl: Mapped[float] = mapped_column(Float, default=0, nullable=False)
+    index_value: Mapped[float] = mapped_column(Float, default=1, nullable=False)
+
+# Índices dos caminhos quentes (ver alembic/versions/002_hot_path_indexes.py)
+Index("ix_allocations_client_id_cover", Allocation.client_id, postgresql_include=["asset_id", "quantity", "purchase_price", "purchase_date"])
+Index("ix_daily_returns_asset_date_desc", DailyReturn.asset_id, DailyReturn.date.desc(), postgresql_include=["close_price"])
+# No Postgres daily_returns é particionada por ano em `date` (migração 003, PK
+# (id, date)); o BRIN em `date` cobre filtros por faixa de datas em cada partição.
+Index("ix_daily_returns_date_brin", DailyReturn.date, postgresql_using="brin")
+Index("ix_clients_created_at_id", Client.created_at.desc(), Client.id)
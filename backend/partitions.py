@@ -0,0 +1,118 @@
+from __future__ import annotations
+
+import csv
+import gzip
+import logging
+import os
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+logger = logging.getLogger("partitions")
+
+# `daily_returns` é particionada por ano em `date` (migração 003). Partições
+# futuras são criadas antes de serem necessárias; as antigas podem ser
+# desanexadas sem travar a partição corrente e arquivadas em disco frio.
+PARENT = "daily_returns"
+YEARS_AHEAD = int(os.environ.get("PARTITION_YEARS_AHEAD", "1"))
+# 0 desliga o arquivamento; N mantém o ano corrente e os N-1 anteriores
+RETENTION_YEARS = int(os.environ.get("PARTITION_RETENTION_YEARS", "0"))
+ARCHIVE_DIR = os.environ.get("PARTITION_ARCHIVE_DIR", "archive")
+
+def partition_name(year: int) -> str:
+    return f"{PARENT}_y{int(year)}"
+
+def _is_postgres(conn: AsyncConnection) -> bool:
+    return conn.dialect.name == "postgresql"
+
+async def list_partitions(conn: AsyncConnection) -> list[tuple[str, int]]:
+    """Partições anexadas como `(nome, ano)`, em ordem de ano."""
+    rows = (await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :parent"
+    ), {"parent": PARENT})).scalars().all()
+    out = []
+    for name in rows:
+        suffix = name.rsplit("_y", 1)[-1]
+        if suffix.isdigit():
+            out.append((name, int(suffix)))
+    return sorted(out, key=lambda p: p[1])
+
+async def ensure_partitions(conn: AsyncConnection, years_ahead: int = YEARS_AHEAD, today: date | None = None,
+                            years: tuple[int, int] | None = None) -> list[str]:
+    """Cria as partições do ano corrente até `years_ahead` anos à frente.
+
+    `years=(primeiro, último)` troca esse intervalo por um explícito (ex.:
+    histórico importado de anos sem partição). Idempotente; retorna os nomes
+    das partições criadas. Fora do Postgres (ex.: SQLite nos testes) a
+    tabela não é particionada e nada é feito.
+    """
+    if not _is_postgres(conn):
+        return []
+    if years is None:
+        year = (today or date.today()).year
+        years = (year, year + years_ahead)
+    existing = {y for _, y in await list_partitions(conn)}
+    created = []
+    for y in range(years[0], years[1] + 1):
+        if y in existing:
+            continue
+        await conn.execute(text(
+            f"CREATE TABLE IF NOT EXISTS {partition_name(y)} PARTITION OF {PARENT} "
+            f"FOR VALUES FROM ('{y}-01-01') TO ('{y + 1}-01-01')"
+        ))
+        created.append(partition_name(y))
+    return created
+
+async def detach_partition(engine: AsyncEngine, year: int) -> str:
+    """Desanexa a partição de `year` com DETACH ... CONCURRENTLY (Postgres 14+).
+
+    O comando não pode rodar dentro de transação, então usa uma conexão em
+    autocommit; leituras e escritas nas demais partições seguem normalmente.
+    Se uma execução anterior foi interrompida, finaliza o detach pendente.
+    """
+    name = partition_name(year)
+    async with engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        pending = (await conn.execute(text(
+            "SELECT i.inhdetachpending FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid WHERE c.relname = :name"
+        ), {"name": name})).scalar()
+        if pending:
+            await conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name} FINALIZE"))
+        elif pending is not None:
+            await conn.execute(text(f"ALTER TABLE {PARENT} DETACH PARTITION {name} CONCURRENTLY"))
+    return name
+
+async def archive_partition(engine: AsyncEngine, year: int, archive_dir: str = ARCHIVE_DIR) -> str:
+    """Desanexa a partição de `year`, grava-a em CSV gzip e remove a tabela.
+
+    O arquivo é escrito antes do DROP; se a cópia falhar, a tabela
+    desanexada continua no banco. Retorna o caminho do arquivo.
+    """
+    name = await detach_partition(engine, year)
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.csv.gz")
+    tmp = path + ".part"
+    async with engine.connect() as conn:
+        result = await conn.stream(text(f"SELECT id, asset_id, date, close_price FROM {name} ORDER BY asset_id, date"))
+        with gzip.open(tmp, "wt", newline="") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(["id", "asset_id", "date", "close_price"])
+            async for row in result:
+                writer.writerow(row)
+    os.replace(tmp, path)
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP TABLE {name}"))
+    logger.info("Partição %s arquivada em %s", name, path)
+    return path
+
+async def archive_old_partitions(engine: AsyncEngine, retention_years: int = RETENTION_YEARS, today: date | None = None, archive_dir: str = ARCHIVE_DIR) -> list[str]:
+    """Arquiva as partições mais antigas que a retenção configurada."""
+    if retention_years <= 0 or engine.dialect.name != "postgresql":
+        return []
+    cutoff = (today or date.today()).year - retention_years + 1
+    async with engine.connect() as conn:
+        old = [y for _, y in await list_partitions(conn) if y < cutoff]
+    return [await archive_partition(engine, y, archive_dir) for y in old]
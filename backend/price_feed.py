@@ -0,0 +1,153 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable
+
+import pricing
+
+logger = logging.getLogger("price_feed")
+
+POLL_INTERVAL = float(os.environ.get("PRICE_POLL_INTERVAL", "15"))
+# Trava no Redis para que apenas um processo consulte o Yahoo por intervalo, e
+# conjunto (score = expiração) com a união dos tickers assinados em todos os processos
+_POLL_LOCK_KEY = "feed:poll:lock"
+_SYMBOLS_KEY = "feed:symbols"
+
+Quote = dict[str, float]
+
+def make_quote(price: float, previous_close: float | None) -> Quote:
+    """Monta a cotação enviada aos clientes, com variação contra o fechamento anterior."""
+    quote: Quote = {"price": round(price, 4)}
+    if previous_close:
+        change = price - previous_close
+        quote["change"] = round(change, 4)
+        quote["change_percent"] = round(change / previous_close * 100, 2)
+    return quote
+
+class PriceFeed:
+    """Fonte única de cotações para os produtores WebSocket.
+
+    Mantém em memória a última cotação de cada ticker assinado, lida do mesmo
+    cache Redis usado por `pricing.get_current_price`. Uma task em segundo
+    plano atualiza a união dos tickers assinados em lotes, então o número de
+    chamadas ao Yahoo não cresce com o número de conexões. Os `listeners`
+    recebem a lista de tickers cuja cotação mudou a cada carga.
+    """
+
+    def __init__(self, interval: float = POLL_INTERVAL) -> None:
+        self.interval = interval
+        self.quotes: dict[str, Quote] = {}
+        self._refs: Counter = Counter()
+        self._task: asyncio.Task | None = None
+        self._load_lock = asyncio.Lock()
+        # Tickers que o Yahoo não retornou: não são consultados de novo antes do próximo ciclo
+        self._misses: dict[str, float] = {}
+        self.listeners: list[Callable[[list[str]], None]] = []
+        # Relógio do Redis (epoch-ms) lido antes da última carga de cada ticker:
+        # ticks com id até esse instante já estão refletidos em `quotes`
+        self.loaded_at: dict[str, int] = {}
+
+    @property
+    def symbols(self) -> list[str]:
+        return list(self._refs)
+
+    def subscribe(self, symbols: Iterable[str]) -> None:
+        for s in symbols:
+            self._refs[s.upper()] += 1
+        if self._refs and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self._poll_loop())
+
+    def unsubscribe(self, symbols: Iterable[str]) -> None:
+        for s in symbols:
+            s = s.upper()
+            self._refs[s] -= 1
+            if self._refs[s] <= 0:
+                del self._refs[s]
+                self.quotes.pop(s, None)
+                self.loaded_at.pop(s, None)
+                self._misses.pop(s, None)
+        if not self._refs and self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def quotes_for(self, symbols: Iterable[str]) -> dict[str, Quote]:
+        return {s: self.quotes[s] for s in symbols if s in self.quotes}
+
+    def cursor(self, symbols: Iterable[str]) -> int | None:
+        """Ponto de retomada do replay para `symbols`: a carga mais antiga entre eles.
+
+        Vem do relógio do Redis, que também gera os ids dos ticks, e não do
+        relógio local; None se algum ticker ainda não foi carregado.
+        """
+        marks = [self.loaded_at.get(s) for s in symbols]
+        return None if not marks or None in marks else min(marks)
+
+    async def ensure(self, symbols: Iterable[str]) -> dict[str, Quote]:
+        """Garante cotações para `symbols` (útil no snapshot inicial).
+
+        Lê primeiro do cache; só os tickers ausentes disparam uma atualização
+        no Yahoo. Chamadas simultâneas são serializadas e reaproveitam o que a
+        anterior já carregou.
+        """
+        symbols = [s.upper() for s in symbols]
+        if any(s not in self.quotes for s in symbols):
+            async with self._load_lock:
+                now = time.monotonic()
+                missing = [s for s in symbols if s not in self.quotes and now - self._misses.get(s, -self.interval) >= self.interval]
+                if missing:
+                    try:
+                        await self._load(missing, refresh_missing=True)
+                    except Exception as e:
+                        logger.warning("Falha ao carregar cotações %s: %s", missing, e)
+        return self.quotes_for(symbols)
+
+    async def _load(self, symbols: list[str], refresh_missing: bool = False) -> None:
+        try:  # antes da leitura: um tick gravado depois pode vir repetido no replay, nunca perdido
+            at: int | None = await pricing.redis_time_ms()
+        except Exception:
+            at = None
+        cached = await pricing.get_cached_quotes(symbols)
+        missing = [s for s in symbols if s not in cached]
+        if missing and refresh_missing:
+            await pricing.refresh_quotes(missing)
+            cached.update(await pricing.get_cached_quotes(missing))
+        changed: list[str] = []
+        for sym, row in cached.items():
+            if sym not in self._refs:
+                continue  # assinatura cancelada durante a leitura
+            quote = make_quote(row["price"], row["previous_close"])
+            if self.quotes.get(sym) != quote:
+                self.quotes[sym] = quote
+                changed.append(sym)
+            if at is not None:
+                self.loaded_at[sym] = at
+            self._misses.pop(sym, None)
+        if refresh_missing:
+            now = time.monotonic()
+            self._misses.update((s, now) for s in symbols if s not in cached)
+        if changed:
+            for listener in self.listeners:
+                listener(changed)
+
+    async def _poll_loop(self) -> None:
+        while self._refs:
+            await asyncio.sleep(self.interval)
+            symbols = self.symbols
+            try:
+                r = await pricing._get_redis()
+                now = time.time()
+                await r.zadd(_SYMBOLS_KEY, {s: now + 3 * self.interval for s in symbols})
+                if await r.set(_POLL_LOCK_KEY, "1", nx=True, ex=max(1, int(self.interval))):
+                    await r.zremrangebyscore(_SYMBOLS_KEY, "-inf", now)
+                    await pricing.refresh_quotes(await r.zrange(_SYMBOLS_KEY, 0, -1))
+                await self._load(symbols)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Falha ao atualizar cotações: %s", e)
+
+feed = PriceFeed()
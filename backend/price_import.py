@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+from collections.abc import AsyncIterator, Callable
+from datetime import date, datetime
+from typing import Any
+
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bulk_import  # noqa: E402
+import http_cache  # noqa: E402
+import models  # noqa: E402
+import partitions  # noqa: E402
+import price_store  # noqa: E402
+import pricing  # noqa: E402
+import rollups  # noqa: E402
+import schemas  # noqa: E402
+
+try:  # Parquet é opcional (pyarrow)
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depende do ambiente
+    pq = None
+
+logger = logging.getLogger("price_import")
+
+# Carga em massa de fechamentos em `daily_returns` (endpoint
+# `POST /api/prices:bulk` e CLI `python price_import.py arquivo`).
+# No Postgres as linhas vão por COPY para uma tabela temporária e entram com
+# um único INSERT ... SELECT DISTINCT ON ... ON CONFLICT DO UPDATE; nos demais
+# bancos (SQLite nos testes) o merge é feito em blocos.
+CHUNK_SIZE = int(os.environ.get("PRICE_IMPORT_CHUNK_SIZE", "10000"))
+PARQUET_MEDIA_TYPES = ("application/vnd.apache.parquet", "application/x-parquet", "application/parquet")
+MAX_UNKNOWN_TICKERS = 100
+
+# Chamados com {asset_id: menor data alterada} depois de cada carga, para
+# invalidar dados derivados do histórico (ex.: agregados, ETags).
+history_listeners: list[Callable[[dict[int, date]], Any]] = [http_cache.on_history]
+
+def detect_format(content_type: str | None, requested: str | None = None) -> str | None:
+    if requested == "parquet" or (not requested and (content_type or "").split(";")[0].strip().lower() in PARQUET_MEDIA_TYPES):
+        return "parquet"
+    return bulk_import.detect_format(content_type, requested)
+
+async def iter_parquet(chunks: AsyncIterator[bytes]) -> AsyncIterator[bulk_import.Record]:
+    """Parquet precisa do rodapé: o corpo vai para um arquivo temporário e é lido por lotes."""
+    if pq is None:
+        raise RuntimeError("pyarrow não instalado: Parquet indisponível")
+    with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as fh:
+        async for chunk in chunks:
+            fh.write(chunk)
+        fh.seek(0)
+        n = 0
+        for batch in pq.ParquetFile(fh).iter_batches(batch_size=CHUNK_SIZE):
+            for row in batch.to_pylist():
+                n += 1
+                yield n, row
+
+def iter_source(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[bulk_import.Record]:
+    return iter_parquet(chunks) if fmt == "parquet" else bulk_import.iter_records(chunks, fmt)
+
+def parse_row(raw: dict[str, Any]) -> tuple[str | None, int | None, date, float]:
+    """Normaliza `(ticker, asset_id, data, fechamento)`; levanta ValueError se inválida."""
+    ticker = raw.get("ticker") or raw.get("symbol")
+    asset_id = raw.get("asset_id")
+    if not ticker and asset_id in (None, ""):
+        raise ValueError("informe ticker ou asset_id")
+    d = raw.get("date")
+    if isinstance(d, datetime):
+        d = d.date()
+    elif not isinstance(d, date):
+        d = date.fromisoformat(str(d or "").strip()[:10])
+    close = raw.get("close_price", raw.get("close"))
+    try:
+        close = float(close)
+    except (TypeError, ValueError):
+        raise ValueError(f"fechamento inválido: {close!r}")
+    if not math.isfinite(close) or close <= 0:
+        raise ValueError(f"fechamento inválido: {close!r}")
+    return (str(ticker).strip().upper() if ticker else None), (_asset_id(asset_id) if not ticker else None), d, close
+
+def _asset_id(value: Any) -> int:
+    """`asset_id` inteiro; listas, objetos e números fracionários viram ValueError."""
+    try:
+        number = float(value) if not isinstance(value, bool | list | dict) else math.nan
+    except (TypeError, ValueError):
+        number = math.nan
+    if not math.isfinite(number) or number != int(number):
+        raise ValueError(f"asset_id inválido: {value!r}")
+    return int(number)
+
+class PriceImporter:
+    def __init__(self, session: AsyncSession, create_assets: bool = False, chunk_size: int = CHUNK_SIZE) -> None:
+        self.session = session
+        self.create_assets = create_assets
+        self.chunk_size = chunk_size
+        self.report = schemas.PriceImportReport()
+        self.affected: dict[int, date] = {}
+        self._unknown: set = set()
+
+    def _error(self, line: int, message: str) -> None:
+        self.report.failed += 1
+        if len(self.report.errors) < bulk_import.MAX_REPORTED_ERRORS:
+            self.report.errors.append(schemas.BulkRowError(line=line, error=message))
+        else:
+            self.report.errors_truncated = True
+
+    def _touch(self, asset_id: int, d: date) -> None:
+        if asset_id not in self.affected or d < self.affected[asset_id]:
+            self.affected[asset_id] = d
+
+    async def run(self, records: AsyncIterator[bulk_import.Record]) -> schemas.PriceImportReport:
+        started = time.perf_counter()
+        rows = self._parse(records)
+        if self.session.bind.dialect.name == "postgresql":
+            await self._copy_and_merge(rows)
+        else:
+            await self._merge_chunks(rows)
+        await rollups.apply_closes(self.session, self.affected)
+        await self.session.commit()
+        await invalidate_history(self.session, self.affected)
+        if self.report.assets_created:
+            await http_cache.bump(http_cache.ASSETS_KEY)
+        self.report.unknown_tickers = sorted(self._unknown)[:MAX_UNKNOWN_TICKERS]
+        self.report.assets_affected = len(self.affected)
+        elapsed = time.perf_counter() - started
+        self.report.elapsed_seconds = round(elapsed, 4)
+        self.report.rows_per_second = round(self.report.received / elapsed, 1) if elapsed else 0.0
+        return self.report
+
+    async def _parse(self, records: AsyncIterator[bulk_import.Record]) -> AsyncIterator[list[tuple[int, Any]]]:
+        """Agrupa linhas válidas em blocos de `(linha, (ticker, asset_id, data, fechamento))`."""
+        batch: list[tuple[int, Any]] = []
+        async for line, raw in records:
+            self.report.received += 1
+            if isinstance(raw, Exception):
+                self._error(line, str(raw))
+                continue
+            if not isinstance(raw, dict):
+                self._error(line, "registro deve ser um objeto")
+                continue
+            try:
+                batch.append((line, parse_row(raw)))
+            except ValueError as e:
+                self._error(line, str(e))
+                continue
+            if len(batch) >= self.chunk_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    # --- Postgres: COPY para staging + merge em SQL ---------------------------------
+    async def _copy_and_merge(self, batches: AsyncIterator[list[tuple[int, Any]]]) -> None:
+        s = self.session
+        await s.execute(text(
+            "CREATE TEMP TABLE staging_daily_returns (line integer, ticker text, asset_id integer, "
+            "date date, close_price double precision) ON COMMIT DROP"
+        ))
+        raw = await (await s.connection()).get_raw_connection()
+        pg = raw.driver_connection
+        valid = 0
+        first: date | None = None
+        last: date | None = None
+        async for batch in batches:
+            valid += len(batch)
+            dates = [row[2] for _, row in batch]
+            first = min(dates) if first is None else min(first, *dates)
+            last = max(dates) if last is None else max(last, *dates)
+            await pg.copy_records_to_table(
+                "staging_daily_returns", columns=["line", "ticker", "asset_id", "date", "close_price"],
+                records=[(line, *row) for line, row in batch],
+            )
+        if not valid:
+            return
+        # `daily_returns` não tem partição DEFAULT: anos do arquivo sem partição
+        # fariam o merge falhar. O CREATE ... PARTITION OF trava a tabela mãe, então
+        # roda numa transação curta própria, antes de esta tocar qualquer tabela
+        # compartilhada (até aqui só a temporária), e não até o fim da carga.
+        async with s.bind.begin() as conn:
+            await partitions.ensure_partitions(conn, years=(first.year, last.year))
+        if self.create_assets:
+            created = await s.execute(text(
+                "INSERT INTO assets (ticker) SELECT DISTINCT ticker FROM staging_daily_returns WHERE ticker IS NOT NULL "
+                "ON CONFLICT (ticker) DO NOTHING"
+            ))
+            self.report.assets_created = max(created.rowcount, 0)
+        await s.execute(text(
+            "UPDATE staging_daily_returns st SET asset_id = a.id FROM assets a WHERE st.ticker IS NOT NULL AND a.ticker = st.ticker"
+        ))
+        await s.execute(text(
+            "UPDATE staging_daily_returns st SET asset_id = NULL WHERE asset_id IS NOT NULL "
+            "AND NOT EXISTS (SELECT 1 FROM assets a WHERE a.id = st.asset_id)"
+        ))
+        skipped = (await s.execute(text("SELECT count(*) FROM staging_daily_returns WHERE asset_id IS NULL"))).scalar()
+        self._unknown.update((await s.execute(text(
+            f"SELECT DISTINCT ticker FROM staging_daily_returns WHERE asset_id IS NULL AND ticker IS NOT NULL LIMIT {MAX_UNKNOWN_TICKERS}"
+        ))).scalars())
+        distinct = (await s.execute(text(
+            "SELECT count(*) FROM (SELECT DISTINCT asset_id, date FROM staging_daily_returns WHERE asset_id IS NOT NULL) d"
+        ))).scalar()
+        # Última ocorrência de (asset_id, date) no arquivo vence; linhas iguais às gravadas não são tocadas
+        merged = (await s.execute(text("""
+            WITH merged AS (
+                INSERT INTO daily_returns (asset_id, date, close_price)
+                SELECT DISTINCT ON (asset_id, date) asset_id, date, close_price
+                FROM staging_daily_returns WHERE asset_id IS NOT NULL
+                ORDER BY asset_id, date, line DESC
+                ON CONFLICT (asset_id, date) DO UPDATE SET close_price = EXCLUDED.close_price
+                WHERE daily_returns.close_price IS DISTINCT FROM EXCLUDED.close_price
+                RETURNING asset_id, date, (xmax = 0) AS inserted
+            )
+            SELECT asset_id, min(date), count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted)
+            FROM merged GROUP BY asset_id
+        """))).all()
+        for asset_id, first, inserted, updated in merged:
+            self.report.inserted += inserted
+            self.report.updated += updated
+            self._touch(asset_id, first)
+        self.report.skipped = skipped
+        self.report.duplicates = valid - skipped - distinct
+        self.report.unchanged = distinct - self.report.inserted - self.report.updated
+
+    # --- Demais bancos: merge por bloco -----------------------------------------------
+    async def _merge_chunks(self, batches: AsyncIterator[list[tuple[int, Any]]]) -> None:
+        s = self.session
+        t = models.DailyReturn.__table__
+        for_update = bulk_import._insert(s)(t)
+        stmt = for_update.on_conflict_do_update(index_elements=["asset_id", "date"], set_={"close_price": for_update.excluded.close_price})
+        async for batch in batches:
+            tickers = {row[0] for _, row in batch if row[0]}
+            ids = {row[1] for _, row in batch if row[1] is not None}
+            by_ticker = dict((await s.execute(select(models.Asset.ticker, models.Asset.id).where(models.Asset.ticker.in_(tickers)))).all()) if tickers else {}
+            missing = [tk for tk in tickers if tk not in by_ticker]
+            if missing and self.create_assets:
+                ins = bulk_import._insert(s)(models.Asset.__table__).on_conflict_do_nothing(index_elements=["ticker"])
+                created = (await s.execute(ins.returning(models.Asset.ticker, models.Asset.id), [{"ticker": tk} for tk in missing])).all()
+                self.report.assets_created += len(created)
+                by_ticker.update(dict(created))
+            known_ids = set((await s.execute(select(models.Asset.id).where(models.Asset.id.in_(ids)))).scalars()) if ids else set()
+            latest: dict[tuple[int, date], float] = {}
+            for _, (ticker, asset_id, d, close) in batch:
+                aid = by_ticker.get(ticker) if ticker else (asset_id if asset_id in known_ids else None)
+                if aid is None:
+                    self.report.skipped += 1
+                    if ticker:
+                        self._unknown.add(ticker)
+                    continue
+                if (aid, d) in latest:
+                    self.report.duplicates += 1
+                latest[(aid, d)] = close
+            if not latest:
+                continue
+            current = dict(((a, d), c) for a, d, c in (await s.execute(
+                select(t.c.asset_id, t.c.date, t.c.close_price).where(tuple_(t.c.asset_id, t.c.date).in_(list(latest)))
+            )).all())
+            values = []
+            for (aid, d), close in latest.items():
+                old = current.get((aid, d))
+                if old == close:
+                    self.report.unchanged += 1
+                    continue
+                if old is None:
+                    self.report.inserted += 1
+                else:
+                    self.report.updated += 1
+                values.append({"asset_id": aid, "date": d, "close_price": close})
+                self._touch(aid, d)
+            if values:
+                await s.execute(stmt, values)
+
+async def invalidate_history(session: AsyncSession, affected: dict[int, date]) -> None:
+    """Descarta caches derivados do histórico dos ativos alterados.
+
+    Remove o fechamento anterior em cache (`prev:`), os arquivos do
+    price_store que já cobriam datas alteradas e avisa `history_listeners`.
+    """
+    if not affected:
+        return
+    tickers = (await session.execute(select(models.Asset.ticker).where(models.Asset.id.in_(list(affected))))).scalars().all()
+    try:
+        r = await pricing._get_redis()
+        for i in range(0, len(tickers), 500):
+            await r.delete(*[f"prev:{tk}" for tk in tickers[i:i + 500]])
+    except Exception as e:
+        logger.warning("Falha ao invalidar cache de preços: %s", e)
+    store = price_store.get_store()
+    if store is not None:
+        for aid, first in affected.items():
+            last = store.last_date(aid)
+            if last is not None and first <= last:
+                store.invalidate(aid)
+    for listener in history_listeners:
+        try:
+            result = listener(affected)
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception as e:
+            logger.warning("Falha ao invalidar dados derivados: %s", e)
+
+async def import_prices(session: AsyncSession, chunks: AsyncIterator[bytes], fmt: str,
+                        create_assets: bool = False, chunk_size: int = CHUNK_SIZE) -> schemas.PriceImportReport:
+    return await PriceImporter(session, create_assets, chunk_size).run(iter_source(chunks, fmt))
+
+async def _read_file(path: str, size: int = 1024 * 1024) -> AsyncIterator[bytes]:
+    with open(path, "rb") as fh:
+        while chunk := fh.read(size):
+            yield chunk
+
+async def _main(path: str, fmt: str, create_assets: bool) -> None:
+    from database import async_session
+    async with async_session() as session:  # type: ignore[call-arg]
+        report = await import_prices(session, _read_file(path), fmt, create_assets)
+    print(report.model_dump_json(indent=2))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carrega fechamentos (CSV, NDJSON ou Parquet) em daily_returns")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "ndjson", "parquet"], default=None, help="padrão: pela extensão")
+    parser.add_argument("--create-assets", action="store_true", help="cria ativos para tickers desconhecidos")
+    args = parser.parse_args()
+    ext = os.path.splitext(args.path)[1].lower().lstrip(".")
+    fmt = args.format or {"jsonl": "ndjson", "ndjson": "ndjson", "parquet": "parquet", "pq": "parquet"}.get(ext, "csv")
+    asyncio.run(_main(args.path, fmt, args.create_assets))
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+import logging
+import os
+from collections.abc import Iterable
+from datetime import date
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+
+try:  # NumPy é opcional: sem ele as análises leem sempre do banco
+    import numpy as np
+except ImportError:  # pragma: no cover - depende do ambiente
+    np = None
+
+logger = logging.getLogger("price_store")
+
+# Cache colunar local de `daily_returns`: um arquivo binário por ativo com
+# registros (ordinal da data, fechamento), em ordem crescente de data e só
+# com pregões já encerrados. Os arquivos só crescem (append pela task
+# noturna) e são lidos via memmap, sem cópia. Ativo com PRICE_STORE_DIR.
+PRICE_STORE_DIR = os.environ.get("PRICE_STORE_DIR", "")
+
+RECORD = np.dtype([("d", "<i4"), ("c", "<f8")]) if np is not None else None
+
+class PriceStore:
+    """Séries de fechamento por ativo em arquivos mapeados em memória."""
+
+    def __init__(self, root: str) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        # asset_id -> ((inode, mtime, tamanho) do arquivo mapeado, memmap)
+        self._maps: dict[int, tuple[tuple[int, int, int], np.ndarray]] = {}
+
+    def path(self, asset_id: int) -> str:
+        return os.path.join(self.root, f"{int(asset_id)}.bin")
+
+    def read(self, asset_id: int) -> np.ndarray:
+        """Todos os registros do ativo (memmap somente leitura; vazio se não houver)."""
+        try:
+            st = os.stat(self.path(asset_id))
+        except OSError:
+            return np.empty(0, dtype=RECORD)
+        count = st.st_size // RECORD.itemsize  # ignora um registro parcial em escrita
+        if count == 0:
+            return np.empty(0, dtype=RECORD)
+        # Inode e mtime além do tamanho: um arquivo recriado (invalidate + sync,
+        # possivelmente em outro processo) pode ter o mesmo tamanho do antigo
+        version = (st.st_ino, st.st_mtime_ns, st.st_size)
+        cached = self._maps.get(asset_id)
+        if cached is None or cached[0] != version:
+            cached = self._maps[asset_id] = (version, np.memmap(self.path(asset_id), dtype=RECORD, mode="r", shape=(count,)))
+        return cached[1]
+
+    def last_date(self, asset_id: int) -> date | None:
+        records = self.read(asset_id)
+        return date.fromordinal(int(records["d"][-1])) if len(records) else None
+
+    def series(self, asset_id: int, start: date | None = None, end: date | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """Fatia `(ordinais, fechamentos)` de `[start, end]`, sem copiar o arquivo."""
+        records = self.read(asset_id)
+        d = records["d"]
+        lo = int(np.searchsorted(d, start.toordinal(), "left")) if start else 0
+        hi = int(np.searchsorted(d, end.toordinal(), "right")) if end else len(d)
+        return d[lo:hi], records["c"][lo:hi]
+
+    def append(self, asset_id: int, rows: Iterable[tuple[date, float]]) -> int:
+        """Acrescenta fechamentos posteriores ao último gravado; retorna quantos."""
+        last = self.last_date(asset_id)
+        rows = sorted((d, c) for d, c in rows if last is None or d > last)
+        if not rows:
+            return 0
+        buf = np.array([(d.toordinal(), c) for d, c in rows], dtype=RECORD)
+        with open(self.path(asset_id), "ab") as fh:
+            fh.write(buf.tobytes())
+        return len(rows)
+
+    def invalidate(self, asset_id: int | None = None) -> None:
+        """Descarta o arquivo de um ativo (ou todos) após correções no histórico."""
+        ids = [asset_id] if asset_id is not None else [int(f[:-4]) for f in os.listdir(self.root) if f.endswith(".bin")]
+        for aid in ids:
+            self._maps.pop(aid, None)
+            try:
+                os.remove(self.path(aid))
+            except FileNotFoundError:
+                pass
+
+    async def sync(self, session: AsyncSession, today: date | None = None) -> int:
+        """Copia do banco os pregões encerrados ainda ausentes nos arquivos."""
+        today = today or date.today()
+        asset_ids = (await session.execute(select(models.Asset.id))).scalars().all()
+        total = 0
+        for asset_id in asset_ids:
+            q = select(models.DailyReturn.date, models.DailyReturn.close_price).where(
+                models.DailyReturn.asset_id == asset_id, models.DailyReturn.date < today
+            )
+            last = self.last_date(asset_id)
+            if last is not None:
+                q = q.where(models.DailyReturn.date > last)
+            total += self.append(asset_id, (await session.execute(q.order_by(models.DailyReturn.date))).all())
+        logger.info("price_store: %d fechamentos acrescentados", total)
+        return total
+
+_store: PriceStore | None = None
+
+def get_store() -> PriceStore | None:
+    """Store configurado em PRICE_STORE_DIR, ou None quando desativado."""
+    global _store
+    if _store is None and PRICE_STORE_DIR and np is not None:
+        _store = PriceStore(PRICE_STORE_DIR)
+    return _store
@@ -1,28 +1,50 @@
 from __future__ import annotations
-import asyncio, os
+import asyncio, os, time
 from typing import Any, Dict, List, Optional
-from datetime import date
-from sqlalchemy import select
 from database import async_session
-import models
+import crud, http_cache, metrics, tick_history
 import httpx
 import redis.asyncio as redis
 REDIS_URL = os.environ.get("REDIS_URL","redis://localhost:6379/0")
 CACHE_TTL = int(os.environ.get("PRICE_CACHE_TTL","3600"))
 async def _get_redis(): return redis.from_url(REDIS_URL, encoding="utf-8", decode_responses=True)
+
+async def _yahoo_get(client: httpx.AsyncClient, endpoint: str, url: str, params: Dict[str, Any]) -> httpx.Response:
+    """GET no Yahoo com contagem por status e latência (`metrics`)."""
+    started = time.perf_counter()
+    try:
+        resp = await client.get(url, params=params)
+    except Exception:
+        metrics.YAHOO_REQUESTS.labels(endpoint, "error").inc()
+        raise
+    finally:
+        metrics.YAHOO_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+    metrics.YAHOO_REQUESTS.labels(endpoint, str(resp.status_code)).inc()
+    return resp
 async def _backoff(attempt:int): await asyncio.sleep(min(2**attempt, 30))
 
-async def yahoo_search(query: str) -> List[Dict[str, Any]]:
+# Cliente HTTP compartilhado da busca (autocomplete): reaproveita conexões
+# keep-alive com o Yahoo em vez de um handshake TLS a cada tecla.
+_search_client: Optional[httpx.AsyncClient] = None
+
+def _search_http() -> httpx.AsyncClient:
+    global _search_client
+    if _search_client is None or _search_client.is_closed:
+        _search_client = httpx.AsyncClient(timeout=5, limits=httpx.Limits(max_keepalive_connections=10))
+    return _search_client
+
+async def yahoo_search(query: str, retries: int = 3) -> List[Dict[str, Any]]:
+    """Busca de símbolos no Yahoo com até `retries` novas tentativas (ver `search` para o cache)."""
     url = "https://query2.finance.yahoo.com/v1/finance/search"; params={"q":query,"quotesCount":10,"newsCount":0}
-    async with httpx.AsyncClient(timeout=10) as client:
-        for i in range(4):
-            try:
-                r = await client.get(url, params=params); r.raise_for_status()
-                data = r.json(); quotes = data.get("quotes",[])
-                return [{"symbol":q.get("symbol"),"shortname":q.get("shortname")} for q in quotes if q.get("symbol")]
-            except Exception:
-                if i==3: raise
-                await _backoff(i)
+    client = _search_http()
+    for i in range(retries + 1):
+        try:
+            r = await _yahoo_get(client, "search", url, params); r.raise_for_status()
+            data = r.json(); quotes = data.get("quotes",[])
+            return [{"symbol":q.get("symbol"),"shortname":q.get("shortname")} for q in quotes if q.get("symbol")]
+        except Exception:
+            if i==retries: raise
+            await _backoff(i)
     return []
 
 _RATE_KEY = "rate:yy:ts"  # janela simples por segundo
@@ -37,6 +59,9 @@ async def _throttle(client: httpx.AsyncClient) -> None:
     elif ts > 2:
         # dorme até janela expirar
         await asyncio.sleep(1)
+        metrics.YAHOO_THROTTLE_WAIT.observe(1)
+        return
+    metrics.YAHOO_THROTTLE_WAIT.observe(0)
 
 async def yahoo_quote(symbol: str) -> Optional[Dict[str, Any]]:
     url = "https://query2.finance.yahoo.com/v7/finance/quote"; params={"symbols":symbol}
@@ -44,7 +69,7 @@ async def yahoo_quote(symbol: str) -> Optional[Dict[str, Any]]:
         for i in range(4):
             try:
                 await _throttle(client)
-                r = await client.get(url, params=params); r.raise_for_status()
+                r = await _yahoo_get(client, "quote", url, params); r.raise_for_status()
                 res = r.json().get("quoteResponse",{}).get("result",[]); return res[0] if res else None
             except httpx.HTTPStatusError as e:
                 if e.response.status_code == 429:
@@ -56,54 +81,153 @@ async def yahoo_quote(symbol: str) -> Optional[Dict[str, Any]]:
                 await _backoff(i)
     return None
 
+# Grava `price:` e avança a versão da cotação (ETags) só se o valor anterior no
+# Redis for outro. A comparação é feita no Redis, não no processo: o feed, o
+# `PriceFeed.ensure` e o aquecimento do Celery atualizam os mesmos tickers.
+_SET_PRICE = """
+local old = redis.call('GET', KEYS[1])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+if old and tonumber(old) == tonumber(ARGV[1]) then return 0 end
+redis.call('INCR', KEYS[2])
+return 1
+"""
+
+async def _store_price(r: Any, symbol: str, price: Any) -> None:
+    """`price:` (via _SET_PRICE, que invalida os ETags se mudou) e `last_good:`."""
+    symbol = symbol.upper()
+    await r.eval(_SET_PRICE, 2, f"price:{symbol}", http_cache.quote_key(symbol), str(price), CACHE_TTL)
+    await r.setex(f"last_good:{symbol}", CACHE_TTL*6, str(price))
+
 async def get_current_price(symbol: str) -> Optional[float]:
-    key=f"price:{symbol.upper()}"; r=await _get_redis(); cached=await r.get(key)
+    key=f"price:{symbol.upper()}"; r=await _get_redis(); cached=metrics.cache_lookup("price", await r.get(key))
     if cached:
         try: return float(cached)
         except: pass
     # Circuit breaker: se muitas falhas, não chamar remoto agora
     fail = await r.get(_FAIL_KEY)
-    if fail and int(fail) >= 5:
+    if _breaker_open(fail):
         # usar fallback imediatamente
         prev = await get_previous_close(symbol)
         if prev is not None:
-            await r.setex(key, CACHE_TTL, str(prev))
-            await r.setex(f"last_good:{symbol.upper()}", CACHE_TTL*6, str(prev))
+            await _store_price(r, symbol, prev)
             return float(prev)
-        lg = await r.get(f"last_good:{symbol.upper()}")
+        lg = metrics.cache_lookup("last_good", await r.get(f"last_good:{symbol.upper()}"))
         return float(lg) if lg else None
     q = await yahoo_quote(symbol)
     if not q:
         # fallback em cascata
         prev = await get_previous_close(symbol)
         if prev is not None:
-            await r.setex(key, CACHE_TTL, str(prev))
-            await r.setex(f"last_good:{symbol.upper()}", CACHE_TTL*6, str(prev))
+            await _store_price(r, symbol, prev)
             return float(prev)
-        lg = await r.get(f"last_good:{symbol.upper()}")
+        lg = metrics.cache_lookup("last_good", await r.get(f"last_good:{symbol.upper()}"))
         return float(lg) if lg else None
     price = q.get("regularMarketPrice") or q.get("regularMarketPreviousClose")
     if price is not None:
-        await r.setex(key, CACHE_TTL, str(price))
-        await r.setex(f"last_good:{symbol.upper()}", CACHE_TTL*6, str(price))
+        await _store_price(r, symbol, price)
     return float(price) if price is not None else None
 
 async def get_previous_close(symbol: str) -> Optional[float]:
     # Tenta cache primeiro
-    key=f"prev:{symbol.upper()}"; r=await _get_redis(); cached=await r.get(key)
+    key=f"prev:{symbol.upper()}"; r=await _get_redis(); cached=metrics.cache_lookup("prev", await r.get(key))
     if cached:
         try: return float(cached)
         except: pass
     q = await yahoo_quote(symbol)
     prev = None if not q else q.get("regularMarketPreviousClose")
     if prev is None:
-        # Fallback: usa tabela daily_returns
+        # Fallback: usa tabela daily_returns (uma consulta, LIMIT 1 pelo índice asset_id/date)
         async with async_session() as s:  # type: ignore[call-arg]
-            a = (await s.execute(select(models.Asset).where(models.Asset.ticker == symbol))).scalar_one_or_none()
-            if a:
-                row = (await s.execute(select(models.DailyReturn).where(models.DailyReturn.asset_id==a.id).order_by(models.DailyReturn.date.desc()))).scalars().first()
-                if row: prev = row.close_price
+            prev = await crud.get_last_close(s, symbol)
     if prev is not None:
         try: await r.setex(key, CACHE_TTL, str(prev))
         except: pass
     return float(prev) if prev is not None else None
+
+# === Cotações em lote para os produtores WebSocket ===
+QUOTE_BATCH_SIZE = int(os.environ.get("QUOTE_BATCH_SIZE","50"))
+
+def _breaker_open(fail: Optional[str]) -> bool:
+    is_open = bool(fail) and int(fail) >= 5
+    metrics.BREAKER_OPEN.set(1 if is_open else 0)
+    return is_open
+
+async def yahoo_quotes(symbols: List[str]) -> Dict[str, Dict[str, Any]]:
+    """Busca cotações de vários tickers, uma requisição por lote de `QUOTE_BATCH_SIZE`."""
+    url = "https://query2.finance.yahoo.com/v7/finance/quote"; out: Dict[str, Dict[str, Any]] = {}
+    async with httpx.AsyncClient(timeout=10) as client:
+        for start in range(0, len(symbols), QUOTE_BATCH_SIZE):
+            batch = symbols[start:start+QUOTE_BATCH_SIZE]
+            for i in range(4):
+                try:
+                    await _throttle(client)
+                    r = await _yahoo_get(client, "quote_batch", url, {"symbols": ",".join(batch)}); r.raise_for_status()
+                    for q in r.json().get("quoteResponse",{}).get("result",[]):
+                        if q.get("symbol"): out[q["symbol"].upper()] = q
+                    break
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code == 429:
+                        rr = await _get_redis(); await rr.incrby(_FAIL_KEY, 1); await rr.expire(_FAIL_KEY, 60)
+                    if i==3: raise
+                    await _backoff(i)
+                except Exception:
+                    if i==3: raise
+                    await _backoff(i)
+    return out
+
+async def refresh_quotes(symbols: List[str]) -> int:
+    """Atualiza as chaves `price:`/`prev:`/`last_good:` de vários tickers em lote.
+
+    Respeita o circuit breaker: com muitas falhas recentes não chama o Yahoo.
+    Preços que mudaram também entram no histórico intradiário (`tick_history`)
+    e avançam a versão da cotação usada nos ETags (`http_cache`), comparados
+    com o valor anterior no Redis.
+    Retorna a quantidade de tickers atualizados.
+    """
+    symbols = sorted({s.upper() for s in symbols})
+    r = await _get_redis()
+    if not symbols or _breaker_open(await r.get(_FAIL_KEY)):
+        return 0
+    quotes = await yahoo_quotes(symbols)
+    async with r.pipeline(transaction=False) as pipe:
+        for sym, q in quotes.items():
+            price = q.get("regularMarketPrice") or q.get("regularMarketPreviousClose")
+            prev = q.get("regularMarketPreviousClose")
+            if price is not None:
+                # Preço novo invalida os ETags das carteiras com o ticker
+                pipe.eval(_SET_PRICE, 2, f"price:{sym}", http_cache.quote_key(sym), str(price), CACHE_TTL)
+                pipe.setex(f"last_good:{sym}", CACHE_TTL*6, str(price))
+                tick_history.record(pipe, sym, float(price))
+            if prev is not None:
+                pipe.setex(f"prev:{sym}", CACHE_TTL, str(prev))
+        await pipe.execute()
+    return len(quotes)
+
+async def redis_time_ms() -> int:
+    """Relógio do Redis em epoch-ms, a mesma base dos ids dos streams de ticks."""
+    r = await _get_redis()
+    seconds, micros = await r.time()
+    return int(seconds) * 1000 + int(micros) // 1000
+
+async def get_cached_quotes(symbols: List[str]) -> Dict[str, Dict[str, Optional[float]]]:
+    """Lê preço atual e fechamento anterior do cache Redis sem chamar o Yahoo.
+
+    Usa um único MGET; o preço cai para `last_good:` quando `price:` expirou.
+    Tickers sem nenhum preço em cache ficam de fora do resultado.
+    """
+    symbols = [s.upper() for s in symbols]
+    if not symbols: return {}
+    r = await _get_redis()
+    keys = [f"{tier}:{s}" for s in symbols for tier in ("price","prev","last_good")]
+    values = await r.mget(keys)
+    out: Dict[str, Dict[str, Optional[float]]] = {}
+    for i, sym in enumerate(symbols):
+        price, prev, last_good = values[3*i:3*i+3]
+        metrics.cache_lookup("price", price); metrics.cache_lookup("prev", prev)
+        if not price: price = metrics.cache_lookup("last_good", last_good)
+        if price is None: continue
+        try:
+            out[sym] = {"price": float(price), "previous_close": float(prev) if prev else None}
+        except ValueError:
+            continue
+    return out
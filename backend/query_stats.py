@@ -0,0 +1,158 @@
+from __future__ import annotations
+
+import logging
+import os
+import time
+from collections import Counter
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger("query_stats")
+
+# Contagem de consultas SQL por requisição. Um hook nos eventos de cursor do
+# SQLAlchemy soma comandos e tempo no `QueryStats` da requisição atual (via
+# contextvar), e o middleware publica o total no header `Server-Timing` e no
+# log. Rotas podem declarar um orçamento com `Depends(budget(n))`.
+ENABLED = os.environ.get("QUERY_STATS_ENABLED", "true").lower() in ("1", "true", "yes")
+# Repetições do mesmo SQL numa requisição a partir das quais o log aponta possível N+1
+REPEAT_THRESHOLD = int(os.environ.get("QUERY_REPEAT_THRESHOLD", "5"))
+
+class QueryStats:
+    """Consultas de um escopo (requisição ou bloco de teste).
+
+    Escopos aninhados repassam cada consulta ao escopo externo, de modo que
+    `assert_max_queries` enxerga também o que rodou dentro do middleware.
+    """
+
+    def __init__(self, parent: QueryStats | None = None) -> None:
+        self.parent = parent
+        self.count = 0
+        self.duration = 0.0
+        self.statements: Counter = Counter()
+        self.budget: int | None = None
+        self.violations: list[str] = []
+
+    def record(self, statement: str, elapsed: float) -> None:
+        stats: QueryStats | None = self
+        while stats is not None:
+            stats.count += 1
+            stats.duration += elapsed
+            stats.statements[statement] += 1
+            stats = stats.parent
+
+    def repeated(self, threshold: int = REPEAT_THRESHOLD) -> dict[str, int]:
+        """SQL executado `threshold` vezes ou mais (candidato a N+1)."""
+        return {sql: n for sql, n in self.statements.items() if n >= threshold}
+
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.count > self.budget
+
+    def report_violation(self, message: str) -> None:
+        stats = self.parent
+        while stats is not None:
+            stats.violations.append(message)
+            stats = stats.parent
+
+    def server_timing(self) -> str:
+        return f'db;dur={self.duration * 1000:.1f};desc="{self.count} {"query" if self.count == 1 else "queries"}"'
+
+_current: ContextVar[QueryStats | None] = ContextVar("query_stats", default=None)
+
+def current() -> QueryStats | None:
+    return _current.get()
+
+@contextmanager
+def track() -> Iterator[QueryStats]:
+    """Abre um escopo de contagem (aninhado ao atual, se houver)."""
+    stats = QueryStats(_current.get())
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+def budget(limit: int) -> Callable[[], Any]:
+    """Dependência FastAPI que declara o máximo de consultas da rota."""
+    async def _declare() -> None:
+        stats = _current.get()
+        if stats is not None:
+            stats.budget = limit
+    return _declare
+
+# --- Banco --------------------------------------------------------------------------
+
+if not getattr(Engine, "_query_stats_hooked", False):
+    Engine._query_stats_hooked = True  # type: ignore[attr-defined]
+
+    @event.listens_for(Engine, "before_cursor_execute")
+    def _before_query(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        if _current.get() is not None:
+            conn.info.setdefault("_query_stats_started", []).append(time.perf_counter())
+
+    @event.listens_for(Engine, "after_cursor_execute")
+    def _after_query(conn: Any, cursor: Any, statement: str, parameters: Any, context: Any, executemany: bool) -> None:
+        stats = _current.get()
+        started = conn.info.get("_query_stats_started")
+        if stats is not None and started:
+            stats.record(statement, time.perf_counter() - started.pop())
+
+# --- HTTP ---------------------------------------------------------------------------
+
+class QueryStatsMiddleware:
+    """Middleware ASGI puro: `Server-Timing` com consultas e tempo de banco.
+
+    O header sai com o que foi executado até o início da resposta; o log,
+    ao final, traz o total e avisa sobre orçamento estourado e SQL repetido.
+    """
+
+    def __init__(self, app: Callable) -> None:
+        self.app = app
+
+    async def __call__(self, scope: dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not ENABLED:
+            await self.app(scope, receive, send)
+            return
+        with track() as stats:
+            async def _send(message: dict[str, Any]) -> None:
+                if message["type"] == "http.response.start":
+                    message["headers"] = [*message.get("headers", []), (b"server-timing", stats.server_timing().encode())]
+                await send(message)
+            try:
+                await self.app(scope, receive, _send)
+            finally:
+                _log(scope, stats)
+
+def _log(scope: dict[str, Any], stats: QueryStats) -> None:
+    path = f"{scope['method']} {scope['path']}"
+    logger.info("%s: %d consultas, %.1f ms de banco", path, stats.count, stats.duration * 1000)
+    if stats.over_budget():
+        message = f"{path}: {stats.count} consultas, orçamento {stats.budget}"
+        logger.warning(message)
+        stats.report_violation(message)
+    for sql, n in stats.repeated().items():
+        logger.warning("%s: possível N+1, %dx %s", path, n, " ".join(sql.split())[:200])
+
+# --- Testes -------------------------------------------------------------------------
+
+@contextmanager
+def assert_max_queries(limit: int | None = None) -> Iterator[QueryStats]:
+    """Falha o bloco se passar de `limit` consultas ou do orçamento de alguma rota.
+
+        with assert_max_queries(2):
+            await client.get("/api/clients")
+
+    Sem `limit`, só os orçamentos declarados com `budget(n)` são verificados.
+    """
+    with track() as stats:
+        yield stats
+    problems = list(stats.violations)
+    if limit is not None and stats.count > limit:
+        problems.insert(0, f"{stats.count} consultas, limite {limit}")
+    if problems:
+        listing = "\n".join(f"  {n}x {' '.join(sql.split())}" for sql, n in stats.statements.most_common())
+        raise AssertionError("; ".join(problems) + "\n" + listing)
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from collections.abc import Iterable
+from datetime import date
+
+from sqlalchemy import case, func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import models
+import schemas
+
+# Agregados da firma para o dashboard. Cada escrita ajusta só o que mudou,
+# na mesma transação:
+#   rollup_clients    contagem de clientes (total/ativos), linha única
+#   rollup_positions  quantidade total e os dois últimos fechamentos por ativo
+#   rollup_daily      patrimônio, resultado do dia e índice encadeado por data
+# O resumo lê essas tabelas, com custo proporcional ao número de ativos em
+# carteira e não ao de clientes ou alocações.
+
+def _insert(session: AsyncSession):
+    return pg_insert if session.bind.dialect.name == "postgresql" else sqlite_insert
+
+async def adjust_clients(session: AsyncSession, total: int = 0, active: int = 0) -> None:
+    if not (total or active):
+        return
+    t = models.ClientRollup.__table__
+    stmt = _insert(session)(t).values(id=1, total=total, active=active)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=["id"], set_={"total": t.c.total + total, "active": t.c.active + active},
+    ))
+
+async def adjust_positions(session: AsyncSession, deltas: dict[int, float]) -> None:
+    """Soma `{asset_id: variação de quantidade}` às posições da firma."""
+    values = [{"asset_id": a, "quantity": q} for a, q in deltas.items() if q]
+    if not values:
+        return
+    t = models.PositionRollup.__table__
+    stmt = _insert(session)(t)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=["asset_id"], set_={"quantity": t.c.quantity + stmt.excluded.quantity},
+    ), values)
+
+async def refresh_closes(session: AsyncSession, asset_ids: Iterable[int]) -> date | None:
+    """Copia os dois últimos fechamentos de cada ativo para `rollup_positions`.
+
+    Idempotente, então serve tanto para o fechamento diário quanto para
+    cargas que reescrevem o histórico. Retorna a data mais recente lida.
+    """
+    ids = list(asset_ids)
+    if not ids:
+        return None
+    dr = models.DailyReturn
+    rn = func.row_number().over(partition_by=dr.asset_id, order_by=dr.date.desc()).label("rn")
+    sub = select(dr.asset_id, dr.date, dr.close_price, rn).where(dr.asset_id.in_(ids)).subquery()
+    rows = (await session.execute(
+        select(sub.c.asset_id, sub.c.date, sub.c.close_price).where(sub.c.rn <= 2).order_by(sub.c.asset_id, sub.c.rn)
+    )).all()
+    closes: dict[int, dict[str, object]] = {}
+    for asset_id, d, close in rows:
+        if asset_id not in closes:
+            closes[asset_id] = {"asset_id": asset_id, "quantity": 0.0, "last_close": close, "prev_close": None, "last_close_date": d}
+        else:
+            closes[asset_id]["prev_close"] = close
+    if not closes:
+        return None
+    t = models.PositionRollup.__table__
+    stmt = _insert(session)(t)
+    await session.execute(stmt.on_conflict_do_update(index_elements=["asset_id"], set_={
+        "last_close": stmt.excluded.last_close, "prev_close": stmt.excluded.prev_close,
+        "last_close_date": stmt.excluded.last_close_date,
+    }), list(closes.values()))
+    return max(c["last_close_date"] for c in closes.values())  # type: ignore[type-var]
+
+async def snapshot(session: AsyncSession, day: date) -> None:
+    """Grava o patrimônio e o resultado de `day` em `rollup_daily`.
+
+    O índice é encadeado pelo resultado sobre o patrimônio do dia anterior,
+    então aportes e resgates não contam como rentabilidade. Datas anteriores
+    ao último registro (cargas retroativas) não são regravadas.
+    """
+    d, p = models.DailyRollup, models.PositionRollup
+    prev = (await session.execute(select(d).order_by(d.date.desc()).limit(2))).scalars().all()
+    if prev and prev[0].date > day:
+        return
+    if prev and prev[0].date == day:
+        prev = prev[1:]
+    aum, pnl = (await session.execute(select(
+        func.coalesce(func.sum(p.quantity * p.last_close), 0.0),
+        func.coalesce(func.sum(case((p.last_close_date == day, p.quantity * (p.last_close - p.prev_close)))), 0.0),
+    ))).one()
+    index = 1.0
+    if prev:
+        index = prev[0].index_value * (1 + pnl / prev[0].aum) if prev[0].aum else prev[0].index_value
+    t = d.__table__
+    stmt = _insert(session)(t).values(date=day, aum=aum, pnl=pnl, index_value=index)
+    await session.execute(stmt.on_conflict_do_update(index_elements=["date"], set_={
+        "aum": stmt.excluded.aum, "pnl": stmt.excluded.pnl, "index_value": stmt.excluded.index_value,
+    }))
+
+async def apply_closes(session: AsyncSession, asset_ids: Iterable[int]) -> None:
+    """Atualiza posições e o registro diário depois de novos fechamentos."""
+    last = await refresh_closes(session, asset_ids)
+    if last is not None:
+        await snapshot(session, last)
+
+async def summary(session: AsyncSession, today: date | None = None) -> schemas.DashboardSummary:
+    """Resumo do dashboard em três consultas sobre os agregados."""
+    today = today or date.today()
+    p, d, c = models.PositionRollup, models.DailyRollup, models.ClientRollup
+    clients = (await session.execute(select(c.total, c.active).where(c.id == 1))).first()
+    held = p.quantity != 0
+    latest = select(func.max(p.last_close_date)).where(held).scalar_subquery()
+    aum, change, as_of = (await session.execute(select(
+        func.coalesce(func.sum(p.quantity * p.last_close), 0.0),
+        func.coalesce(func.sum(case((p.last_close_date == latest, p.quantity * (p.last_close - p.prev_close)))), 0.0),
+        latest,
+    ).where(held))).one()
+    def _index_before(limit: date | None):
+        q = select(d.index_value)
+        if limit is not None:
+            q = q.where(d.date < limit)
+        return q.order_by(d.date.desc()).limit(1).scalar_subquery()
+    last_index, month_base, year_base = (await session.execute(select(
+        _index_before(None), _index_before(today.replace(day=1)), _index_before(today.replace(month=1, day=1)),
+    ))).one()
+    total, active = clients if clients else (0, 0)
+    base = aum - change
+    return schemas.DashboardSummary(
+        total_aum=aum, day_change=change, day_change_pct=change / base if base else None,
+        # Sem histórico antes do período, o índice parte de 1.0
+        mtd_return=last_index / (month_base or 1.0) - 1 if last_index is not None else None,
+        ytd_return=last_index / (year_base or 1.0) - 1 if last_index is not None else None,
+        as_of=as_of, clients_total=total, clients_active=active, clients_inactive=total - active,
+    )
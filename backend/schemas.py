@@ -1,7 +1,7 @@
 from __future__ import annotations
 from datetime import date, datetime
 from typing import List, Optional
-from pydantic import BaseModel, EmailStr, Field
+from pydantic import BaseModel, EmailStr, Field, model_validator
 
 class ClientBase(BaseModel):
     name: str = Field(..., max_length=255)
@@ -58,6 +58,56 @@ class AllocationOut(AllocationBase):
     profit_pct: Optional[float] = None
     class Config: from_attributes = True
 
+class AllocationImportRow(BaseModel):
+    """Linha de `POST /api/allocations:bulk`: o ativo vem por `ticker` ou `asset_id`."""
+    client_id: int
+    ticker: Optional[str] = Field(None, max_length=32)
+    asset_id: Optional[int] = None
+    name: Optional[str] = None
+    quantity: float = Field(..., gt=0)
+    purchase_price: float = Field(..., ge=0)
+    purchase_date: date
+
+    @model_validator(mode="after")
+    def _asset_ref(self) -> "AllocationImportRow":
+        if not self.ticker and self.asset_id is None:
+            raise ValueError("informe ticker ou asset_id")
+        if self.ticker:
+            self.ticker = self.ticker.strip().upper()
+        return self
+
+class BulkRowError(BaseModel):
+    line: int
+    error: str
+
+class BulkImportReport(BaseModel):
+    received: int = 0
+    inserted: int = 0
+    updated: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    assets_created: int = 0
+    errors: List[BulkRowError] = []
+    errors_truncated: bool = False
+    elapsed_seconds: float = 0.0
+    rows_per_second: float = 0.0
+
+class PriceImportReport(BaseModel):
+    received: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    duplicates: int = 0
+    skipped: int = 0
+    failed: int = 0
+    assets_created: int = 0
+    assets_affected: int = 0
+    unknown_tickers: List[str] = []
+    errors: List[BulkRowError] = []
+    errors_truncated: bool = False
+    elapsed_seconds: float = 0.0
+    rows_per_second: float = 0.0
+
 class DailyReturnBase(BaseModel):
     asset_id: int
     date: date
@@ -75,6 +125,71 @@ class PerformanceOut(BaseModel):
     client_id: int
     points: List[PerformancePoint]
 
+class PerformanceColumns(BaseModel):
+    # Forma colunar de PerformanceOut (`?shape=columnar`): listas paralelas
+    client_id: int
+    dates: List[date]
+    returns: List[float]
+
+class IntradayPoint(BaseModel):
+    timestamp: datetime  # início do intervalo
+    open: float
+    high: float
+    low: float
+    close: float
+    ticks: int
+
+class IntradaySeries(BaseModel):
+    symbol: str
+    interval_seconds: float
+    points: List[IntradayPoint]
+
+class ExportCreate(BaseModel):
+    """Pedido de `POST /api/exports`; positions e performance exigem `client_id`."""
+    kind: str = Field(..., pattern="^(positions|clients|performance|all_positions|prices)$")
+    format: str = Field("csv", pattern="^(csv|xlsx|parquet|arrow)$")
+    client_id: Optional[int] = None
+    start: Optional[date] = None  # performance e prices
+    end: Optional[date] = None
+    tickers: Optional[List[str]] = Field(None, max_length=1000)  # prices; padrão: todos
+
+    @model_validator(mode="after")
+    def _client_required(self) -> "ExportCreate":
+        if self.kind in ("positions", "performance") and self.client_id is None:
+            raise ValueError(f"client_id é obrigatório para {self.kind}")
+        return self
+
+class ExportJob(BaseModel):
+    id: str
+    kind: str
+    format: str
+    client_id: Optional[int] = None
+    status: str  # queued|running|done|failed
+    progress: float = 0.0  # fração (0..1)
+    rows: int = 0
+    total: Optional[int] = None
+    size: Optional[int] = None  # bytes do arquivo pronto
+    start: Optional[date] = None
+    end: Optional[date] = None
+    tickers: Optional[List[str]] = None
+    filename: str
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    download_url: Optional[str] = None
+
+class DashboardSummary(BaseModel):
+    # Retornos em fração (0.05 = 5%), como em AllocationOut
+    total_aum: float = 0.0
+    day_change: float = 0.0
+    day_change_pct: Optional[float] = None
+    mtd_return: Optional[float] = None
+    ytd_return: Optional[float] = None
+    as_of: Optional[date] = None
+    clients_total: int = 0
+    clients_active: int = 0
+    clients_inactive: int = 0
+
 class User(BaseModel):
     username: EmailStr
     full_name: str
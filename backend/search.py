@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import json
+import logging
+import os
+import time
+from collections.abc import Iterable
+from typing import Any
+
+from sqlalchemy import select
+
+import metrics
+import models
+import pricing
+
+logger = logging.getLogger("search")
+
+# Autocomplete de tickers para `/api/assets/search`. Responde primeiro de um
+# índice em memória (por processo) com os ativos cadastrados e os resultados
+# do Yahoo já vistos: prefixo do símbolo por busca binária numa lista
+# ordenada e trecho do símbolo/nome por trigramas. O Yahoo só é consultado
+# para termos ainda não vistos; a resposta fica no Redis (`search:q:{termo}`,
+# SEARCH_CACHE_TTL) para os demais workers, e buscas idênticas simultâneas
+# compartilham uma única chamada.
+LIMIT = int(os.environ.get("SEARCH_LIMIT", "10"))
+CACHE_TTL = int(os.environ.get("SEARCH_CACHE_TTL", "86400"))
+INDEX_REFRESH = float(os.environ.get("SEARCH_INDEX_REFRESH", "60"))  # s entre recargas dos ativos
+UPSTREAM_TIMEOUT = float(os.environ.get("SEARCH_UPSTREAM_TIMEOUT", "3"))
+MEMORY = int(os.environ.get("SEARCH_MEMORY", "10000"))  # termos lembrados por processo
+MAX_QUERY = 32
+
+def normalize(q: str) -> str:
+    return " ".join(q.strip().upper().split())[:MAX_QUERY]
+
+def _trigrams(text: str) -> set[str]:
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+class TickerIndex:
+    """Símbolos e nomes indexados por prefixo do símbolo e por trigramas."""
+
+    def __init__(self) -> None:
+        self.names: dict[str, str] = {}
+        self._sorted: list[str] = []
+        self._texts: dict[str, str] = {}
+        self._grams: dict[str, set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, symbol: str, name: str | None = None) -> None:
+        symbol = symbol.strip().upper()
+        if not symbol:
+            return
+        known = self.names.get(symbol)
+        if known is not None and (known or not name):
+            return  # já indexado (com nome, ou sem nome novo para acrescentar)
+        if known is None:
+            bisect.insort(self._sorted, symbol)
+        else:
+            for g in _trigrams(self._texts[symbol]):
+                self._grams[g].discard(symbol)
+        self.names[symbol] = name or ""
+        text = f"{symbol} {(name or '').upper()}".strip()
+        self._texts[symbol] = text
+        for g in _trigrams(text):
+            self._grams.setdefault(g, set()).add(symbol)
+
+    def add_many(self, items: Iterable[tuple[str, str | None]]) -> None:
+        for symbol, name in items:
+            self.add(symbol, name)
+
+    def _prefix(self, q: str, limit: int) -> list[str]:
+        i = bisect.bisect_left(self._sorted, q)
+        out = []
+        while i < len(self._sorted) and len(out) < limit and self._sorted[i].startswith(q):
+            out.append(self._sorted[i])
+            i += 1
+        return out
+
+    def search(self, q: str, limit: int = LIMIT) -> list[dict[str, str]]:
+        """Prefixos do símbolo primeiro (o exato antes), depois trechos do símbolo ou nome."""
+        q = normalize(q)
+        if not q:
+            return []
+        hits = self._prefix(q, limit)
+        if len(hits) < limit and len(q) >= 3:
+            grams = sorted(_trigrams(q), key=lambda g: len(self._grams.get(g, ())))
+            candidates = set(self._grams.get(grams[0], ())) if grams else set()
+            for g in grams[1:]:
+                if not candidates:
+                    break
+                candidates &= self._grams.get(g, set())
+            seen = set(hits)
+            extra = [s for s in candidates if s not in seen and q in self._texts[s]]
+            extra.sort(key=lambda s: (self._texts[s].find(q), len(s), s))
+            hits += extra[:limit - len(hits)]
+        return [{"symbol": s, "shortname": self.names[s] or None} for s in hits]
+
+index = TickerIndex()
+_loaded_at = 0.0
+_load_lock = asyncio.Lock()
+# Termos já consultados no Yahoo (ou no cache do Redis) por este processo, com
+# a resposta, e os que vieram com menos de LIMIT resultados: buscas que os
+# estendem não trazem nada novo do Yahoo e ficam só no índice.
+_queried: dict[str, tuple[float, list[dict[str, Any]]]] = {}
+_complete: dict[str, float] = {}
+_inflight: dict[str, asyncio.Task[list[dict[str, Any]]]] = {}
+
+async def refresh(session: Any, force: bool = False) -> None:
+    """Carrega os ativos cadastrados no índice (no máximo a cada SEARCH_INDEX_REFRESH s)."""
+    global _loaded_at
+    if not force and time.monotonic() - _loaded_at < INDEX_REFRESH:
+        return
+    async with _load_lock:
+        if not force and time.monotonic() - _loaded_at < INDEX_REFRESH:
+            return
+        rows = (await session.execute(select(models.Asset.ticker, models.Asset.name))).all()
+        index.add_many(rows)
+        _loaded_at = time.monotonic()
+
+def _remember(table: dict[str, Any], key: str, value: Any) -> None:
+    table.pop(key, None)
+    table[key] = value
+    while len(table) > MEMORY:  # descarta o mais antigo (ordem de inserção)
+        table.pop(next(iter(table)))
+
+def _seen(q: str) -> list[dict[str, Any]] | None:
+    """Resposta já conhecida do Yahoo para `q` (vazia se um prefixo veio completo), ou None."""
+    now = time.monotonic()
+    entry = _queried.get(q)
+    if entry is not None and now - entry[0] < CACHE_TTL:
+        return entry[1]
+    if any(now - _complete.get(q[:i], -CACHE_TTL) < CACHE_TTL for i in range(1, len(q))):
+        return []
+    return None
+
+def _merge(hits: list[dict[str, Any]], results: list[dict[str, Any]], limit: int) -> list[dict[str, Any]]:
+    seen = {h["symbol"] for h in hits}
+    return (hits + [r for r in results if r.get("symbol") and r["symbol"] not in seen])[:limit]
+
+def _cache_key(q: str) -> str:
+    return f"search:q:{q}"
+
+async def _upstream(q: str) -> list[dict[str, Any]]:
+    """Redis e depois Yahoo; o resultado entra no índice e no cache compartilhado."""
+    source = "cache"
+    results: list[dict[str, Any]] | None = None
+    r = None
+    try:
+        r = await pricing._get_redis()
+        raw = await r.get(_cache_key(q))
+        results = json.loads(raw) if raw else None
+    except Exception as e:
+        logger.warning("Cache de busca indisponível: %s", e)
+    if results is None:
+        source = "upstream"
+        results = await asyncio.wait_for(pricing.yahoo_search(q, retries=1), UPSTREAM_TIMEOUT)
+        if r is not None:
+            try:
+                await r.set(_cache_key(q), json.dumps(results), ex=CACHE_TTL)
+            except Exception as e:
+                logger.warning("Falha ao gravar busca em cache: %s", e)
+    metrics.SEARCH_REQUESTS.labels(source).inc()
+    index.add_many((item["symbol"], item.get("shortname")) for item in results if item.get("symbol"))
+    now = time.monotonic()
+    _remember(_queried, q, (now, results))
+    if len(results) < LIMIT:
+        _remember(_complete, q, now)
+    return results
+
+def _done(q: str, task: asyncio.Task[Any]) -> None:
+    _inflight.pop(q, None)
+    if not task.cancelled():
+        task.exception()  # marca como lida mesmo que ninguém mais aguarde
+
+async def _single_flight(q: str) -> list[dict[str, Any]]:
+    """Uma chamada por termo: buscas idênticas simultâneas aguardam a mesma task.
+
+    A task não pertence a nenhuma requisição, então um cliente que desiste
+    não cancela a busca dos demais.
+    """
+    task = _inflight.get(q)
+    if task is None:
+        task = asyncio.ensure_future(_upstream(q))
+        _inflight[q] = task
+        task.add_done_callback(lambda t: _done(q, t))
+    return await asyncio.shield(task)
+
+async def search(q: str, session: Any = None, limit: int = LIMIT) -> list[dict[str, Any]]:
+    """Sugestões para `q` (`symbol`, `shortname`); sem Yahoo, responde só com o índice."""
+    q = normalize(q)
+    if not q:
+        return []
+    if session is not None:
+        try:
+            await refresh(session)
+        except Exception as e:
+            logger.warning("Falha ao carregar ativos no índice de busca: %s", e)
+    hits = index.search(q, limit)
+    # Ticker conhecido ou lista cheia: nada a buscar fora
+    known = [] if len(hits) >= limit or (hits and hits[0]["symbol"] == q) else _seen(q)
+    if known is not None:
+        metrics.SEARCH_REQUESTS.labels("index").inc()
+        return _merge(hits, known, limit)
+    try:
+        results = await _single_flight(q)
+    except Exception as e:
+        metrics.SEARCH_REQUESTS.labels("error").inc()
+        logger.warning("Busca no Yahoo falhou para %r: %s", q, e)
+        return hits
+    return _merge(index.search(q, limit), results, limit)
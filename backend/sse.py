@@ -0,0 +1,137 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import uuid
+from collections import deque
+from collections.abc import AsyncIterator, Iterable
+from datetime import datetime
+from typing import Any
+
+from price_feed import feed
+
+# Cotações por Server-Sent Events (`GET /api/stream/prices?symbols=...`), para
+# clientes atrás de proxies que derrubam WebSockets. Os ticks vêm do mesmo
+# `price_feed` dos WebSockets e ficam num buffer circular com ids crescentes;
+# ao reconectar, o navegador envia `Last-Event-ID` e recebe só o que perdeu.
+BUFFER_SIZE = int(os.environ.get("SSE_BUFFER_SIZE", "1000"))
+KEEPALIVE = float(os.environ.get("SSE_KEEPALIVE", "15"))
+QUEUE_SIZE = int(os.environ.get("SSE_QUEUE_SIZE", "256"))
+RETRY_MS = int(os.environ.get("SSE_RETRY_MS", "3000"))
+MAX_SYMBOLS = int(os.environ.get("WS_MAX_SYMBOLS", "200"))
+
+Tick = tuple[int, str, dict[str, Any]]  # (sequência, ticker, payload)
+
+class _Subscriber:
+    def __init__(self, symbols: set[str]) -> None:
+        self.symbols = symbols
+        self.queue: asyncio.Queue[Tick] = asyncio.Queue(QUEUE_SIZE)
+        self.overflowed = False
+
+class TickHub:
+    """Numera os ticks do `price_feed` e os distribui aos streams SSE.
+
+    Os ids têm o formato `<época>-<sequência>`; a época muda a cada processo,
+    então um id de outro worker ou anterior a um restart cai no snapshot.
+    """
+
+    def __init__(self, size: int = BUFFER_SIZE) -> None:
+        self.epoch = uuid.uuid4().hex[:8]
+        self.seq = 0
+        self.buffer: deque[Tick] = deque(maxlen=size)
+        self.subscribers: dict[str, set[_Subscriber]] = {}
+
+    def event_id(self, seq: int) -> str:
+        return f"{self.epoch}-{seq}"
+
+    def on_quotes(self, changed: Iterable[str]) -> None:
+        timestamp = datetime.now().isoformat()
+        for symbol in changed:
+            quote = feed.quotes.get(symbol)
+            if quote is None:
+                continue
+            self.seq += 1
+            tick = (self.seq, symbol, {"ticker": symbol, **quote, "timestamp": timestamp})
+            self.buffer.append(tick)
+            for sub in self.subscribers.get(symbol, ()):
+                try:
+                    sub.queue.put_nowait(tick)
+                except asyncio.QueueFull:
+                    # Cliente lento: o stream é encerrado e a reconexão repõe pelo buffer
+                    sub.overflowed = True
+
+    def attach(self, symbols: set[str]) -> _Subscriber:
+        sub = _Subscriber(symbols)
+        for s in symbols:
+            self.subscribers.setdefault(s, set()).add(sub)
+        return sub
+
+    def detach(self, sub: _Subscriber) -> None:
+        for s in sub.symbols:
+            subs = self.subscribers.get(s)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self.subscribers[s]
+
+    def since(self, last_event_id: str, symbols: set[str]) -> tuple[int, list[Tick]] | None:
+        """Ticks de `symbols` posteriores ao id; None se o buffer não cobre a lacuna."""
+        epoch, _, seq = last_event_id.partition("-")
+        if epoch != self.epoch or not seq.isdigit() or int(seq) > self.seq:
+            return None
+        last = int(seq)
+        if last < self.seq and (not self.buffer or self.buffer[0][0] > last + 1):
+            return None
+        return last, [t for t in self.buffer if t[0] > last and t[1] in symbols]
+
+hub = TickHub()
+feed.listeners.append(hub.on_quotes)
+
+def parse_symbols(raw: str) -> list[str]:
+    """`AAPL,petr4.sa` -> `["AAPL", "PETR4.SA"]`, sem repetições."""
+    symbols = list(dict.fromkeys(s.strip().upper() for s in raw.split(",") if s.strip()))
+    if not symbols:
+        raise ValueError("Informe ao menos um símbolo")
+    if len(symbols) > MAX_SYMBOLS:
+        raise ValueError(f"Limite de {MAX_SYMBOLS} símbolos por stream")
+    return symbols
+
+def _event(event: str, event_id: str, data: dict[str, Any]) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+async def event_stream(symbols: list[str], last_event_id: str | None = None) -> AsyncIterator[str]:
+    """Gera o stream SSE: replay ou snapshot, depois um evento `tick` por cotação.
+
+    A assinatura é registrada antes do replay, e ticks já enviados são
+    descartados pela sequência, então nada se perde entre as duas fases.
+    """
+    sub = hub.attach(set(symbols))
+    feed.subscribe(symbols)
+    try:
+        yield f"retry: {RETRY_MS}\n\n"
+        resumed = hub.since(last_event_id, sub.symbols) if last_event_id else None
+        if resumed is None:
+            quotes = await feed.ensure(symbols)
+            sent = hub.seq
+            yield _event("snapshot", hub.event_id(sent), {
+                "timestamp": datetime.now().isoformat(),
+                "data": [{"ticker": s, **quotes[s]} for s in symbols if s in quotes],
+            })
+        else:
+            sent, missed = resumed
+            for seq, _, payload in missed:
+                sent = seq
+                yield _event("tick", hub.event_id(seq), payload)
+        while not sub.overflowed:
+            try:
+                seq, _, payload = await asyncio.wait_for(sub.queue.get(), KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"  # mantém proxies e balanceadores com a conexão aberta
+                continue
+            if seq > sent:
+                sent = seq
+                yield _event("tick", hub.event_id(seq), payload)
+    finally:
+        hub.detach(sub)
+        feed.unsubscribe(symbols)
@@ -4,25 +4,75 @@ from datetime import date
 from celery import Celery
 from celery.schedules import crontab
 from sqlalchemy import select
-from .database import async_session
-from . import models
+from .database import async_session, engine
+from . import cache_warming, exports, http_cache, metrics, models, partitions, price_store, rollups
 from .pricing import get_previous_close
 
 broker_url = os.environ.get("REDIS_URL","redis://localhost:6379/0")
 celery_app = Celery("tasks", broker=broker_url, backend=broker_url)
 HOUR = int(os.environ.get("BEAT_HOUR","2")); MINUTE=int(os.environ.get("BEAT_MINUTE","0"))
-celery_app.conf.beat_schedule = {"update-daily-returns":{"task":"backend.tasks.update_daily_returns","schedule": crontab(hour=HOUR, minute=MINUTE)}}
+celery_app.conf.beat_schedule = {
+    "update-daily-returns":{"task":"backend.tasks.update_daily_returns","schedule": crontab(hour=HOUR, minute=MINUTE)},
+    # Partições de daily_returns: cria as do próximo ano com folga e arquiva as antigas
+    "ensure-daily-return-partitions":{"task":"backend.tasks.ensure_daily_return_partitions","schedule": crontab(hour=HOUR, minute=MINUTE, day_of_month=1)},
+    "archive-daily-return-partitions":{"task":"backend.tasks.archive_daily_return_partitions","schedule": crontab(hour=HOUR, minute=MINUTE, day_of_month=1, month_of_year=1)},
+}
+if cache_warming.ENABLED:
+    # Mantém price:/prev: dos tickers em carteira aquecidos (ver cache_warming.py)
+    celery_app.conf.beat_schedule["warm-price-cache"] = {"task": "backend.tasks.warm_price_cache", "schedule": cache_warming.TICK}
 celery_app.conf.timezone = "UTC"
+metrics.instrument_celery(celery_app)
 
 @celery_app.task(name="backend.tasks.update_daily_returns")
 def update_daily_returns() -> None:
     async def _run():
         async with async_session() as session:  # type: ignore[call-arg]
             res = await session.execute(select(models.Asset)); assets = res.scalars().all()
+            written = []
             for asset in assets:
                 price = await get_previous_close(asset.ticker)
                 if price is None: continue
                 dr = models.DailyReturn(asset_id=asset.id, date=date.today(), close_price=price)
-                session.add(dr)
+                session.add(dr); written.append(asset.id)
+            await session.flush()
+            # Fechamentos novos entram nos agregados do dashboard na mesma transação
+            await rollups.apply_closes(session, written)
             await session.commit()
+            await http_cache.bump(*(http_cache.asset_key(a) for a in written))
+            metrics.DAILY_RETURNS_ROWS.inc(len(written))
+            # Acrescenta ao price_store os pregões encerrados (se configurado)
+            store = price_store.get_store()
+            if store is not None:
+                await store.sync(session)
     asyncio.run(_run())
+
+@celery_app.task(name="backend.tasks.ensure_daily_return_partitions")
+def ensure_daily_return_partitions() -> list:
+    async def _run():
+        async with engine.begin() as conn:
+            return await partitions.ensure_partitions(conn)
+    return asyncio.run(_run())
+
+@celery_app.task(name="backend.tasks.archive_daily_return_partitions")
+def archive_daily_return_partitions() -> list:
+    return asyncio.run(partitions.archive_old_partitions(engine))
+
+@celery_app.task(name="backend.tasks.run_export")
+def run_export(job_id: str) -> None:
+    # Progresso e falhas ficam no registro do job (ver exports.run_job)
+    asyncio.run(exports.run_job(job_id))
+
+@celery_app.task(name="backend.tasks.warm_price_cache")
+def warm_price_cache() -> int:
+    async def _run():
+        async with async_session() as session:  # type: ignore[call-arg]
+            return await cache_warming.schedule(session)
+    batches = asyncio.run(_run())
+    for delay, symbols in batches:
+        # Lotes espaçados dentro do tick; os que atrasarem além dele são descartados
+        warm_price_batch.apply_async(args=[symbols], countdown=delay, expires=delay + cache_warming.TICK)
+    return sum(len(b) for _, b in batches)
+
+@celery_app.task(name="backend.tasks.warm_price_batch")
+def warm_price_batch(symbols: list) -> int:
+    return asyncio.run(cache_warming.refresh_batch(symbols))
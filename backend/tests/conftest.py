@@ -17,7 +17,8 @@ async def test_app():
     from database import Base
     Base.metadata.clear()
     
-    from database import get_session
+    from database import get_read_session, get_session
+    from http_cache import get_cache_session
     from api import create_app
     
     database_url = "sqlite+aiosqlite:///:memory:"
@@ -33,6 +34,8 @@ async def test_app():
     
     app = create_app()
     app.dependency_overrides[get_session] = _get_session_override
+    app.dependency_overrides[get_read_session] = _get_session_override
+    app.dependency_overrides[get_cache_session] = _get_session_override
     
     async with AsyncClient(app=app, base_url="http://test") as ac:
         yield ac
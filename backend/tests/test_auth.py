@@ -2,3 +2,35 @@ async def test_login_admin(test_app):
     resp = await test_app.post("/api/token", data={"username": "admin@example.com", "password": "admin123"})
     assert resp.status_code == 200
     assert resp.json()["access_token"]
+
+async def test_login_does_not_block_event_loop(test_app):
+    import asyncio, time
+    # Enquanto dois logins verificam bcrypt, o loop continua atendendo
+    ticks = 0
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.005); ticks += 1
+    t = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    ok, bad = await asyncio.gather(
+        test_app.post("/api/token", data={"username": "reader@example.com", "password": "reader123"}),
+        test_app.post("/api/token", data={"username": "nobody@example.com", "password": "x"}),
+    )
+    elapsed = time.perf_counter() - started
+    t.cancel()
+    assert ok.status_code == 200 and bad.status_code == 401
+    assert ticks >= elapsed / 0.005 * 0.5
+
+async def test_token_claims_cache(test_app, monkeypatch):
+    import auth
+    token = (await test_app.post("/api/token", data={"username": "admin@example.com", "password": "admin123"})).json()["access_token"]
+    calls = []
+    real_decode = auth.jwt.decode
+    monkeypatch.setattr(auth.jwt, "decode", lambda *a, **k: calls.append(1) or real_decode(*a, **k))
+    auth._token_cache.clear()
+    for _ in range(3):
+        assert (await test_app.get("/api/clients", headers={"Authorization": f"Bearer {token}"})).status_code == 200
+    assert len(calls) == 1
+    assert (await test_app.get("/api/clients", headers={"Authorization": "Bearer invalido"})).status_code == 401
+    assert "invalido" not in auth._token_cache
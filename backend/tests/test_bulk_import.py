@@ -0,0 +1,64 @@
+import json
+
+
+async def _admin(test_app):
+    token = (await test_app.post("/api/token", data={"username": "admin@example.com", "password": "admin123"})).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+async def test_bulk_import_csv_and_ndjson(test_app):
+    h = await _admin(test_app)
+    cid = (await test_app.post("/api/clients", json={"name": "Bulk", "email": "bulk@example.com"}, headers=h)).json()["id"]
+
+    csv_body = "\n".join([
+        "client_id,ticker,quantity,purchase_price,purchase_date",
+        f"{cid},bulk1,10,20.5,2024-01-02",
+        f"{cid},BULK2,5,10,2024-01-03",
+        f"{cid},BULK1,10,20.5,2024-01-02",   # repetida no arquivo
+        f"{cid},BULK3,-1,10,2024-01-03",     # quantidade inválida
+        "999999,BULK1,1,1,2024-01-04",       # cliente inexistente
+        f"{cid},BULK1,1,1",                  # colunas faltando
+    ])
+    async def body():
+        for i in range(0, len(csv_body), 7):  # chega em pedaços que cortam linhas
+            yield csv_body[i:i + 7].encode()
+    r = await test_app.post("/api/allocations:bulk", content=body(), headers={**h, "Content-Type": "text/csv"})
+    assert r.status_code == 200, r.text
+    rep = r.json()
+    assert (rep["received"], rep["inserted"], rep["failed"], rep["assets_created"]) == (6, 2, 4, 2)
+    assert [e["line"] for e in rep["errors"]] == [4, 5, 6, 7]
+    assert "linha 2" in rep["errors"][0]["error"] and "quantity" in rep["errors"][1]["error"]
+
+    allocs = (await test_app.get(f"/api/clients/{cid}/allocations", headers=h)).json()
+    assert sorted(a["quantity"] for a in allocs) == [5, 10]
+
+    ndjson = "\n".join(json.dumps(r) for r in [
+        {"client_id": cid, "ticker": "BULK1", "quantity": 10, "purchase_price": 20.5, "purchase_date": "2024-01-02"},
+        {"client_id": cid, "ticker": "BULK4", "quantity": 1, "purchase_price": 3, "purchase_date": "2024-01-05"},
+        "nao e objeto",
+    ]) + "\n{quebrado"
+    r = await test_app.post("/api/allocations:bulk", content=ndjson.encode(), headers={**h, "Content-Type": "application/x-ndjson"})
+    rep = r.json()
+    assert (rep["inserted"], rep["duplicates"], rep["failed"]) == (1, 1, 2)
+    assert [e["line"] for e in rep["errors"]] == [1, 3, 4]
+
+    r = await test_app.post("/api/allocations:bulk?format=ndjson&on_conflict=update", headers=h, content=json.dumps(
+        {"client_id": cid, "ticker": "BULK1", "quantity": 12, "purchase_price": 21, "purchase_date": "2024-01-02"}).encode())
+    assert (r.json()["updated"], r.json()["inserted"]) == (1, 0)
+
+    assert (await test_app.post("/api/allocations:bulk", content=b"x", headers={**h, "Content-Type": "text/plain"})).status_code == 415
+
+
+async def test_csv_quoted_field_spans_lines_and_chunks():
+    import bulk_import
+    body = 'ticker,name,note\r\nAAA,"Alpha, Inc.","linha 1\r\nlinha ""2""\r\n"\r\n\r\nBBB,Beta,ok\r\nCCC,"sem fim\n'
+
+    async def chunks():
+        for i in range(0, len(body), 5):
+            yield body[i:i + 5].encode()
+
+    out = [(n, r if isinstance(r, dict) else str(r)) for n, r in [x async for x in bulk_import.iter_records(chunks(), "csv")]]
+    assert out == [
+        (2, {"ticker": "AAA", "name": "Alpha, Inc.", "note": 'linha 1\nlinha "2"'}),
+        (6, {"ticker": "BBB", "name": "Beta", "note": "ok"}),
+        (7, "aspas não fechadas no fim do arquivo"),
+    ]
@@ -0,0 +1,121 @@
+from datetime import UTC, date, datetime
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+
+class MemoryZSets:
+    """Subconjunto de sorted sets do Redis usado pelo cache_warming."""
+
+    def __init__(self):
+        self.z = {}
+
+    async def zadd(self, key, mapping, nx=False):
+        zset = self.z.setdefault(key, {})
+        for member, score in mapping.items():
+            if not (nx and member in zset):
+                zset[member] = score
+
+    async def zrem(self, key, *members):
+        for m in members:
+            self.z.get(key, {}).pop(m, None)
+
+    async def zrange(self, key, start, end):
+        return [m for m, _ in sorted(self.z.get(key, {}).items(), key=lambda kv: (kv[1], kv[0]))]
+
+    async def zrangebyscore(self, key, low, high):
+        high = float("inf") if high == "+inf" else high
+        return [m for m in await self.zrange(key, 0, -1) if self.z[key][m] <= high]
+
+
+def test_market_hours():
+    from cache_warming import (
+        B3,
+        CLOSED_INTERVAL,
+        OPEN_INTERVAL,
+        US,
+        interval_for,
+        is_active,
+        market_for,
+    )
+    assert market_for("petr4.sa") is B3 and market_for("AAPL") is US
+    mon_14utc = datetime(2024, 6, 10, 14, 0, tzinfo=UTC)  # 11:00 em SP, 10:00 em NY
+    assert is_active(B3, mon_14utc) and is_active(US, mon_14utc)
+    mon_1330utc = datetime(2024, 6, 10, 13, 30, tzinfo=UTC)  # 10:30 SP; 09:30 NY
+    assert is_active(B3, mon_1330utc) and is_active(US, mon_1330utc)
+    mon_13utc = datetime(2024, 6, 10, 13, 0, tzinfo=UTC)  # NY 09:00: pré-abertura (30 min)
+    assert is_active(US, mon_13utc)
+    assert not is_active(US, datetime(2024, 6, 10, 12, 30, tzinfo=UTC))
+    mon_21utc = datetime(2024, 6, 10, 21, 0, tzinfo=UTC)  # 18:00 SP; 17:00 NY
+    assert not is_active(B3, mon_21utc) and not is_active(US, mon_21utc)
+    saturday = datetime(2024, 6, 8, 15, 0, tzinfo=UTC)
+    assert not is_active(B3, saturday) and not is_active(US, saturday)
+    # Fora do horário de verão de NY: 14:00 UTC em janeiro são 09:00 em NY (pré-abertura)
+    assert is_active(US, datetime(2024, 1, 8, 14, 0, tzinfo=UTC))
+    assert not is_active(US, datetime(2024, 1, 8, 13, 30, tzinfo=UTC))
+    assert interval_for("VALE3.SA", mon_21utc) == CLOSED_INTERVAL and interval_for("VALE3.SA", mon_14utc) == OPEN_INTERVAL
+
+
+def test_plan_spreads_batches_within_budget():
+    from cache_warming import plan
+    due = [f"T{i:03d}" for i in range(230)]
+    batches = plan(due, tick=60, batch_size=50, max_rps=0.5)
+    assert [d for d, _ in batches] == [0, 12, 24, 36, 48] and [len(b) for _, b in batches] == [50, 50, 50, 50, 30]
+    capped = plan(due, tick=60, batch_size=50, max_rps=1 / 30)  # 2 lotes por tick: sobra para o próximo
+    assert [d for d, _ in capped] == [0, 30] and capped[1][1][-1] == "T099"
+    assert plan([], tick=60) == []
+
+
+@pytest.mark.asyncio
+async def test_schedule_tracks_holdings_and_due_times(monkeypatch):
+    import cache_warming
+    import crud
+    import pricing
+    import schemas
+    from database import Base
+    r = MemoryZSets()
+
+    async def get_redis():
+        return r
+
+    refreshed = []
+
+    async def refresh_quotes(symbols):
+        refreshed.append(symbols)
+        if "FAIL3.SA" in symbols:
+            raise RuntimeError("429")
+        return len(symbols)
+
+    monkeypatch.setattr(pricing, "_get_redis", get_redis)
+    monkeypatch.setattr(pricing, "refresh_quotes", refresh_quotes)
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as s:
+        c = await crud.create_client(s, schemas.ClientCreate(name="Warm", email="warm@example.com"))
+        assets = {t: await crud.create_asset(s, schemas.AssetCreate(ticker=t)) for t in ("WARM3.SA", "AAPL", "IDLE3.SA")}
+        for t in ("WARM3.SA", "AAPL"):
+            await crud.create_allocation(s, schemas.AllocationCreate(client_id=c.id, asset_id=assets[t].id, quantity=1, purchase_price=1, purchase_date=date(2024, 1, 2)))
+        r.z[cache_warming.DUE_KEY] = {"SOLD3.SA": 0}
+
+        # Segunda 18:00 em SP e 17:00 em NY: ambos fechados
+        now = datetime(2024, 6, 10, 21, 0, tzinfo=UTC).timestamp()
+        batches = await cache_warming.schedule(s, now=now, tick=60)
+        assert batches == [(0, ["AAPL", "WARM3.SA"])]
+        assert set(r.z[cache_warming.DUE_KEY]) == {"AAPL", "WARM3.SA"}  # vendido sai; sem posição não entra
+        assert r.z[cache_warming.DUE_KEY]["AAPL"] == now + cache_warming.CLOSED_INTERVAL
+        assert await cache_warming.schedule(s, now=now + 60, tick=60) == []
+
+        # Janeiro, 20:30 UTC: NY aberta (15:30) e B3 fechada (17:30); cada um vence pelo seu pregão
+        later = datetime(2024, 1, 8, 20, 30, tzinfo=UTC).timestamp()
+        r.z[cache_warming.DUE_KEY] = {"AAPL": later, "WARM3.SA": later}
+        assert await cache_warming.schedule(s, now=later, tick=60) == [(0, ["AAPL", "WARM3.SA"])]
+        assert r.z[cache_warming.DUE_KEY]["AAPL"] == later + cache_warming.OPEN_INTERVAL
+        assert r.z[cache_warming.DUE_KEY]["WARM3.SA"] == later + cache_warming.CLOSED_INTERVAL
+
+    assert await cache_warming.refresh_batch(["AAPL"]) == 1
+    assert await cache_warming.refresh_batch(["FAIL3.SA"]) == 0
+    assert refreshed == [["AAPL"], ["FAIL3.SA"]]
+    assert r.z[cache_warming.DUE_KEY]["FAIL3.SA"] <= datetime.now(UTC).timestamp()  # volta a vencer
+    await engine.dispose()
@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import event, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+
+@pytest.mark.asyncio
+async def test_delete_asset_is_one_statement():
+    import crud
+    import models
+    from database import Base
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as s:
+        client = models.Client(name="Cascade", email="cascade@example.com")
+        asset = models.Asset(ticker="CASC")
+        s.add_all([client, asset])
+        await s.flush()
+        s.add(models.Allocation(client_id=client.id, asset_id=asset.id, quantity=1, purchase_price=1, purchase_date=date(2024, 1, 1)))
+        s.add_all([models.DailyReturn(asset_id=asset.id, date=date(2024, 1, 1) + timedelta(days=i), close_price=1) for i in range(500)])
+        await s.commit()
+        asset_id, client_id = asset.id, client.id
+        s.expunge_all()
+
+        statements = []
+        def _capture(conn, cursor, statement, *args):
+            statements.append(statement.split()[0].upper())
+        event.listen(engine.sync_engine, "before_cursor_execute", _capture)
+        assert await crud.delete_asset(s, asset_id) is True
+        event.remove(engine.sync_engine, "before_cursor_execute", _capture)
+        assert statements == ["DELETE"]
+        assert (await s.execute(select(func.count()).select_from(models.DailyReturn))).scalar() == 0
+        assert (await s.execute(select(func.count()).select_from(models.Allocation))).scalar() == 0
+        assert await crud.delete_asset(s, asset_id) is False
+        assert await crud.delete_client(s, client_id) is True
+        assert await crud.delete_allocation(s, 12345) is False
+    await engine.dispose()
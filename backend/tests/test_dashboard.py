@@ -0,0 +1,72 @@
+from datetime import date
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+
+async def _closes(session, *rows):
+    import price_import
+    async def body():
+        yield ("ticker,date,close\n" + "\n".join(",".join(map(str, r)) for r in rows)).encode()
+    await price_import.import_prices(session, body(), "csv")
+
+@pytest.mark.asyncio
+async def test_dashboard_summary_endpoint(test_app):
+    from query_stats import assert_max_queries
+    token = (await test_app.post("/api/token", data={"username": "admin@example.com", "password": "admin123"})).json()["access_token"]
+    h = {"Authorization": f"Bearer {token}"}
+    before = (await test_app.get("/api/dashboard/summary", headers=h)).json()
+    await test_app.post("/api/clients", json={"name": "Summary", "email": "summary@example.com"}, headers=h)
+    with assert_max_queries(3):
+        r = await test_app.get("/api/dashboard/summary", headers=h)
+    assert r.status_code == 200
+    after = r.json()
+    assert after["clients_total"] == before["clients_total"] + 1
+    assert after["clients_active"] == before["clients_active"] + 1
+
+@pytest.mark.asyncio
+async def test_rollups_follow_allocations_and_closes():
+    import crud
+    import rollups
+    import schemas
+    from database import Base
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    feb = date(2024, 2, 15)
+    async with Session() as s:
+        a = await crud.create_client(s, schemas.ClientCreate(name="A", email="a@dash.com"))
+        b = await crud.create_client(s, schemas.ClientCreate(name="B", email="b@dash.com"))
+        await crud.update_client(s, b, schemas.ClientUpdate(is_active=False))
+        x = await crud.create_asset(s, schemas.AssetCreate(ticker="DASHX"))
+        await crud.create_allocation(s, schemas.AllocationCreate(client_id=a.id, asset_id=x.id, quantity=10, purchase_price=90, purchase_date=date(2024, 1, 2)))
+
+        await _closes(s, ("DASHX", "2024-01-31", 100))
+        await _closes(s, ("DASHX", "2024-02-01", 110))
+        await _closes(s, ("DASHX", "2024-02-02", 121))
+        out = await rollups.summary(s, today=feb)
+        assert (out.clients_total, out.clients_active, out.clients_inactive) == (2, 1, 1)
+        assert out.total_aum == pytest.approx(1210) and out.day_change == pytest.approx(110)
+        assert out.day_change_pct == pytest.approx(0.1) and out.as_of == date(2024, 2, 2)
+        assert out.mtd_return == pytest.approx(0.21) and out.ytd_return == pytest.approx(0.21)
+        assert (await rollups.summary(s, today=date(2024, 3, 1))).mtd_return == pytest.approx(0)
+
+        # Aporte não conta como rentabilidade
+        alloc = await crud.create_allocation(s, schemas.AllocationCreate(client_id=b.id, asset_id=x.id, quantity=10, purchase_price=121, purchase_date=date(2024, 2, 2)))
+        await _closes(s, ("DASHX", "2024-02-05", 121))
+        out = await rollups.summary(s, today=feb)
+        assert out.total_aum == pytest.approx(2420) and out.mtd_return == pytest.approx(0.21)
+
+        # Carga retroativa não reescreve o registro diário mais recente
+        await _closes(s, ("DASHX", "2024-01-15", 50))
+        assert (await rollups.summary(s, today=feb)).mtd_return == pytest.approx(0.21)
+
+        assert await crud.delete_client(s, a.id)
+        out = await rollups.summary(s, today=feb)
+        assert (out.clients_total, out.clients_active, out.total_aum) == (1, 0, pytest.approx(1210))
+        await crud.update_allocation(s, alloc, schemas.AllocationUpdate(quantity=5))
+        assert (await rollups.summary(s, today=feb)).total_aum == pytest.approx(605)
+        assert await crud.delete_allocation(s, alloc.id)
+        assert (await rollups.summary(s, today=feb)).total_aum == 0
+    await engine.dispose()
@@ -0,0 +1,41 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+
+def test_engine_pool_settings():
+    import database
+    eng = database._create_engine("postgresql+asyncpg://u:p@localhost/db")
+    assert eng.url.query["prepared_statement_cache_size"] == str(database.STATEMENT_CACHE_SIZE)
+    pool = eng.sync_engine.pool
+    assert pool.size() == database.POOL_SIZE and pool._max_overflow == database.MAX_OVERFLOW
+    assert pool._pre_ping == database.POOL_PRE_PING and pool._recycle == database.POOL_RECYCLE
+    stats = database._pool_stats(eng)
+    assert stats["checked_out"] == 0 and stats["capacity"] == database.POOL_SIZE + database.MAX_OVERFLOW
+
+@pytest.mark.asyncio
+async def test_read_session_falls_back_to_primary(monkeypatch):
+    import database
+    replica = create_async_engine("sqlite+aiosqlite:///:memory:")
+    monkeypatch.setattr(database, "read_engine", replica)
+    monkeypatch.setattr(database, "read_session", async_sessionmaker(replica))
+    healthy = {"value": True}
+    async def _healthy():
+        return healthy["value"]
+    monkeypatch.setattr(database, "replica_healthy", _healthy)
+    monkeypatch.setitem(database._replica, "fallbacks", 0)
+
+    async for s in database.get_read_session():
+        assert s.bind is replica
+    healthy["value"] = False
+    async for s in database.get_read_session():
+        assert s.bind is database.engine
+    assert database.pool_stats()["replica"]["fallbacks"] == 1
+    await replica.dispose()
+
+def test_db_stats_requires_admin():
+    import main
+    with TestClient(main.app) as client:
+        assert client.get("/db/stats").status_code == 401
+        token = client.post("/api/token", data={"username": "admin@example.com", "password": "admin123"}).json()["access_token"]
+        assert "primary" in client.get("/db/stats", headers={"Authorization": f"Bearer {token}"}).json()
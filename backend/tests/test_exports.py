@@ -0,0 +1,197 @@
+import csv
+import io
+from datetime import date
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+
+class MemoryRedis:
+    """GET/SET em memória, o suficiente para o registro dos jobs."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        self.data[key] = value
+        return True
+
+
+@pytest.fixture
+def export_env(monkeypatch, tmp_path):
+    import exports
+    import pricing
+    r = MemoryRedis()
+
+    async def get_redis():
+        return r
+
+    async def cached_quotes(symbols):
+        return {s: {"price": 12.0, "previous_close": 10.0} for s in symbols}
+
+    queued = []
+    monkeypatch.setattr(pricing, "_get_redis", get_redis)
+    monkeypatch.setattr(pricing, "get_cached_quotes", cached_quotes)
+    monkeypatch.setattr(exports, "enqueue", queued.append)
+    monkeypatch.setattr(exports, "_storage", exports.LocalStorage(str(tmp_path)))
+    monkeypatch.setattr(exports, "PROGRESS_INTERVAL", 0)
+    return queued
+
+
+@pytest.fixture
+async def export_db():
+    import crud
+    import schemas
+    from database import Base
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as s:
+        a = await crud.create_client(s, schemas.ClientCreate(name="Ana", email="ana@export.com"))
+        b = await crud.create_client(s, schemas.ClientCreate(name="Bia", email="bia@export.com"))
+        x = await crud.create_asset(s, schemas.AssetCreate(ticker="EXPX3"))
+        for c in (a, b):
+            await crud.create_allocation(s, schemas.AllocationCreate(client_id=c.id, asset_id=x.id, quantity=10, purchase_price=8, purchase_date=date(2024, 1, 2)))
+    yield Session, a.id
+    await engine.dispose()
+
+
+@pytest.mark.asyncio
+async def test_export_endpoints_and_range_download(test_app, export_env, export_db):
+    import exports
+    Session, _ = export_db
+
+    async def login(user, pw):
+        token = (await test_app.post("/api/token", data={"username": user, "password": pw})).json()["access_token"]
+        return {"Authorization": f"Bearer {token}"}
+    h = await login("admin@example.com", "admin123")
+
+    assert (await test_app.post("/api/exports", json={"kind": "positions"}, headers=h)).status_code == 422
+    assert (await test_app.post("/api/exports", json={"kind": "positions", "client_id": 99999}, headers=h)).status_code == 404
+    r = await test_app.post("/api/exports", json={"kind": "clients"}, headers=h)
+    assert r.status_code == 202 and r.json()["status"] == "queued" and export_env == [r.json()["id"]]
+    job_id = r.json()["id"]
+    assert (await test_app.get(f"/api/exports/{job_id}/download", headers=h)).status_code == 409
+
+    await exports.run_job(job_id, Session)
+    job = (await test_app.get(f"/api/exports/{job_id}", headers=h)).json()
+    assert job["status"] == "done" and job["rows"] == 2 and job["download_url"] == f"/api/exports/{job_id}/download"
+    # Jobs são visíveis só para quem os criou (e para admins)
+    reader = await login("reader@example.com", "reader123")
+    assert (await test_app.get(f"/api/exports/{job_id}", headers=reader)).status_code == 404
+
+    full = await test_app.get(job["download_url"], headers=h)
+    assert full.status_code == 200 and full.headers["accept-ranges"] == "bytes"
+    assert full.text.splitlines()[0] == "id,name,email,is_active,created_at"
+    assert int(full.headers["content-length"]) == len(full.content) == job["size"]
+
+    part = await test_app.get(job["download_url"], headers={**h, "Range": "bytes=3-12"})
+    assert part.status_code == 206 and part.content == full.content[3:13]
+    assert part.headers["content-range"] == f"bytes 3-12/{job['size']}"
+    resumed = await test_app.get(job["download_url"], headers={**h, "Range": "bytes=13-", "If-Range": full.headers["etag"]})
+    assert part.content + resumed.content == full.content[3:]
+    stale = await test_app.get(job["download_url"], headers={**h, "Range": "bytes=13-", "If-Range": '"outro"'})
+    assert stale.status_code == 200 and stale.content == full.content
+    bad = await test_app.get(job["download_url"], headers={**h, "Range": f"bytes={job['size']}-"})
+    assert bad.status_code == 416 and bad.headers["content-range"] == f"bytes */{job['size']}"
+
+
+def test_parse_range():
+    from exports import parse_range
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=0-9", 100) == (0, 9)
+    assert parse_range("bytes=90-", 100) == (90, 99)
+    assert parse_range("bytes=-10", 100) == (90, 99)
+    assert parse_range("bytes=50-500", 100) == (50, 99)
+    assert parse_range("bytes=0-1,5-6", 100) is None  # vários intervalos: arquivo inteiro
+    assert parse_range("items=0-1", 100) is None
+    for bad in ("bytes=100-", "bytes=9-2", "bytes=-0", "bytes=a-b", "bytes=5"):
+        with pytest.raises(ValueError):
+            parse_range(bad, 100)
+
+
+@pytest.mark.asyncio
+async def test_run_job_writes_artifacts(export_env, export_db):
+    from openpyxl import load_workbook
+
+    import exports
+    Session, client_id = export_db
+    storage = exports.get_storage()
+
+    job = await exports.create_job("all_positions", "csv", "admin@example.com")
+    done = await exports.run_job(job["id"], Session)
+    assert done["status"] == "done" and done["progress"] == 1.0 and done["rows"] == done["total"] == 2
+    with storage.open(done["key"]) as f:
+        rows = list(csv.reader(io.StringIO(f.read().decode())))
+    assert rows[0] == exports.COLUMNS["all_positions"]
+    assert rows[1][1] == "Ana" and rows[1][3] == "EXPX3" and float(rows[1][7]) == pytest.approx(0.5)
+    assert float(rows[1][8]) == pytest.approx(0.2)
+
+    job = await exports.create_job("positions", "xlsx", "admin@example.com", client_id)
+    done = await exports.run_job(job["id"], Session)
+    assert done["status"] == "done" and done["size"] == storage.size(done["key"])
+    ws = load_workbook(storage.path(done["key"])).active
+    assert [c.value for c in ws[1]] == exports.POSITION_COLUMNS and ws.max_row == 2
+
+    # Falha no meio do job fica registrada, sem propagar
+    job = await exports.create_job("positions", "csv", "admin@example.com", 999)
+    job["kind"] = "unknown"
+    await exports._save(job)
+    failed = await exports.run_job(job["id"], Session)
+    assert failed["status"] == "failed" and failed["error"]
+    assert (await exports.get_job(job["id"]))["status"] == "failed"
+
+
+@pytest.mark.asyncio
+async def test_columnar_exports_are_typed(export_env, export_db, monkeypatch):
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as pq
+
+    import exports
+    import models
+    Session, client_id = export_db
+    storage = exports.get_storage()
+    async with Session() as s:
+        asset_id = (await s.execute(models.Asset.__table__.select())).first().id
+        s.add_all([models.DailyReturn(asset_id=asset_id, date=date(2024, 1, d), close_price=10.0 + d) for d in (2, 3, 4)])
+        await s.commit()
+
+    job = await exports.create_job("prices", "parquet", "admin@example.com", start=date(2024, 1, 3))
+    done = await exports.run_job(job["id"], Session)
+    assert done["status"] == "done" and done["filename"].endswith(".parquet") and done["rows"] == done["total"] == 2
+    table = pq.read_table(storage.path(done["key"]))
+    assert table.schema.field("ticker").type == pa.dictionary(pa.int32(), pa.string())
+    assert table.schema.field("date").type == pa.date32() and table.schema.field("close").type == pa.float64()
+    assert table.column("date").to_pylist() == [date(2024, 1, 3), date(2024, 1, 4)]
+    assert table.column("ticker").to_pylist() == ["EXPX3", "EXPX3"]
+
+    job = await exports.create_job("performance", "arrow", "admin@example.com", client_id)
+    done = await exports.run_job(job["id"], Session)
+    with storage.open(done["key"]) as f:
+        table = pa.ipc.open_stream(f).read_all()
+    assert table.schema.names == ["date", "cumulative_return"] and table.num_rows == done["rows"] == 3
+    assert table.schema.field("date").type == pa.date32()
+
+    monkeypatch.setattr(exports, "BATCH_ROWS", 1)  # vários lotes: um row group por lote
+    job = await exports.create_job("all_positions", "parquet", "admin@example.com")
+    done = await exports.run_job(job["id"], Session)
+    f = pq.ParquetFile(storage.path(done["key"]))
+    assert f.metadata.num_row_groups == 2 and f.schema_arrow.field("client_id").type == pa.int64()
+
+    body = exports.encode("positions", "arrow", [(1, "EXPX3", 10.0, 8.0, 12.0, 0.5, 0.2)])
+    assert pa.ipc.open_stream(body).read_all().column("ticker").to_pylist() == ["EXPX3"]
+
+
+@pytest.mark.asyncio
+async def test_columnar_formats_require_pyarrow(test_app, export_env, monkeypatch):
+    import exports
+    monkeypatch.setattr(exports, "pa", None)
+    token = (await test_app.post("/api/token", data={"username": "admin@example.com", "password": "admin123"})).json()["access_token"]
+    h = {"Authorization": f"Bearer {token}"}
+    assert (await test_app.post("/api/exports", json={"kind": "prices", "format": "parquet"}, headers=h)).status_code == 406
+    assert (await test_app.get("/api/clients/1/positions?format=arrow", headers=h)).status_code == 406
+    assert export_env == []
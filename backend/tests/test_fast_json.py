@@ -0,0 +1,42 @@
+from datetime import date, datetime
+
+import pytest
+
+
+def test_dumps_matches_fastapi_json_response():
+    import numpy as np
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+
+    import fast_json
+    import schemas
+    content = {
+        "client": schemas.ClientOut(id=1, name="José", email="jose@example.com", is_active=True, created_at=datetime(2024, 1, 2, 3, 4, 5, 6)),
+        "dates": [date(2024, 1, 2), date(2024, 1, 3)],
+        "returns": [0.1, -0.25],
+        "nested": [{"at": datetime(2024, 1, 2, 10, 0), "n": None}],
+    }
+    assert fast_json.dumps(content) == JSONResponse(jsonable_encoder(content)).body
+    assert fast_json.dumps({"a": np.array([1.5, 2.0])}) == b'{"a":[1.5,2.0]}'
+
+@pytest.mark.asyncio
+async def test_performance_rows_and_columnar_shapes(test_app):
+    import schemas
+    token = (await test_app.post("/api/token", data={"username": "admin@example.com", "password": "admin123"})).json()["access_token"]
+    h = {"Authorization": f"Bearer {token}"}
+    client_id = (await test_app.post("/api/clients", json={"name": "Shape", "email": "shape@example.com"}, headers=h)).json()["id"]
+    asset_id = (await test_app.post("/api/assets", json={"ticker": "SHAPE3"}, headers=h)).json()["id"]
+    await test_app.post("/api/allocations", json={"client_id": client_id, "asset_id": asset_id, "quantity": 2, "purchase_price": 10, "purchase_date": "2024-01-02"}, headers=h)
+    body = "ticker,date,close\nSHAPE3,2024-01-02,10\nSHAPE3,2024-01-03,11\nSHAPE3,2024-01-04,12.5\n"
+    await test_app.post("/api/prices:bulk", content=body, headers={**h, "Content-Type": "text/csv"})
+
+    url = f"/api/clients/{client_id}/performance"
+    rows = (await test_app.get(url, headers=h)).json()
+    cols = (await test_app.get(url, params={"shape": "columnar"}, headers=h)).json()
+    assert rows["points"] == [{"date": "2024-01-02", "cumulative_return": 0.0}, {"date": "2024-01-03", "cumulative_return": 0.1}, {"date": "2024-01-04", "cumulative_return": 0.25}]
+    assert cols == {"client_id": client_id, "dates": ["2024-01-02", "2024-01-03", "2024-01-04"], "returns": [0.0, 0.1, 0.25]}
+    assert (await test_app.get(url, params={"shape": "csv"}, headers=h)).status_code == 422
+
+    # As duas formas seguem os schemas documentados
+    assert schemas.PerformanceOut.model_validate(rows).model_dump(mode="json") == rows
+    assert schemas.PerformanceColumns.model_validate(cols).model_dump(mode="json") == cols
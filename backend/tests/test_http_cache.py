@@ -0,0 +1,193 @@
+import os
+from datetime import date
+
+import pytest
+
+
+class MemoryRedis:
+    """Subconjunto do cliente Redis usado pelo http_cache, em memória."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def mget(self, keys):
+        return [self.data.get(k) for k in keys]
+
+    async def set(self, key, value, ex=None, nx=False):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        return True
+
+    def pipeline(self, transaction=True):
+        return MemoryPipeline(self)
+
+
+class MemoryPipeline:
+    def __init__(self, r):
+        self.r, self.keys = r, []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def incr(self, key):
+        self.keys.append(key)
+
+    async def execute(self):
+        for k in self.keys:
+            self.r.data[k] = str(int(self.r.data.get(k, 0)) + 1)
+        return [int(self.r.data[k]) for k in self.keys]
+
+
+@pytest.fixture
+def shared_cache(monkeypatch):
+    import api
+    import pricing
+    r = MemoryRedis()
+
+    async def get_redis():
+        return r
+
+    async def price(symbol):
+        return 12.0
+
+    monkeypatch.setattr(pricing, "_get_redis", get_redis)
+    monkeypatch.setattr(api, "get_current_price", price)
+    monkeypatch.setattr(api, "get_previous_close", price)
+    return r
+
+
+@pytest.mark.asyncio
+async def test_allocations_etag_and_shared_cache(test_app, shared_cache):
+    import http_cache
+    from query_stats import assert_max_queries
+    token = (await test_app.post("/api/token", data={"username": "admin@example.com", "password": "admin123"})).json()["access_token"]
+    h = {"Authorization": f"Bearer {token}"}
+    client_id = (await test_app.post("/api/clients", json={"name": "ETag", "email": "etag@example.com"}, headers=h)).json()["id"]
+    asset = (await test_app.post("/api/assets", json={"ticker": "ETAG3"}, headers=h)).json()
+    alloc = (await test_app.post("/api/allocations", json={"client_id": client_id, "asset_id": asset["id"], "quantity": 10, "purchase_price": 10, "purchase_date": "2024-01-02"}, headers=h)).json()
+    url = f"/api/clients/{client_id}/allocations"
+
+    first = await test_app.get(url, headers=h)
+    etag = first.headers["etag"]
+    assert first.status_code == 200 and first.json()[0]["current_price"] == 12.0
+    assert first.headers["cache-control"] == http_cache.CACHE_CONTROL
+    with assert_max_queries(0):  # 304 e corpo compartilhado sem ir ao banco
+        r = await test_app.get(url, headers={**h, "If-None-Match": etag})
+        assert r.status_code == 304 and r.headers["etag"] == etag and r.content == b""
+        r = await test_app.get(url, headers=h)
+        assert r.status_code == 200 and r.content == first.content
+
+    # Mutador do crud, cotação e histórico do ativo invalidam a versão
+    await test_app.put(f"/api/allocations/{alloc['id']}", json={"quantity": 20}, headers=h)
+    r = await test_app.get(url, headers={**h, "If-None-Match": etag})
+    assert r.status_code == 200 and r.json()[0]["quantity"] == 20 and r.headers["etag"] != etag
+    etag = r.headers["etag"]
+    await http_cache.bump(http_cache.quote_key("etag3"))
+    r = await test_app.get(url, headers={**h, "If-None-Match": etag})
+    assert r.status_code == 200 and r.headers["etag"] != etag
+
+    perf_url = f"/api/clients/{client_id}/performance"
+    etag = (await test_app.get(perf_url, headers=h)).headers["etag"]
+    assert (await test_app.get(perf_url, headers={**h, "If-None-Match": etag})).status_code == 304
+    await http_cache.on_history({asset["id"]: date(2024, 1, 2)})
+    assert (await test_app.get(perf_url, headers={**h, "If-None-Match": etag})).status_code == 200
+
+    # Exclusão: a versão muda e o 404 não é cacheado
+    etag = (await test_app.get(f"/api/clients/{client_id}", headers=h)).headers["etag"]
+    await test_app.delete(f"/api/clients/{client_id}", headers=h)
+    assert (await test_app.get(f"/api/clients/{client_id}", headers={**h, "If-None-Match": etag})).status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_asset_list_etag_and_lost_counters(test_app, shared_cache):
+    token = (await test_app.post("/api/token", data={"username": "admin@example.com", "password": "admin123"})).json()["access_token"]
+    h = {"Authorization": f"Bearer {token}"}
+    etag = (await test_app.get("/api/assets", headers=h)).headers["etag"]
+    assert (await test_app.get("/api/assets", headers={**h, "If-None-Match": f'"x", {etag}'})).status_code == 304
+    await test_app.post("/api/assets", json={"ticker": "ETAG4"}, headers=h)
+    r = await test_app.get("/api/assets", headers={**h, "If-None-Match": etag})
+    assert r.status_code == 200 and "ETAG4" in {a["ticker"] for a in r.json()}
+    # Redis reiniciado: contadores que voltam ao mesmo valor não revalidam ETags antigos
+    etag = r.headers["etag"]
+    counter = shared_cache.data["ver:assets"]
+    shared_cache.data.clear()
+    shared_cache.data["ver:assets"] = counter
+    assert (await test_app.get("/api/assets", headers={**h, "If-None-Match": etag})).status_code == 200
+
+
+def test_cached_routes_read_from_primary():
+    # O corpo em cache vale pelas versões atuais; uma réplica atrasada gravaria dados antigos nelas
+    import http_cache
+    from database import get_read_session, get_session
+    from main import app
+    cached = {"/api/clients/{client_id}/allocations", "/api/clients/{client_id}/performance", "/api/assets"}
+    routes = [r for r in app.routes if getattr(r, "path", None) in cached and "GET" in r.methods]
+    assert {r.path for r in routes} == cached
+    for route in routes:
+        calls = {d.call for d in route.dependant.dependencies}
+        assert http_cache.get_cache_session in calls and get_read_session not in calls, route.path
+    client = next(r for r in app.routes if getattr(r, "path", None) == "/api/clients/{client_id}" and "GET" in r.methods)
+    assert get_session in {d.call for d in client.dependant.dependencies}
+
+
+@pytest.mark.asyncio
+async def test_cache_session_uses_replica_only_without_cache(monkeypatch):
+    import database
+    import http_cache
+
+    async def primary():
+        yield "primary"
+
+    async def replica():
+        yield "replica"
+
+    monkeypatch.setattr(database, "get_session", primary)
+    monkeypatch.setattr(database, "get_read_session", replica)
+    monkeypatch.setattr(http_cache, "ENABLED", True)
+    assert [s async for s in http_cache.get_cache_session()] == ["primary"]
+    monkeypatch.setattr(http_cache, "ENABLED", False)
+    assert [s async for s in http_cache.get_cache_session()] == ["replica"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not os.environ.get("TEST_REDIS_URL"), reason="requer Redis em TEST_REDIS_URL")
+async def test_quote_version_follows_redis_price(monkeypatch):
+    # Dois "processos" (sem estado compartilhado em memória) atualizando o mesmo ticker
+    import redis.asyncio as redis
+
+    import pricing
+    import tick_history
+    r = redis.from_url(os.environ["TEST_REDIS_URL"], decode_responses=True)
+    await r.delete("price:VERQ", "last_good:VERQ", "ver:quote:VERQ", "prev:VERQ", tick_history.key("VERQ"), pricing._FAIL_KEY)
+    prices = iter([10.0, 10.0, 11.0, 10.0])
+
+    async def get_redis():
+        return r
+
+    async def yahoo_quotes(symbols):
+        return {"VERQ": {"regularMarketPrice": next(prices), "regularMarketPreviousClose": 9.0}}
+
+    monkeypatch.setattr(pricing, "_get_redis", get_redis)
+    monkeypatch.setattr(pricing, "yahoo_quotes", yahoo_quotes)
+    versions = []
+    for _ in range(4):
+        await pricing.refresh_quotes(["VERQ"])
+        versions.append(await r.get("ver:quote:VERQ"))
+    assert versions == ["1", "1", "2", "3"]
+
+    # Caminho de um ticker só (cache expirado): mesma regra de versão
+    async def yahoo_quote(symbol):
+        return {"regularMarketPrice": 12.0}
+
+    monkeypatch.setattr(pricing, "yahoo_quote", yahoo_quote)
+    await r.delete("price:VERQ")
+    assert await pricing.get_current_price("verq") == 12.0
+    assert await r.get("ver:quote:VERQ") == "4"
+    await r.close()
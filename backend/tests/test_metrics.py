@@ -0,0 +1,22 @@
+from fastapi.testclient import TestClient
+
+
+def test_metrics_endpoint_reports_route_templates():
+    import main
+    with TestClient(main.app) as client:
+        client.get("/api/clients/123")  # 401, mas medido pelo template da rota
+        body = client.get("/metrics").text
+    assert 'http_request_duration_seconds_count{method="GET",route="/api/clients/{client_id}",status="401"}' in body
+    assert "/api/clients/123" not in body
+    assert "db_pool_connections" in body and "ws_connections" in body
+
+def test_cache_lookup_counts_hits_and_misses():
+    import metrics
+
+    def sample(result):
+        return metrics.REGISTRY.get_sample_value("price_cache_requests_total", {"tier": "prev", "result": result}) or 0
+
+    hits, misses = sample("hit"), sample("miss")
+    assert metrics.cache_lookup("prev", "10.5") == "10.5"
+    assert metrics.cache_lookup("prev", None) is None
+    assert (sample("hit"), sample("miss")) == (hits + 1, misses + 1)
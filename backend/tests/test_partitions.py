@@ -0,0 +1,75 @@
+import os
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+PG_URL = os.environ.get("TEST_DATABASE_URL", "")
+
+async def _seed(url):
+    import models
+    from database import Base
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async with Session() as s:
+        client = models.Client(name="Part", email="part@example.com")
+        asset = models.Asset(ticker="PART", name="Part")
+        s.add_all([client, asset])
+        await s.flush()
+        s.add(models.Allocation(client_id=client.id, asset_id=asset.id, quantity=1, purchase_price=100, purchase_date=date(2023, 6, 1)))
+        s.add_all([
+            models.DailyReturn(asset_id=asset.id, date=d, close_price=p)
+            for d, p in [(date(2022, 12, 30), 90), (date(2023, 6, 2), 110), (date(2024, 1, 2), 120), (date(2024, 2, 1), 130)]
+        ])
+        await s.commit()
+    return engine, Session, client.id
+
+@pytest.mark.asyncio
+async def test_performance_date_bounds():
+    import crud
+    import partitions
+    engine, Session, client_id = await _seed("sqlite+aiosqlite:///:memory:")
+    async with Session() as s:
+        perf = await crud.compute_client_performance(s, client_id)
+        # Fechamentos anteriores à primeira compra não entram na série
+        assert [p.date for p in perf.points] == [date(2023, 6, 2), date(2024, 1, 2), date(2024, 2, 1)]
+        perf = await crud.compute_client_performance(s, client_id, start=date(2024, 1, 1), end=date(2024, 1, 31))
+        assert [(p.date, round(p.cumulative_return, 2)) for p in perf.points] == [(date(2024, 1, 2), 0.2)]
+    async with engine.begin() as conn:
+        # Sem particionamento fora do Postgres
+        assert await partitions.ensure_partitions(conn) == []
+    await engine.dispose()
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not PG_URL.startswith("postgresql"), reason="requer Postgres em TEST_DATABASE_URL")
+async def test_partition_pruning_and_archive(tmp_path):
+    import partitions
+    engine, Session, client_id = await _seed(PG_URL)
+    async with engine.begin() as conn:
+        # Reproduz o layout da migração 003 sobre a tabela criada pelo metadata
+        await conn.execute(text("ALTER TABLE daily_returns RENAME TO daily_returns_plain"))
+        await conn.execute(text(
+            "CREATE TABLE daily_returns (id integer NOT NULL, asset_id integer NOT NULL, date date NOT NULL, "
+            "close_price double precision NOT NULL, PRIMARY KEY (id, date)) PARTITION BY RANGE (date)"
+        ))
+        for y in (2022, 2023, 2024):
+            await conn.execute(text(f"CREATE TABLE daily_returns_y{y} PARTITION OF daily_returns FOR VALUES FROM ('{y}-01-01') TO ('{y + 1}-01-01')"))
+        await conn.execute(text("INSERT INTO daily_returns SELECT * FROM daily_returns_plain"))
+        await conn.execute(text("DROP TABLE daily_returns_plain"))
+        created = await partitions.ensure_partitions(conn, years_ahead=1, today=date(2024, 3, 1))
+        assert created == ["daily_returns_y2025"]
+        assert await partitions.ensure_partitions(conn, years_ahead=1, today=date(2024, 3, 1)) == []
+        plan = (await conn.execute(text(
+            "EXPLAIN SELECT close_price FROM daily_returns WHERE date >= '2024-01-01' AND date <= '2024-01-31'"
+        ))).scalars().all()
+        assert "daily_returns_y2024" in "\n".join(plan)
+        assert "daily_returns_y2023" not in "\n".join(plan)
+    paths = await partitions.archive_old_partitions(engine, retention_years=2, today=date(2024, 3, 1), archive_dir=str(tmp_path))
+    assert [os.path.basename(p) for p in paths] == ["daily_returns_y2022.csv.gz"]
+    async with engine.connect() as conn:
+        assert [y for _, y in await partitions.list_partitions(conn)] == [2023, 2024, 2025]
+    await engine.dispose()
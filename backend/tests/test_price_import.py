@@ -0,0 +1,105 @@
+import json
+import os
+from datetime import date
+
+import pytest
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+PG_URL = os.environ.get("TEST_DATABASE_URL", "")
+
+async def _admin(test_app):
+    token = (await test_app.post("/api/token", data={"username": "admin@example.com", "password": "admin123"})).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+async def test_bulk_price_import(test_app, monkeypatch):
+    import price_import
+    seen = []
+    monkeypatch.setattr(price_import, "history_listeners", [seen.append])
+    h = await _admin(test_app)
+    aid = (await test_app.post("/api/assets", json={"ticker": "HIST1"}, headers=h)).json()["id"]
+
+    body = "\n".join([
+        "ticker,date,close",
+        "hist1,2024-01-02,10",
+        "HIST1,2024-01-03,11",
+        "HIST1,2024-01-02,10.5",  # repetida: a última vence
+        "NOPE,2024-01-02,1",      # ticker desconhecido
+        "HIST1,2024-13-01,1",     # data inválida
+        "HIST1,2024-01-04,abc",   # fechamento inválido
+    ])
+    r = await test_app.post("/api/prices:bulk", content=body.encode(), headers={**h, "Content-Type": "text/csv"})
+    assert r.status_code == 200, r.text
+    rep = r.json()
+    assert (rep["received"], rep["inserted"], rep["duplicates"], rep["skipped"], rep["failed"]) == (6, 2, 1, 1, 2)
+    assert rep["unknown_tickers"] == ["NOPE"] and [e["line"] for e in rep["errors"]] == [6, 7]
+    assert seen == [{aid: date(2024, 1, 2)}]
+
+    nd = "\n".join(json.dumps(x) for x in [
+        {"asset_id": aid, "date": "2024-01-03", "close_price": 11},    # sem mudança
+        {"asset_id": aid, "date": "2024-01-02", "close_price": 9.5},   # atualiza
+        {"ticker": "HIST2", "date": "2024-01-02", "close": 7},         # cria o ativo
+    ])
+    rep = (await test_app.post("/api/prices:bulk?create_assets=true", content=nd.encode(), headers={**h, "Content-Type": "application/x-ndjson"})).json()
+    assert (rep["inserted"], rep["updated"], rep["unchanged"], rep["assets_created"]) == (1, 1, 1, 1)
+    assert seen[-1][aid] == date(2024, 1, 2)
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not PG_URL.startswith("postgresql"), reason="requer Postgres em TEST_DATABASE_URL")
+async def test_copy_merge_postgres():
+    import models
+    import price_import
+    from database import Base
+    engine = create_async_engine(PG_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async def body():
+        yield b"ticker,date,close\nPGA,2024-01-02,1\nPGA,2024-01-02,2\nPGB,2024-01-02,3\nZZZ,2024-01-02,4\n"
+    async with Session() as s:
+        s.add(models.Asset(ticker="PGA"))
+        await s.commit()
+        rep = await price_import.import_prices(s, body(), "csv", create_assets=False)
+        assert (rep.inserted, rep.duplicates, rep.skipped) == (1, 1, 2)
+        assert (await s.execute(select(models.DailyReturn.close_price))).scalars().all() == [2]
+    await engine.dispose()
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not PG_URL.startswith("postgresql"), reason="requer Postgres em TEST_DATABASE_URL")
+async def test_copy_merge_creates_missing_partitions():
+    from sqlalchemy import text
+
+    import models
+    import partitions
+    import price_import
+    from database import Base
+    engine = create_async_engine(PG_URL)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+        # Layout da migração 003, só com 2024 particionado e sem partição DEFAULT
+        await conn.execute(text("DROP TABLE daily_returns"))
+        await conn.execute(text(
+            "CREATE TABLE daily_returns (id serial, asset_id integer NOT NULL REFERENCES assets(id), date date NOT NULL, "
+            "close_price double precision NOT NULL, PRIMARY KEY (id, date), UNIQUE (asset_id, date)) PARTITION BY RANGE (date)"
+        ))
+        await conn.execute(text("CREATE TABLE daily_returns_y2024 PARTITION OF daily_returns FOR VALUES FROM ('2024-01-01') TO ('2025-01-01')"))
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    async def body():
+        yield b"ticker,date,close\nOLD,2019-03-01,1\nOLD,2021-06-01,2\nOLD,2024-01-02,3\n"
+    async with Session() as s:
+        s.add(models.Asset(ticker="OLD"))
+        await s.commit()
+        rep = await price_import.import_prices(s, body(), "csv", create_assets=False)
+        assert rep.inserted == 3
+    async with engine.connect() as conn:
+        assert [y for _, y in await partitions.list_partitions(conn)] == [2019, 2020, 2021, 2024]
+    await engine.dispose()
+
+def test_parse_row_rejects_bad_ids_and_closes():
+    from price_import import parse_row
+    assert parse_row({"asset_id": "7", "date": "2024-01-02", "close": "1.5"})[1] == 7
+    for raw in ({"asset_id": [1]}, {"asset_id": {"id": 1}}, {"asset_id": 1.5}, {"ticker": "A", "close": "inf"}, {"ticker": "A", "close": "-inf"}):
+        with pytest.raises(ValueError):
+            parse_row({"date": "2024-01-02", "close": 1, **raw})
@@ -0,0 +1,68 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+np = pytest.importorskip("numpy")
+
+@pytest.mark.asyncio
+async def test_store_matches_sql(tmp_path, monkeypatch):
+    import crud
+    import models
+    import price_store
+    from database import Base
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    today = date(2024, 3, 1)
+    async with Session() as s:
+        client = models.Client(name="Store", email="store@example.com")
+        a, b = models.Asset(ticker="STA"), models.Asset(ticker="STB")
+        s.add_all([client, a, b])
+        await s.flush()
+        s.add_all([
+            models.Allocation(client_id=client.id, asset_id=a.id, quantity=2, purchase_price=10, purchase_date=date(2024, 1, 1)),
+            models.Allocation(client_id=client.id, asset_id=b.id, quantity=1, purchase_price=50, purchase_date=date(2024, 2, 1)),
+        ])
+        for i in range(60):
+            d = date(2024, 1, 1) + timedelta(days=i)
+            s.add(models.DailyReturn(asset_id=a.id, date=d, close_price=10 + i * 0.5))
+            if i % 2 == 0:
+                s.add(models.DailyReturn(asset_id=b.id, date=d, close_price=50 - i * 0.1))
+        await s.commit()
+
+        expected = await crud.compute_client_performance(s, client.id)
+        window = await crud.compute_client_performance(s, client.id, start=date(2024, 1, 20), end=date(2024, 2, 10))
+
+        store = price_store.PriceStore(str(tmp_path))
+        monkeypatch.setattr(price_store, "_store", store)
+        assert await store.sync(s, today=date(2024, 2, 15)) == 45 + 23
+        # Pregões posteriores ao arquivo vêm do banco
+        assert await crud.compute_client_performance(s, client.id) == expected
+        assert await crud.compute_client_performance(s, client.id, start=date(2024, 1, 20), end=date(2024, 2, 10)) == window
+
+        # Só acrescenta o que falta; a leitura é um memmap sem cópia
+        assert await store.sync(s, today=today) == 15 + 7
+        assert await store.sync(s, today=today) == 0
+        d, c = store.series(a.id, date(2024, 2, 1), date(2024, 2, 3))
+        assert [date.fromordinal(int(x)) for x in d] == [date(2024, 2, 1), date(2024, 2, 2), date(2024, 2, 3)]
+        assert isinstance(c.base, np.memmap) or isinstance(c, np.memmap)
+        assert await crud.compute_client_performance(s, client.id) == expected
+
+        store.invalidate(a.id)
+        assert store.last_date(a.id) is None
+        assert await crud.compute_client_performance(s, client.id) == expected
+    await engine.dispose()
+
+
+def test_reader_remaps_recreated_file(tmp_path):
+    # Leitor e escritor em "processos" diferentes: o arquivo é recriado com o mesmo tamanho
+    import price_store
+    writer, reader = price_store.PriceStore(str(tmp_path)), price_store.PriceStore(str(tmp_path))
+    days = [date(2024, 1, 2), date(2024, 1, 3)]
+    writer.append(7, zip(days, [10.0, 11.0]))
+    assert list(reader.series(7)[1]) == [10.0, 11.0]
+    writer.invalidate(7)
+    writer.append(7, zip(days, [20.0, 21.0]))
+    assert list(reader.series(7)[1]) == [20.0, 21.0]
@@ -0,0 +1,49 @@
+import logging
+
+import pytest
+from fastapi import Depends, FastAPI
+from httpx import AsyncClient
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from query_stats import QueryStatsMiddleware, assert_max_queries, budget
+
+
+async def _admin_headers(client):
+    r = await client.post("/api/token", data={"username": "admin@example.com", "password": "admin123"})
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+@pytest.mark.asyncio
+async def test_server_timing_and_declared_budgets(test_app):
+    h = await _admin_headers(test_app)
+    with assert_max_queries():  # orçamentos declarados nas rotas
+        r = await test_app.post("/api/clients", json={"name": "Budget", "email": "budget@example.com"}, headers=h)
+        assert r.status_code == 201
+        r = await test_app.get("/api/clients", headers=h)
+    assert r.headers["server-timing"].startswith("db;dur=")
+    assert r.headers["server-timing"].endswith('desc="1 query"')
+
+@pytest.mark.asyncio
+async def test_over_budget_fails_and_logs_repeated_sql(caplog):
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    app = FastAPI()
+    app.add_middleware(QueryStatsMiddleware)
+
+    @app.get("/loop", dependencies=[Depends(budget(2))])
+    async def loop():
+        async with engine.connect() as conn:
+            for i in range(6):  # N+1 proposital
+                await conn.execute(text("SELECT :i"), {"i": i})
+        return {}
+
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        with caplog.at_level(logging.INFO, logger="query_stats"):
+            with pytest.raises(AssertionError, match="6 consultas, orçamento 2"):
+                with assert_max_queries():
+                    r = await ac.get("/loop")
+        assert 'desc="6 queries"' in r.headers["server-timing"]
+        assert "possível N+1, 6x SELECT ?" in caplog.text
+        with pytest.raises(AssertionError, match="6 consultas, limite 5"):
+            with assert_max_queries(5):
+                await ac.get("/loop")
+    await engine.dispose()
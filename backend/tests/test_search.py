@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+
+class MemoryRedis:
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, ex=None, nx=False):
+        self.data[key] = value
+        return True
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Índice e memória do `search` zerados, Redis em memória e Yahoo falso contando chamadas."""
+    import pricing
+    import search
+    r = MemoryRedis()
+    calls = []
+    results = {
+        "APP": [{"symbol": "AAPL", "shortname": "Apple Inc."}, {"symbol": "APP", "shortname": "AppLovin"}],
+        "VALE": [{"symbol": "VALE3.SA", "shortname": "VALE ON"}, {"symbol": "VALE", "shortname": "Vale S.A."}],
+    }
+
+    async def get_redis():
+        return r
+
+    async def yahoo_search(q, retries=3):
+        calls.append(q)
+        await asyncio.sleep(0.01)
+        if q == "FAIL":
+            raise RuntimeError("429")
+        return results.get(q, [])
+
+    monkeypatch.setattr(pricing, "_get_redis", get_redis)
+    monkeypatch.setattr(pricing, "yahoo_search", yahoo_search)
+    monkeypatch.setattr(search, "index", search.TickerIndex())
+    for name in ("_queried", "_complete", "_inflight"):
+        monkeypatch.setattr(search, name, {})
+    monkeypatch.setattr(search, "_loaded_at", 0.0)
+    return calls, r
+
+
+@pytest.mark.asyncio
+async def test_search_endpoint_answers_known_assets_locally(test_app, upstream):
+    calls, _ = upstream
+    token = (await test_app.post("/api/token", data={"username": "admin@example.com", "password": "admin123"})).json()["access_token"]
+    h = {"Authorization": f"Bearer {token}"}
+    await test_app.post("/api/assets", json={"ticker": "SRCH3", "name": "Busca Participações"}, headers=h)
+    r = await test_app.get("/api/assets/search", params={"q": "srch3"})
+    assert r.status_code == 200 and r.json()[0] == {"symbol": "SRCH3", "shortname": "Busca Participações"}
+    r = await test_app.get("/api/assets/search", params={"q": "busca part"})
+    assert "SRCH3" in [x["symbol"] for x in r.json()]
+    assert calls == ["BUSCA PART"]  # só o termo sem ticker exato foi ao Yahoo
+
+
+def test_ticker_index_prefix_and_trigrams():
+    from search import TickerIndex
+    idx = TickerIndex()
+    idx.add_many([("PETR4.SA", "Petrobras PN"), ("PETR3.SA", "Petrobras ON"), ("PETR4", None), ("PRIO3.SA", "PetroRio"), ("VALE3.SA", "Vale ON")])
+    assert [h["symbol"] for h in idx.search("petr")] == ["PETR3.SA", "PETR4", "PETR4.SA", "PRIO3.SA"]
+    assert idx.search("PETR4")[0] == {"symbol": "PETR4", "shortname": None}
+    assert [h["symbol"] for h in idx.search("obras on")] == ["PETR3.SA"]
+    assert idx.search("vale", limit=1) == [{"symbol": "VALE3.SA", "shortname": "Vale ON"}]
+    assert idx.search("xyz") == [] and idx.search("  ") == []
+    idx.add("PETR4", "Petrobras PN (BDR)")  # nome novo para símbolo já indexado
+    assert [h["symbol"] for h in idx.search("BDR")] == ["PETR4"]
+
+
+@pytest.mark.asyncio
+async def test_search_single_flight_and_cache(upstream):
+    import search
+    calls, redis = upstream
+    results = await asyncio.gather(*(search.search("app") for _ in range(5)))
+    assert calls == ["APP"] and all(r == results[0] for r in results)
+    assert {x["symbol"] for x in results[0]} == {"AAPL", "APP"}
+    assert "search:q:APP" in redis.data
+
+    # Termo visto, ticker já indexado e extensão de um prefixo que veio completo: só índice
+    assert [x["symbol"] for x in await search.search("APP")] == ["APP", "AAPL"]
+    assert (await search.search("aapl"))[0]["symbol"] == "AAPL"
+    assert await search.search("appx") == []
+    assert calls == ["APP"]
+
+    # Outro worker (memória vazia) lê o resultado do Redis, sem ir ao Yahoo
+    search.index, search._queried, search._complete = search.TickerIndex(), {}, {}
+    assert {x["symbol"] for x in await search.search("app")} == {"AAPL", "APP"}
+    assert calls == ["APP"]
+
+    # Falha no Yahoo: responde com o que o índice tiver
+    assert await search.search("fail") == []
+    assert calls == ["APP", "FAIL"] and not search._inflight
@@ -0,0 +1,60 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def quotes(monkeypatch):
+    import price_feed
+    prices = {"AAPL": {"price": 110.0, "previous_close": 100.0}, "MSFT": {"price": 50.0, "previous_close": 50.0}}
+
+    async def get_cached_quotes(symbols):
+        return {s: prices[s] for s in symbols if s in prices}
+
+    async def refresh_quotes(symbols):
+        return 0
+
+    monkeypatch.setattr(price_feed.pricing, "get_cached_quotes", get_cached_quotes)
+    monkeypatch.setattr(price_feed.pricing, "refresh_quotes", refresh_quotes)
+    return price_feed.feed
+
+def _parse(chunk):
+    fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines() if not line.startswith(":"))
+    return fields.get("event"), fields.get("id"), json.loads(fields["data"]) if "data" in fields else None
+
+async def test_snapshot_then_ticks_and_resume(quotes, monkeypatch):
+    import sse
+    hub = sse.TickHub(size=3)
+    monkeypatch.setattr(sse, "hub", hub)
+    stream = sse.event_stream(["AAPL", "MSFT"])
+    assert await stream.__anext__() == f"retry: {sse.RETRY_MS}\n\n"
+    event, snap_id, data = _parse(await stream.__anext__())
+    assert event == "snapshot" and [d["ticker"] for d in data["data"]] == ["AAPL", "MSFT"]
+
+    quotes.quotes["AAPL"] = {"price": 111.0}
+    hub.on_quotes(["AAPL", "TSLA"])  # TSLA sem cotação: ignorado
+    event, tick_id, data = _parse(await stream.__anext__())
+    assert event == "tick" and data["ticker"] == "AAPL" and data["price"] == 111.0
+    await stream.aclose()
+    assert hub.subscribers == {}
+
+    # Reconexão: só os ticks posteriores ao último id, sem novo snapshot
+    quotes.quotes["MSFT"] = {"price": 51.0}
+    hub.on_quotes(["MSFT"])
+    resumed = sse.event_stream(["AAPL", "MSFT"], last_event_id=tick_id)
+    await resumed.__anext__()
+    event, _, data = _parse(await resumed.__anext__())
+    assert event == "tick" and data["ticker"] == "MSFT"
+    await resumed.aclose()
+
+    # Lacuna maior que o buffer (ou id de outro processo) volta ao snapshot
+    quotes.quotes["MSFT"] = {"price": 52.0}
+    for _ in range(4):
+        hub.on_quotes(["MSFT"])
+    assert hub.since(tick_id, {"MSFT"}) is None
+    assert hub.since("other-1", {"MSFT"}) is None
+    assert hub.since(hub.event_id(hub.seq), {"MSFT"}) == (hub.seq, [])
+
+async def test_stream_endpoint_validates_symbols(test_app):
+    r = await test_app.get("/api/stream/prices", params={"symbols": " , "})
+    assert r.status_code == 400
@@ -0,0 +1,69 @@
+import os
+from datetime import datetime
+
+import pytest
+
+
+def test_record_queues_redis_side_comparison():
+    import tick_history
+
+    class Pipe:
+        def __init__(self):
+            self.calls = []
+        def eval(self, script, numkeys, *keys_and_args):
+            self.calls.append((numkeys, keys_and_args))
+
+    pipe = Pipe()
+    tick_history.record(pipe, "hist1", 10.0, now=100_000)
+    tick_history.record(pipe, "HIST1", 10.0, now=100_015)  # a repetição é descartada no Redis, não aqui
+    minid = str(int((100_000 - tick_history.RETENTION) * 1000))
+    assert pipe.calls[0] == (1, ("ticks:HIST1", "10.0", tick_history.MAXLEN, minid))
+    assert len(pipe.calls) == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.skipif(not os.environ.get("TEST_REDIS_URL"), reason="requer Redis em TEST_REDIS_URL")
+async def test_record_compares_with_last_stored_tick():
+    import redis.asyncio as redis
+
+    import tick_history
+    r = redis.from_url(os.environ["TEST_REDIS_URL"], decode_responses=True)
+    await r.delete(tick_history.key("HIST2"))
+    # Mesmo preço vindo de processos diferentes não duplica; A→B→A não é perdido
+    for price in (10.0, 10.0, 10.5, 10.0, 10.0):
+        async with r.pipeline(transaction=False) as pipe:
+            tick_history.record(pipe, "HIST2", price)
+            await pipe.execute()
+    assert [e[1]["p"] for e in await r.xrange(tick_history.key("HIST2"))] == ["10.0", "10.5", "10.0"]
+    await r.close()
+
+
+def test_downsample_buckets_ohlc():
+    from tick_history import downsample
+    ticks = [(0, 10.0), (400, 12.0), (900, 9.0), (1000, 11.0), (2999, 13.0)]
+    width, points = downsample(ticks, 3)
+    assert width == 1000
+    assert [(p["open"], p["high"], p["low"], p["close"], p["ticks"]) for p in points] == [(10.0, 12.0, 9.0, 9.0, 3), (11.0, 11.0, 11.0, 11.0, 1), (13.0, 13.0, 13.0, 13.0, 1)]
+    # Intervalos sem ticks são omitidos e o início do intervalo data o ponto
+    width, points = downsample(ticks, 2, start_ms=0, end_ms=5999)
+    assert width == 3000 and len(points) == 1 and points[0]["timestamp"] == datetime.fromtimestamp(0)
+    assert downsample([], 10) == (0, [])
+
+@pytest.mark.asyncio
+async def test_intraday_endpoint(test_app, monkeypatch):
+    import tick_history
+    seen = []
+
+    async def entries(symbol, start_ms=None, end_ms=None):
+        seen.append((symbol, start_ms, end_ms))
+        return [(i * 1000, 100.0 + i) for i in range(11)]
+
+    monkeypatch.setattr(tick_history, "entries", entries)
+    r = await test_app.get("/api/prices/aapl/intraday", params={"points": 5})
+    assert r.status_code == 200
+    body = r.json()
+    assert body["symbol"] == "AAPL" and body["interval_seconds"] == 2.0
+    assert [(p["open"], p["close"]) for p in body["points"]] == [(100.0, 101.0), (102.0, 103.0), (104.0, 105.0), (106.0, 107.0), (108.0, 110.0)]
+    assert seen == [("aapl", None, None)]
+    r = await test_app.get("/api/prices/AAPL/intraday", params={"points": tick_history.MAX_POINTS + 1})
+    assert r.status_code == 422
@@ -0,0 +1,240 @@
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+
+@pytest.fixture
+def cached_prices(monkeypatch):
+    """Substitui o cache Redis por um dicionário em memória e conta idas ao Yahoo."""
+    import price_feed
+    prices = {"AAPL": {"price": 110.0, "previous_close": 100.0}, "MSFT": {"price": 50.0, "previous_close": 50.0}, "VALE3.SA": {"price": 60.0, "previous_close": None}}
+    upstream = []
+
+    async def get_cached_quotes(symbols):
+        return {s: prices[s] for s in symbols if s in prices}
+
+    async def refresh_quotes(symbols):
+        upstream.append(list(symbols))
+        return 0
+
+    clock = iter(range(1_718_035_200_000, 1_718_035_300_000, 1000))
+
+    async def redis_time_ms():
+        return next(clock)
+
+    monkeypatch.setattr(price_feed.pricing, "get_cached_quotes", get_cached_quotes)
+    monkeypatch.setattr(price_feed.pricing, "refresh_quotes", refresh_quotes)
+    monkeypatch.setattr(price_feed.pricing, "redis_time_ms", redis_time_ms)
+    return upstream
+
+
+def test_dashboard_subscription_sends_only_changed_fields():
+    from websocket import DashboardSubscription
+    sub = DashboardSubscription()
+    sub.subscribe(["aapl", "MSFT"])
+    snap = sub.snapshot({"AAPL": {"price": 1.0, "change": 0.1, "change_percent": 1.0}, "MSFT": {"price": 2.0, "change": 0.0, "change_percent": 0.0}})
+    assert snap["seq"] == 1 and [d["ticker"] for d in snap["data"]] == ["AAPL", "MSFT"]
+    delta = sub.delta({"AAPL": {"price": 1.5, "change": 0.1, "change_percent": 1.0}, "MSFT": {"price": 2.0, "change": 0.0, "change_percent": 0.0}})
+    assert delta["seq"] == 2 and delta["data"] == [{"ticker": "AAPL", "price": 1.5}]
+    assert sub.delta({"AAPL": {"price": 1.5, "change": 0.1, "change_percent": 1.0}}) is None
+
+
+def test_dashboard_protocol_subscribe_unsubscribe(cached_prices):
+    from main import app
+    with TestClient(app) as client, client.websocket_connect("/ws/dashboard") as ws:
+        ws.send_json({"action": "subscribe", "symbols": ["AAPL", "VALE3.SA"]})
+        snap = ws.receive_json()
+        assert snap["type"] == "snapshot" and {d["ticker"] for d in snap["data"]} == {"AAPL", "VALE3.SA"}
+        aapl = next(d for d in snap["data"] if d["ticker"] == "AAPL")
+        assert aapl["change"] == 10.0 and aapl["change_percent"] == 10.0
+        ws.send_json({"action": "unsubscribe", "symbols": ["AAPL"]})
+        msg = ws.receive_json()
+        assert msg == {"type": "unsubscribed", "seq": snap["seq"] + 1, "symbols": ["AAPL"]}
+        ws.send_json({"action": "bogus"})
+        assert ws.receive_json()["type"] == "error"
+        ws.send_json({"action": "subscribe", "symbols": "AAPL"})  # string não vira "A", "P", "L"
+        assert ws.receive_json() == {"type": "error", "detail": "`symbols` deve ser uma lista"}
+        ws.send_json({"action": "snapshot"})
+        assert [d["ticker"] for d in ws.receive_json()["data"]] == ["VALE3.SA"]
+
+
+async def test_conflation_and_slow_consumer_eviction(monkeypatch):
+    import asyncio
+
+    import websocket as ws_mod
+
+    class StuckSocket:
+        scope, query_params = {}, {}
+        def __init__(self):
+            self.sent, self.closed_with = [], None
+        async def accept(self, subprotocol=None):
+            pass
+        async def send_text(self, text):
+            self.sent.append(text)
+            await asyncio.Event().wait()  # cliente que nunca lê
+        async def close(self, code=1000):
+            self.closed_with = code
+
+    monkeypatch.setattr(ws_mod, "SLOW_CONSUMER_DEPTH", 2)
+    monkeypatch.setattr(ws_mod, "SLOW_CONSUMER_SECONDS", 0.0)
+    mgr = ws_mod.ConnectionManager()
+    sock = StuckSocket()
+    conn = await mgr.connect(sock)
+    mgr.send(conn, "first", key="AAPL")
+    await asyncio.sleep(0)  # escritor fica preso no primeiro envio
+    mgr.send(conn, "a1", key="AAPL")
+    mgr.send(conn, "a2", key="AAPL")
+    assert len(conn.queue) == 1 and mgr.stats["messages_conflated"] == 1
+    mgr.send(conn, "m1", key="MSFT")
+    await asyncio.sleep(0.01)
+    mgr.send(conn, "m2", key="PETR4.SA")
+    await asyncio.sleep(0)
+    assert mgr.stats["evictions"] == 1 and conn.id not in mgr.connections
+    assert sock.closed_with == ws_mod.CLOSE_SLOW_CONSUMER
+    await asyncio.gather(conn.writer, return_exceptions=True)
+
+
+def test_encoding_negotiation_msgpack_and_columnar(cached_prices):
+    import msgpack
+
+    from main import app
+    with TestClient(app) as client:
+        with client.websocket_connect("/ws/dashboard", subprotocols=["msgpack"]) as ws:
+            assert ws.accepted_subprotocol == "msgpack"
+            ws.send_json({"action": "subscribe", "symbols": ["AAPL"]})
+            snap = msgpack.unpackb(ws.receive_bytes())
+            assert snap["type"] == "snapshot" and isinstance(snap["timestamp"], int)
+        with client.websocket_connect("/ws/dashboard?encoding=columnar") as ws:
+            ws.send_json({"action": "subscribe", "symbols": ["AAPL", "MSFT"]})
+            frame = msgpack.unpackb(ws.receive_bytes(), strict_map_key=False)
+            names = dict((i, t) for i, t in frame["dict"])
+            assert [names[i] for i in frame["sym"]] == ["AAPL", "MSFT"] and len(frame["price"]) == 2
+
+
+async def test_price_feed_shares_upstream_calls(cached_prices):
+    import asyncio
+
+    from price_feed import PriceFeed
+    feed = PriceFeed(interval=3600)
+    for _ in range(1000):
+        feed.subscribe(["AAPL", "TSLA"])
+    results = await asyncio.gather(*[feed.ensure(["AAPL", "TSLA"]) for _ in range(1000)])
+    assert results[0]["AAPL"]["price"] == 110.0
+    assert cached_prices == [["TSLA"]]  # um único refresh para o ticker fora do cache
+    for _ in range(1000):
+        feed.unsubscribe(["AAPL", "TSLA"])
+    assert feed.symbols == [] and feed._task is None
+
+
+def test_replay_frame_keeps_tick_times_in_every_encoding():
+    import json
+    from datetime import datetime
+
+    import msgpack
+
+    from ws_encoding import ColumnarEncoder, JsonEncoder, MsgpackEncoder
+    t1, t2 = datetime(2024, 6, 10, 10, 0, 0, 123000), datetime(2024, 6, 10, 10, 0, 1, 456000)
+    ms = [int(t.timestamp() * 1000) for t in (t1, t2)]
+    replay = {"type": "replay", "channel": "prices", "data": [
+        {"ticker": "AAPL", "price": 108.0, "timestamp": t1}, {"ticker": "MSFT", "price": 49.0, "timestamp": t2}]}
+    assert [d["timestamp"] for d in json.loads(JsonEncoder().encode(replay))["data"]] == [t1.isoformat(), t2.isoformat()]
+    packed = msgpack.unpackb(MsgpackEncoder().encode(replay))
+    assert [(d["ticker"], d["price"], d["timestamp"]) for d in packed["data"]] == [("AAPL", 108.0, ms[0]), ("MSFT", 49.0, ms[1])]
+    frame = msgpack.unpackb(ColumnarEncoder().encode(replay), strict_map_key=False)
+    names = dict((i, t) for i, t in frame["dict"])
+    assert frame["type"] == "replay" and frame["ts"] == ms
+    assert [names[i] for i in frame["sym"]] == ["AAPL", "MSFT"] and frame["price"] == [108.0, 49.0]
+    # Quotes e batches seguem sem instante por linha
+    batch = {"type": "batch", "timestamp": t2, "data": [{"ticker": "AAPL", "price": 1.0, "timestamp": t1}]}
+    assert "timestamp" not in msgpack.unpackb(MsgpackEncoder().encode(batch))["data"][0]
+
+
+def test_heartbeat_evicts_silent_clients_and_stats(cached_prices, monkeypatch):
+    import time
+
+    import websocket as ws_mod
+    from main import app
+    app_stats = ws_mod.manager.metrics
+    monkeypatch.setattr(ws_mod, "HEARTBEAT_INTERVAL", 0.05)
+    monkeypatch.setattr(ws_mod, "HEARTBEAT_TIMEOUT", 0.2)
+    with TestClient(app) as client:
+        token = client.post("/api/token", data={"username": "admin@example.com", "password": "admin123"}).json()["access_token"]
+        with client.websocket_connect("/ws/prices/aapl") as ws:
+            assert ws.receive_json()["ticker"] == "AAPL"
+            stats = client.get("/ws/stats", headers={"Authorization": f"Bearer {token}"}).json()
+            assert stats["connections"] == 1 and stats["subscriptions"] == {"AAPL": 1}
+            assert ws.receive_json() == {"type": "ping"}
+            time.sleep(0.3)  # não responde ao ping
+            with pytest.raises(WebSocketDisconnect) as exc:
+                while True:
+                    ws.receive_json()
+            assert exc.value.code == ws_mod.CLOSE_HEARTBEAT_TIMEOUT
+        assert app_stats()["heartbeat_evictions"] >= 1
+
+
+def test_multiplexed_stream_protocol(cached_prices):
+    from main import app
+    with TestClient(app) as client, client.websocket_connect("/ws/stream") as ws:
+        ws.send_json({"action": "subscribe", "channel": "prices", "symbols": ["aapl", "MSFT", "VALE3.SA"]})
+        assert ws.receive_json() == {"type": "subscribed", "channel": "prices", "symbols": ["AAPL", "MSFT", "VALE3.SA"]}
+        batch = ws.receive_json()
+        assert batch["type"] == "batch" and batch["channel"] == "prices" and batch["seq"] == 1
+        assert [d["ticker"] for d in batch["data"]] == ["AAPL", "MSFT", "VALE3.SA"]
+        ws.send_json({"action": "unsubscribe", "channel": "prices", "symbols": ["MSFT"]})
+        assert ws.receive_json() == {"type": "unsubscribed", "channel": "prices", "symbols": ["MSFT"]}
+        ws.send_json({"action": "subscribe", "channel": "news", "symbols": ["AAPL"]})
+        assert ws.receive_json()["type"] == "error"
+
+
+async def test_stream_batches_ticks_in_the_same_interval(monkeypatch):
+    import asyncio
+    import json
+
+    import websocket as ws_mod
+
+    class Socket:
+        scope, query_params = {}, {}
+        def __init__(self):
+            self.sent = []
+        async def accept(self, subprotocol=None):
+            pass
+        async def send_text(self, text):
+            self.sent.append(json.loads(text))
+
+    monkeypatch.setattr(ws_mod.feed, "quotes", {"AAPL": {"price": 1.0}, "MSFT": {"price": 2.0}, "TSLA": {"price": 3.0}})
+    mgr = ws_mod.ConnectionManager()
+    sock = Socket()
+    conn = await mgr.connect(sock)
+    sub = ws_mod.StreamSubscription(conn, mgr, interval=0.05)
+    sub.subscribe(["AAPL", "MSFT"])
+    sub.on_quotes(["AAPL"])
+    sub.on_quotes(["MSFT", "TSLA"])  # TSLA não assinado
+    await asyncio.sleep(0.1)
+    assert [[d["ticker"] for d in f["data"]] for f in sock.sent] == [["AAPL", "MSFT"]]
+    mgr.disconnect(conn)
+    await asyncio.gather(conn.writer, return_exceptions=True)
+
+
+def test_stream_replays_missed_ticks_on_resubscribe(cached_prices, monkeypatch):
+    import websocket as ws_mod
+    calls = []
+
+    async def since(symbols, after_ms):
+        calls.append((sorted(symbols), after_ms))
+        return [(after_ms + 10, "AAPL", 108.0), (after_ms + 20, "MSFT", 49.0)]
+
+    monkeypatch.setattr(ws_mod.tick_history, "since", since)
+    from main import app
+    with TestClient(app) as client, client.websocket_connect("/ws/stream") as ws:
+        ws.send_json({"action": "subscribe", "channel": "prices", "symbols": ["AAPL"]})
+        ws.receive_json()
+        cursor = ws.receive_json()["cursor"]
+        assert calls == []  # sem `since`, nada de replay
+    with TestClient(app) as client, client.websocket_connect("/ws/stream") as ws:
+        ws.send_json({"action": "subscribe", "channel": "prices", "symbols": ["AAPL", "MSFT"], "since": cursor})
+        assert ws.receive_json()["type"] == "subscribed"
+        replay = ws.receive_json()
+        assert replay["type"] == "replay" and [(d["ticker"], d["price"]) for d in replay["data"]] == [("AAPL", 108.0), ("MSFT", 49.0)]
+        batch = ws.receive_json()
+        assert batch["type"] == "batch" and batch["cursor"] > cursor  # relógio do Redis, não o local
+        assert calls == [(["AAPL", "MSFT"], cursor)]
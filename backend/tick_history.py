@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+import math
+import os
+import time
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Any
+
+import pricing
+
+# Histórico intradiário de cotações em Redis Streams, um stream `ticks:{TICKER}`
+# por ticker, gravado por `pricing.refresh_quotes`. O tamanho é limitado por
+# MAXLEN e a idade por XTRIM MINID, ambos aproximados (~) para o Redis cortar
+# por nó inteiro. O id do Redis (`<ms>-<n>`) é o
+# instante do tick e serve de cursor para o replay dos WebSockets.
+MAXLEN = int(os.environ.get("TICK_HISTORY_MAXLEN", "5000"))
+RETENTION = float(os.environ.get("TICK_HISTORY_RETENTION_HOURS", "24")) * 3600
+MAX_POINTS = int(os.environ.get("INTRADAY_MAX_POINTS", "1000"))
+REPLAY_LIMIT = int(os.environ.get("WS_REPLAY_LIMIT", "500"))
+
+Tick = tuple[int, float]  # (epoch em ms, preço)
+
+def key(symbol: str) -> str:
+    return f"ticks:{symbol.upper()}"
+
+# Grava o tick só se o preço difere do último do stream: fora do pregão o
+# Yahoo repete a mesma cotação a cada ciclo. A comparação roda no Redis porque
+# mais de um processo atualiza cotações (trava do `price_feed`,
+# `PriceFeed.ensure`, aquecimento do Celery); um dicionário por processo
+# duplicaria ticks e poderia perder mudanças (A→B num, B→A noutro).
+_RECORD = """
+local last = redis.call('XREVRANGE', KEYS[1], '+', '-', 'COUNT', 1)[1]
+if last and tonumber(last[2][2]) == tonumber(ARGV[1]) then return 0 end
+redis.call('XADD', KEYS[1], 'MAXLEN', '~', ARGV[2], '*', 'p', ARGV[1])
+redis.call('XTRIM', KEYS[1], 'MINID', '~', ARGV[3])
+return 1
+"""
+
+def record(pipe: Any, symbol: str, price: float, now: float | None = None) -> None:
+    """Enfileira no pipeline o tick (se o preço mudou) e o corte do stream por idade."""
+    now = time.time() if now is None else now
+    pipe.eval(_RECORD, 1, key(symbol), str(price), MAXLEN, str(int((now - RETENTION) * 1000)))
+
+def _parse(entries: Iterable[tuple[str, dict[str, str]]]) -> list[Tick]:
+    out: list[Tick] = []
+    for entry_id, fields in entries:
+        try:
+            out.append((int(entry_id.split("-", 1)[0]), float(fields["p"])))
+        except (KeyError, ValueError):
+            continue
+    return out
+
+async def entries(symbol: str, start_ms: int | None = None, end_ms: int | None = None) -> list[Tick]:
+    """Ticks de `symbol` entre os instantes dados (XRANGE, limites inclusivos)."""
+    r = await pricing._get_redis()
+    raw = await r.xrange(key(symbol), "-" if start_ms is None else start_ms, "+" if end_ms is None else end_ms)
+    return _parse(raw)
+
+async def since(symbols: Iterable[str], after_ms: int, limit: int = REPLAY_LIMIT) -> list[tuple[int, str, float]]:
+    """Ticks gravados depois de `after_ms`, de vários tickers, em ordem de tempo.
+
+    Usa um pipeline com um XRANGE exclusivo por ticker; cada ticker traz no
+    máximo os `limit` ticks mais antigos após o cursor (resolução de 1 ms).
+    """
+    symbols = [s.upper() for s in symbols]
+    if not symbols:
+        return []
+    r = await pricing._get_redis()
+    async with r.pipeline(transaction=False) as pipe:
+        for s in symbols:
+            pipe.xrange(key(s), after_ms + 1, "+", count=limit)
+        results = await pipe.execute()
+    ticks = [(ms, s, price) for s, raw in zip(symbols, results) for ms, price in _parse(raw)]
+    ticks.sort()
+    return ticks
+
+def downsample(ticks: list[Tick], points: int, start_ms: int | None = None, end_ms: int | None = None) -> tuple[int, list[dict[str, Any]]]:
+    """Agrupa os ticks em até `points` intervalos iguais com abertura/máxima/mínima/fechamento.
+
+    Retorna a largura do intervalo em ms e os pontos não vazios, cada um
+    datado pelo início do seu intervalo.
+    """
+    if not ticks:
+        return 0, []
+    start = ticks[0][0] if start_ms is None else start_ms
+    end = ticks[-1][0] if end_ms is None else end_ms
+    points = max(1, points)
+    width = max(1, math.ceil((end - start) / points))
+    buckets: dict[int, dict[str, Any]] = {}
+    for ms, price in ticks:
+        if ms < start or ms > end:
+            continue
+        b = min((ms - start) // width, points - 1)  # o instante final cai no último intervalo
+        bucket = buckets.get(b)
+        if bucket is None:
+            buckets[b] = {"timestamp": datetime.fromtimestamp((start + b * width) / 1000),
+                          "open": price, "high": price, "low": price, "close": price, "ticks": 1}
+        else:
+            bucket["high"] = max(bucket["high"], price)
+            bucket["low"] = min(bucket["low"], price)
+            bucket["close"] = price
+            bucket["ticks"] += 1
+    return width, [buckets[b] for b in sorted(buckets)]
@@ -1,149 +1,635 @@
 from __future__ import annotations
-import asyncio, json, random
-from typing import Dict, List
+
+import asyncio
+import itertools
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Callable, Hashable, Iterable
 from datetime import datetime
+from typing import Any
+
 from fastapi import WebSocket, WebSocketDisconnect
 
+import tick_history
+import ws_encoding
+from price_feed import feed
+
+logger = logging.getLogger("websocket")
+
+# Limites de fila de saída por conexão (backpressure)
+SEND_QUEUE_SIZE = int(os.environ.get("WS_SEND_QUEUE_SIZE", "256"))
+SLOW_CONSUMER_DEPTH = int(os.environ.get("WS_SLOW_CONSUMER_DEPTH", "64"))
+SLOW_CONSUMER_SECONDS = float(os.environ.get("WS_SLOW_CONSUMER_SECONDS", "15"))
+SEND_TIMEOUT = float(os.environ.get("WS_SEND_TIMEOUT", "10"))
+# Código de fechamento "Try Again Later" (RFC 6455 / IANA)
+CLOSE_SLOW_CONSUMER = 1013
+
+# Heartbeat: o servidor envia {"type": "ping"} e o cliente responde {"action": "pong"}
+HEARTBEAT_INTERVAL = float(os.environ.get("WS_HEARTBEAT_INTERVAL", "10"))
+HEARTBEAT_TIMEOUT = float(os.environ.get("WS_HEARTBEAT_TIMEOUT", "25"))
+CLOSE_HEARTBEAT_TIMEOUT = 4408
+PONG = '{"action":"pong"}'
+
+# Um payload é um frame já codificado, uma mensagem (dict) a ser codificada
+# conforme a negociação da conexão, ou uma função que gera a mensagem no
+# momento do envio (retornando None quando não há nada a enviar).
+Message = dict[str, Any]
+Payload = str | bytes | Message | Callable[[], Message | None]
+
+class ConflatingQueue:
+    """Fila limitada de mensagens com conflação por chave.
+
+    Mensagens com a mesma chave (ex.: o ticker) que ainda não foram enviadas
+    são substituídas pela mais recente, mantendo a posição original na fila.
+    Mensagens sem chave nunca são conflacionadas.
+    """
+
+    def __init__(self, maxsize: int = SEND_QUEUE_SIZE) -> None:
+        self.maxsize = maxsize
+        self._items: OrderedDict[Hashable, Payload] = OrderedDict()
+        self._ready = asyncio.Event()
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def put(self, payload: Payload, key: Hashable | None = None) -> bool:
+        """Enfileira `payload`; retorna True se substituiu uma mensagem pendente.
+
+        Lança `asyncio.QueueFull` se a fila estiver cheia e a chave for nova.
+        """
+        if key is None:
+            key = ("_unkeyed", next(self._seq))
+        if key in self._items:
+            self._items[key] = payload
+            return True
+        if len(self._items) >= self.maxsize:
+            raise asyncio.QueueFull()
+        self._items[key] = payload
+        self._ready.set()
+        return False
+
+    async def get(self) -> Payload:
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        _, payload = self._items.popitem(last=False)
+        return payload
+
+class Connection:
+    """Conexão WebSocket com fila de saída própria drenada por uma task escritora.
+
+    `on_quotes` é chamado pelo gerenciador com os tickers assinados pela
+    conexão cujas cotações mudaram no `price_feed`.
+    """
+
+    def __init__(self, websocket: WebSocket, encoder: Any = None, maxsize: int = SEND_QUEUE_SIZE) -> None:
+        self.id = uuid.uuid4().hex
+        self.websocket = websocket
+        self.encoder = encoder or ws_encoding.JsonEncoder()
+        self.queue = ConflatingQueue(maxsize)
+        self.closed = asyncio.Event()
+        self.lagging_since: float | None = None
+        self.last_seen = time.monotonic()
+        self.symbols: set[str] = set()
+        self.on_quotes: Callable[[Connection, list[str]], None] | None = None
+        self.writer: asyncio.Task | None = None
+
 # Gerenciador de conexões WebSocket
 class ConnectionManager:
+    """Registro de conexões indexado por ID, com índice ticker -> conexões.
+
+    Assinar, cancelar e desconectar são O(1) por ticker, e atualizações de
+    cotação chegam só às conexões que assinam o ticker alterado. Um heartbeat
+    envia `ping` periódico e desconecta quem não responde (conexões TCP
+    meio-abertas) em até `HEARTBEAT_TIMEOUT` segundos.
+    """
+
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        self.connections: dict[str, Connection] = {}
+        self.subscribers: dict[str, set[str]] = {}
+        self.stats: dict[str, int] = {
+            "messages_sent": 0, "messages_conflated": 0, "evictions": 0,
+            "heartbeat_evictions": 0, "send_errors": 0,
+        }
+        self._heartbeat: asyncio.Task | None = None
+
+    @property
+    def active_connections(self) -> list[WebSocket]:
+        return [c.websocket for c in self.connections.values()]
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+    async def connect(self, websocket: WebSocket) -> Connection:
+        encoder, subprotocol = ws_encoding.negotiate(
+            websocket.scope.get("subprotocols") or [], websocket.query_params.get("encoding")
+        )
+        await websocket.accept(subprotocol=subprotocol)
+        conn = Connection(websocket, encoder)
+        conn.writer = asyncio.create_task(self._writer(conn))
+        self.connections[conn.id] = conn
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+        return conn
 
-    def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+    def disconnect(self, conn: Connection) -> None:
+        if self.connections.pop(conn.id, None) is None:
+            return
+        self.unsubscribe(conn, list(conn.symbols))
+        conn.closed.set()
+        if conn.writer is not None and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+        if not self.connections and self._heartbeat is not None:
+            if self._heartbeat is not asyncio.current_task():
+                self._heartbeat.cancel()
+            self._heartbeat = None
 
-    async def send_personal_message(self, message: str, websocket: WebSocket):
+    def subscribe(self, conn: Connection, symbols: Iterable[str]) -> list[str]:
+        added = [s for s in symbols if s not in conn.symbols]
+        for s in added:
+            conn.symbols.add(s)
+            self.subscribers.setdefault(s, set()).add(conn.id)
+        feed.subscribe(added)
+        return added
+
+    def unsubscribe(self, conn: Connection, symbols: Iterable[str]) -> list[str]:
+        removed = [s for s in symbols if s in conn.symbols]
+        for s in removed:
+            conn.symbols.discard(s)
+            ids = self.subscribers.get(s)
+            if ids is not None:
+                ids.discard(conn.id)
+                if not ids:
+                    del self.subscribers[s]
+        feed.unsubscribe(removed)
+        return removed
+
+    def notify(self, symbols: Iterable[str]) -> None:
+        """Repassa tickers alterados apenas às conexões que os assinam."""
+        targets: dict[str, list[str]] = {}
+        for s in symbols:
+            for cid in self.subscribers.get(s, ()):
+                targets.setdefault(cid, []).append(s)
+        for cid, changed in targets.items():
+            conn = self.connections.get(cid)
+            if conn is not None and conn.on_quotes is not None:
+                conn.on_quotes(conn, changed)
+
+    def send(self, conn: Connection, payload: Payload, key: Hashable | None = None) -> None:
+        """Enfileira uma mensagem sem bloquear; consumidores lentos são desconectados."""
+        if conn.closed.is_set():
+            return
+        try:
+            if conn.queue.put(payload, key):
+                self.stats["messages_conflated"] += 1
+        except asyncio.QueueFull:
+            self._evict(conn, "fila de envio cheia")
+            return
+        depth = len(conn.queue)
+        if depth < SLOW_CONSUMER_DEPTH:
+            conn.lagging_since = None
+            return
+        now = asyncio.get_running_loop().time()
+        if conn.lagging_since is None:
+            conn.lagging_since = now
+        elif now - conn.lagging_since > SLOW_CONSUMER_SECONDS:
+            self._evict(conn, f"{depth} mensagens pendentes há mais de {SLOW_CONSUMER_SECONDS:.0f}s")
+
+    def publish(self, symbol: str, message: Payload) -> None:
+        """Envia `message` só aos assinantes de `symbol` (conflacionando pelo ticker)."""
+        conns = [self.connections[cid] for cid in self.subscribers.get(symbol, ()) if cid in self.connections]
+        self._fan_out(conns, message, symbol)
+
+    async def broadcast(self, message: Payload, key: Hashable | None = None) -> None:
+        self._fan_out(list(self.connections.values()), message, key)
+
+    def _fan_out(self, conns: list[Connection], message: Payload, key: Hashable | None) -> None:
+        # Codificadores sem estado (json/msgpack) codificam a mensagem uma única vez
+        encoded: dict[str, Any] = {}
+        for conn in conns:
+            payload = message
+            if isinstance(message, dict) and conn.encoder.stateless:
+                name = conn.encoder.name
+                if name not in encoded:
+                    encoded[name] = conn.encoder.encode(message)
+                payload = encoded[name]
+            self.send(conn, payload, key)
+
+    async def receive(self, conn: Connection, timeout: float) -> str | None:
+        """Lê um comando do cliente por até `timeout` segundos.
+
+        Qualquer mensagem recebida conta como sinal de vida; `pong` é
+        consumido aqui e, assim como o timeout, retorna None.
+        """
+        try:
+            msg = await asyncio.wait_for(conn.websocket.receive(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return None
+        if msg["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(msg.get("code", 1000))
+        conn.last_seen = time.monotonic()
+        raw = msg.get("text")
+        if raw is None and msg.get("bytes") is not None:
+            raw = msg["bytes"].decode("utf-8", errors="replace")
+        if raw is None or raw.replace(" ", "") == PONG:
+            return None
+        return raw
+
+    def metrics(self) -> dict[str, int]:
+        depths = [len(c.queue) for c in self.connections.values()]
+        return {
+            "connections": len(depths),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+            **self.stats,
+        }
+
+    def snapshot_stats(self) -> dict[str, Any]:
+        """Resumo para `/ws/stats`: conexões, assinantes por ticker e remoções."""
+        return {
+            **self.metrics(),
+            "subscriptions": {s: len(ids) for s, ids in sorted(self.subscribers.items())},
+        }
+
+    def _evict(self, conn: Connection, reason: str, code: int = CLOSE_SLOW_CONSUMER, stat: str = "evictions") -> None:
+        if conn.closed.is_set():
+            return
+        logger.warning("Desconectando conexão %s: %s", conn.id, reason)
+        self.stats[stat] += 1
+        self.disconnect(conn)
+        asyncio.create_task(self._close(conn.websocket, code))
+
+    @staticmethod
+    async def _close(websocket: WebSocket, code: int) -> None:
         try:
-            await websocket.send_text(message)
-        except:
-            self.disconnect(websocket)
+            await websocket.close(code=code)
+        except Exception:
+            pass
 
-    async def broadcast(self, message: str):
-        disconnected = []
-        for connection in self.active_connections:
+    async def _heartbeat_loop(self) -> None:
+        while self.connections:
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+            now = time.monotonic()
+            for conn in list(self.connections.values()):
+                if now - conn.last_seen > HEARTBEAT_TIMEOUT:
+                    self._evict(conn, "sem resposta ao heartbeat", CLOSE_HEARTBEAT_TIMEOUT, "heartbeat_evictions")
+                else:
+                    self.send(conn, {"type": "ping"}, key="ping")
+
+    async def _writer(self, conn: Connection) -> None:
+        while True:
+            payload = await conn.queue.get()
+            if len(conn.queue) < SLOW_CONSUMER_DEPTH:
+                conn.lagging_since = None
             try:
-                await connection.send_text(message)
-            except:
-                disconnected.append(connection)
-        
-        # Remove conexões desconectadas
-        for conn in disconnected:
-            self.disconnect(conn)
+                frame = payload() if callable(payload) else payload
+                if frame is None:
+                    continue
+                if isinstance(frame, dict):
+                    frame = conn.encoder.encode(frame)
+                if isinstance(frame, bytes):
+                    await asyncio.wait_for(conn.websocket.send_bytes(frame), timeout=SEND_TIMEOUT)
+                else:
+                    await asyncio.wait_for(conn.websocket.send_text(frame), timeout=SEND_TIMEOUT)
+                self.stats["messages_sent"] += 1
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                self._evict(conn, f"envio excedeu {SEND_TIMEOUT:.0f}s")
+                return
+            except Exception as e:
+                logger.info("Falha ao enviar mensagem WebSocket: %s", e)
+                self.stats["send_errors"] += 1
+                self.disconnect(conn)
+                return
 
 manager = ConnectionManager()
+feed.listeners.append(manager.notify)
 
-# Cache simples de preços para simular dados reais
-price_cache = {
-    "AAPL": 150.25,
-    "GOOGL": 2800.50,
-    "MSFT": 350.75,
-    "TSLA": 800.30,
-    "AMZN": 3200.15,
-    "PETR4.SA": 35.80,
-    "VALE3.SA": 68.45,
-    "ITUB4.SA": 28.90
-}
-
-def get_simulated_price(symbol: str) -> float:
-    """Gera preços simulados com variação realística."""
-    base_price = price_cache.get(symbol, 100.0)
-    # Variação de -2% a +2%
-    variation = random.uniform(-0.02, 0.02)
-    new_price = base_price * (1 + variation)
-    price_cache[symbol] = new_price
-    return round(new_price, 2)
+def _tick(symbol: str) -> Message | None:
+    quote = feed.quotes.get(symbol)
+    return {"ticker": symbol, **quote, "timestamp": datetime.now()} if quote is not None else None
 
 async def price_stream(websocket: WebSocket, symbol: str = "AAPL") -> None:
     """Envia atualizações de preço via WebSocket para um ticker fornecido.
 
     O cliente conecta‑se em `/ws/prices/{symbol}` e recebe um JSON com
-    o ticker, o preço atual e um carimbo de tempo aproximado a cada 5s.
+    o ticker, o preço atual, a variação contra o fechamento anterior e um
+    carimbo de tempo (ou o frame equivalente na codificação negociada).
+    As cotações vêm do `price_feed` e só são enviadas quando mudam. O cliente
+    deve responder `{"action": "pong"}` às mensagens `{"type": "ping"}`.
+    Ticks ainda não enviados a um cliente lento são substituídos pelo mais recente.
     """
-    await manager.connect(websocket)
+    symbol = symbol.upper()
+    conn = await manager.connect(websocket)
+    conn.on_quotes = lambda c, _: manager.send(c, lambda: _tick(symbol), key=symbol)
     try:
-        while True:
-            try:
-                price = get_simulated_price(symbol)
-                change = round(random.uniform(-5, 5), 2)
-                change_percent = round(random.uniform(-3, 3), 2)
-                
-                payload: Dict[str, float | str] = {
-                    "ticker": symbol,
-                    "price": price,
-                    "timestamp": datetime.now().isoformat(),
-                    "change": change,
-                    "change_percent": change_percent
-                }
-                
-                await manager.send_personal_message(json.dumps(payload), websocket)
-                
-            except Exception as e:
-                print(f"Erro no WebSocket: {e}")
-                break
-            
-            await asyncio.sleep(5)
-            
+        manager.subscribe(conn, [symbol])
+        await feed.ensure([symbol])
+        manager.send(conn, lambda: _tick(symbol), key=symbol)
+        while not conn.closed.is_set():
+            await manager.receive(conn, HEARTBEAT_INTERVAL)
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
-        return
+        pass
     except Exception as e:
-        print(f"Erro geral no WebSocket: {e}")
-        manager.disconnect(websocket)
+        logger.warning("Erro no WebSocket de %s: %s", symbol, e)
+    finally:
+        manager.disconnect(conn)
+
+# === Protocolo de assinatura do dashboard ===
+# Cliente -> servidor (JSON):
+#   {"action": "subscribe", "symbols": ["AAPL", "PETR4.SA"]}
+#   {"action": "unsubscribe", "symbols": ["AAPL"]}
+#   {"action": "snapshot"}
+# Servidor -> cliente (JSON, todas as mensagens de estado carregam `seq`):
+#   {"type": "snapshot", "seq": 1, "timestamp": ..., "data": [{ticker, price, change, change_percent}, ...]}
+#   {"type": "delta", "seq": 2, "timestamp": ..., "data": [{"ticker": "AAPL", "price": 151.2}, ...]}
+#   {"type": "unsubscribed", "seq": 3, "symbols": [...]}
+#   {"type": "error", "detail": "..."}
+#   {"type": "ping"}  -> o cliente responde {"action": "pong"}
+# O cliente que detectar salto de `seq` deve pedir um novo `snapshot`.
+# Comandos do cliente são sempre texto JSON; as mensagens do servidor seguem a
+# codificação negociada na conexão (ver `ws_encoding`).
+MAX_DASHBOARD_SYMBOLS = int(os.environ.get("WS_MAX_SYMBOLS", "200"))
+_QUOTE_FIELDS = ("price", "change", "change_percent")
+
+class DashboardSubscription:
+    """Estado de assinatura de uma conexão do dashboard.
+
+    Guarda os símbolos assinados, o último valor enviado de cada campo e o
+    número de sequência, de modo que cada tick envie apenas os campos que
+    mudaram desde a última mensagem.
+    """
+
+    def __init__(self) -> None:
+        self.symbols: set[str] = set()
+        self.last_sent: dict[str, dict[str, float]] = {}
+        self.seq = 0
+        # Enquanto um snapshot está pendente, deltas são descartados: ele já
+        # levará as cotações mais recentes de todos os símbolos.
+        self.awaiting_snapshot = False
+
+    def _next_seq(self) -> int:
+        self.seq += 1
+        return self.seq
+
+    def subscribe(self, symbols: Iterable[str]) -> list[str]:
+        added = [s for s in _normalize_symbols(symbols) if s not in self.symbols]
+        room = MAX_DASHBOARD_SYMBOLS - len(self.symbols)
+        if len(added) > room:
+            raise ValueError(f"Limite de {MAX_DASHBOARD_SYMBOLS} símbolos por conexão")
+        self.symbols.update(added)
+        if added:
+            self.awaiting_snapshot = True
+        return added
+
+    def unsubscribe(self, symbols: Iterable[str]) -> list[str]:
+        removed = [s for s in _normalize_symbols(symbols) if s in self.symbols]
+        for s in removed:
+            self.symbols.discard(s)
+            self.last_sent.pop(s, None)
+        return removed
+
+    def snapshot(self, quotes: dict[str, dict[str, float]]) -> Message:
+        """Mensagem com o estado completo de todos os símbolos assinados."""
+        self.awaiting_snapshot = False
+        data = []
+        for symbol in sorted(self.symbols):
+            quote = quotes.get(symbol)
+            if quote is None:
+                continue
+            self.last_sent[symbol] = dict(quote)
+            data.append({"ticker": symbol, **quote})
+        return {"type": "snapshot", "seq": self._next_seq(), "timestamp": datetime.now(), "data": data}
+
+    def delta(self, quotes: dict[str, dict[str, float]]) -> Message | None:
+        """Mensagem apenas com os campos alterados; `None` se nada mudou."""
+        if self.awaiting_snapshot:
+            return None
+        data = []
+        for symbol in sorted(self.symbols):
+            quote = quotes.get(symbol)
+            if quote is None:
+                continue
+            previous = self.last_sent.get(symbol, {})
+            changed = {f: quote[f] for f in _QUOTE_FIELDS if f in quote and previous.get(f) != quote[f]}
+            if not changed:
+                continue
+            self.last_sent[symbol] = {**previous, **changed}
+            data.append({"ticker": symbol, **changed})
+        if not data:
+            return None
+        return {"type": "delta", "seq": self._next_seq(), "timestamp": datetime.now(), "data": data}
+
+    def unsubscribed(self, symbols: list[str]) -> Message:
+        return {"type": "unsubscribed", "seq": self._next_seq(), "symbols": symbols}
+
+def _normalize_symbols(symbols: Iterable[str]) -> list[str]:
+    out: list[str] = []
+    for s in symbols or []:
+        if isinstance(s, str) and s.strip():
+            sym = s.strip().upper()
+            if sym not in out:
+                out.append(sym)
+    return out
+
+def _send_error(conn: Connection, detail: str) -> None:
+    manager.send(conn, {"type": "error", "detail": detail})
+
+async def _handle_dashboard_command(conn: Connection, sub: DashboardSubscription, raw: str) -> None:
+    # As mensagens de estado são geradas no momento do envio, de modo que o
+    # `seq` siga a ordem real de entrega mesmo com conflação de deltas.
+    try:
+        msg = json.loads(raw)
+        action = msg.get("action")
+        symbols = msg.get("symbols") or []
+    except (ValueError, AttributeError):
+        _send_error(conn, "Mensagem inválida")
         return
+    if not isinstance(symbols, list):
+        _send_error(conn, "`symbols` deve ser uma lista")
+        return
+    if action == "subscribe":
+        try:
+            manager.subscribe(conn, sub.subscribe(symbols))
+        except ValueError as e:
+            _send_error(conn, str(e))
+            return
+        await feed.ensure(sub.symbols)
+        manager.send(conn, lambda: sub.snapshot(feed.quotes_for(sub.symbols)))
+    elif action == "unsubscribe":
+        removed = manager.unsubscribe(conn, sub.unsubscribe(symbols))
+        manager.send(conn, lambda: sub.unsubscribed(removed))
+    elif action == "snapshot":
+        sub.awaiting_snapshot = True
+        await feed.ensure(sub.symbols)
+        manager.send(conn, lambda: sub.snapshot(feed.quotes_for(sub.symbols)))
+    else:
+        _send_error(conn, f"Ação desconhecida: {action}")
 
 # WebSocket para múltiplos símbolos (dashboard)
 async def dashboard_price_stream(websocket: WebSocket) -> None:
-    """Envia atualizações de preços para múltiplos símbolos para o dashboard."""
-    await manager.connect(websocket)
-    
-    # Símbolos padrão para demonstração
-    symbols = ["AAPL", "GOOGL", "MSFT", "TSLA", "AMZN", "PETR4.SA", "VALE3.SA", "ITUB4.SA"]
-    
+    """Envia atualizações de preços dos símbolos assinados pelo dashboard.
+
+    A conexão começa sem assinaturas; o cliente envia `subscribe` com os
+    tickers desejados e recebe um `snapshot` completo. Quando o `price_feed`
+    atualiza algum ticker assinado, o servidor envia apenas um `delta` com os
+    campos que mudaram; se o cliente estiver atrasado, deltas pendentes são
+    fundidos em um só.
+    """
+    conn = await manager.connect(websocket)
+    sub = DashboardSubscription()
+    # O delta é calculado no envio, contra as cotações mais recentes do feed
+    conn.on_quotes = lambda c, _: manager.send(c, lambda: sub.delta(feed.quotes_for(sub.symbols)), key="delta")
     try:
-        while True:
-            try:
-                prices_data = []
-                
-                for symbol in symbols:
-                    try:
-                        price = get_simulated_price(symbol)
-                        change = round(random.uniform(-5, 5), 2)
-                        change_percent = round(random.uniform(-3, 3), 2)
-                        
-                        prices_data.append({
-                            "ticker": symbol,
-                            "price": price,
-                            "change": change,
-                            "change_percent": change_percent,
-                            "timestamp": datetime.now().isoformat()
-                        })
-                    except Exception as e:
-                        print(f"Erro ao obter preço para {symbol}: {e}")
-                        continue
-                
-                payload = {
-                    "type": "price_update",
-                    "data": prices_data,
-                    "timestamp": datetime.now().isoformat()
-                }
-                
-                await manager.send_personal_message(json.dumps(payload), websocket)
-                
-            except Exception as e:
-                print(f"Erro no dashboard WebSocket: {e}")
-                await asyncio.sleep(5)
-            
-            await asyncio.sleep(5)
-            
+        while not conn.closed.is_set():
+            raw = await manager.receive(conn, HEARTBEAT_INTERVAL)
+            if raw is not None:
+                await _handle_dashboard_command(conn, sub, raw)
     except WebSocketDisconnect:
-        manager.disconnect(websocket)
-        return
+        pass
     except Exception as e:
-        print(f"Erro geral no dashboard WebSocket: {e}")
-        manager.disconnect(websocket)
+        logger.warning("Erro no WebSocket do dashboard: %s", e)
+    finally:
+        manager.disconnect(conn)
+
+# === Stream multiplexado (/ws/stream) ===
+# Um socket por aba carrega qualquer número de assinaturas, marcadas por canal.
+# Cliente -> servidor (JSON):
+#   {"action": "subscribe", "channel": "prices", "symbols": ["AAPL", "PETR4.SA"], "since": 1718035200123}
+#   {"action": "unsubscribe", "channel": "prices", "symbols": ["AAPL"]}
+# Servidor -> cliente:
+#   {"type": "subscribed", "channel": "prices", "symbols": [...]}
+#   {"type": "replay", "channel": "prices", "data": [{ticker, price, timestamp}, ...]}
+#   {"type": "batch", "channel": "prices", "seq": 4, "cursor": 1718035200456, "timestamp": ..., "data": [{ticker, price, change, change_percent}, ...]}
+#   {"type": "unsubscribed", "channel": "prices", "symbols": [...]}
+#   {"type": "error", "detail": "..."}
+#   {"type": "ping"}  -> o cliente responde {"action": "pong"}
+# Ticks que chegam dentro da mesma janela de STREAM_BATCH_INTERVAL saem num
+# único `batch` com a cotação atual de cada ticker alterado. Ao reconectar, o
+# cliente envia em `since` o `cursor` do último batch recebido e recebe num
+# `replay` os ticks perdidos, lidos do histórico (`tick_history`), antes do
+# batch com a cotação atual. O cursor é um instante do relógio do Redis (epoch
+# em ms, a base dos ids dos ticks; ver `PriceFeed.cursor`) e pode ser null
+# enquanto alguma assinatura não foi carregada.
+STREAM_BATCH_INTERVAL = float(os.environ.get("WS_STREAM_BATCH_MS", "250")) / 1000
+STREAM_CHANNELS = ("prices",)
+
+class StreamSubscription:
+    """Assinaturas de uma conexão `/ws/stream` e o lote de ticks pendente."""
+
+    def __init__(self, conn: Connection, mgr: ConnectionManager | None = None, interval: float = STREAM_BATCH_INTERVAL) -> None:
+        self.conn = conn
+        self.manager = mgr or manager
+        self.interval = interval
+        self.symbols: set[str] = set()
+        self.pending: set[str] = set()
+        self.seq = 0
+        self._timer: asyncio.TimerHandle | None = None
+
+    def subscribe(self, symbols: Iterable[str]) -> list[str]:
+        added = [s for s in _normalize_symbols(symbols) if s not in self.symbols]
+        if len(self.symbols) + len(added) > MAX_DASHBOARD_SYMBOLS:
+            raise ValueError(f"Limite de {MAX_DASHBOARD_SYMBOLS} símbolos por conexão")
+        self.symbols.update(added)
+        return added
+
+    def unsubscribe(self, symbols: Iterable[str]) -> list[str]:
+        removed = [s for s in _normalize_symbols(symbols) if s in self.symbols]
+        self.symbols.difference_update(removed)
+        self.pending.difference_update(removed)
+        return removed
+
+    def on_quotes(self, changed: Iterable[str]) -> None:
+        """Acumula tickers alterados; o primeiro da janela agenda o envio."""
+        self.pending.update(s for s in changed if s in self.symbols)
+        if self.pending and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.interval, self.flush)
+
+    def flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # O lote é montado no envio: flushes ainda na fila se fundem num só frame
+        self.manager.send(self.conn, self.batch, key="batch:prices")
+
+    def batch(self) -> Message | None:
+        symbols, self.pending = sorted(self.pending & self.symbols), set()
+        quotes = feed.quotes_for(symbols)
+        if not quotes:
+            return None
+        self.seq += 1
+        return {"type": "batch", "channel": "prices", "seq": self.seq, "cursor": feed.cursor(self.symbols), "timestamp": datetime.now(),
+                "data": [{"ticker": s, **quotes[s]} for s in symbols if s in quotes]}
+
+    def close(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+async def _replay(conn: Connection, channel: str, symbols: list[str], since: int) -> None:
+    try:
+        ticks = await tick_history.since(symbols, since)
+    except Exception as e:
+        logger.warning("Falha ao ler ticks para replay: %s", e)
+        return
+    if ticks:
+        manager.send(conn, {"type": "replay", "channel": channel, "data": [
+            {"ticker": s, "price": price, "timestamp": datetime.fromtimestamp(ms / 1000)} for ms, s, price in ticks
+        ]})
+
+async def _handle_stream_command(conn: Connection, sub: StreamSubscription, raw: str) -> None:
+    try:
+        msg = json.loads(raw)
+        action, channel = msg.get("action"), msg.get("channel", "prices")
+        symbols = msg.get("symbols") or []
+    except (ValueError, AttributeError):
+        _send_error(conn, "Mensagem inválida")
         return
+    if not isinstance(symbols, list):
+        _send_error(conn, "`symbols` deve ser uma lista")
+    elif channel not in STREAM_CHANNELS:
+        _send_error(conn, f"Canal desconhecido: {channel}")
+    elif action == "subscribe":
+        try:
+            added = manager.subscribe(conn, sub.subscribe(symbols))
+        except ValueError as e:
+            _send_error(conn, str(e))
+            return
+        manager.send(conn, {"type": "subscribed", "channel": channel, "symbols": added})
+        if added and isinstance(msg.get("since"), int):
+            await _replay(conn, channel, added, msg["since"])
+        if added:
+            await feed.ensure(added)
+            sub.pending.update(added)
+            sub.flush()
+    elif action == "unsubscribe":
+        removed = manager.unsubscribe(conn, sub.unsubscribe(symbols))
+        manager.send(conn, {"type": "unsubscribed", "channel": channel, "symbols": removed})
+    else:
+        _send_error(conn, f"Ação desconhecida: {action}")
+
+async def multiplexed_stream(websocket: WebSocket) -> None:
+    """Várias assinaturas de preço num único WebSocket.
+
+    Substitui um `/ws/prices/{symbol}` por ticker: a conexão tem uma única
+    fila e uma task escritora, qualquer que seja o número de símbolos, e os
+    ticks de uma mesma janela chegam juntos num frame `batch`.
+    """
+    conn = await manager.connect(websocket)
+    sub = StreamSubscription(conn)
+    conn.on_quotes = lambda _, changed: sub.on_quotes(changed)
+    try:
+        while not conn.closed.is_set():
+            raw = await manager.receive(conn, HEARTBEAT_INTERVAL)
+            if raw is not None:
+                await _handle_stream_command(conn, sub, raw)
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.warning("Erro no stream WebSocket: %s", e)
+    finally:
+        sub.close()
+        manager.disconnect(conn)
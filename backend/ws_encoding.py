@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from typing import Any
+
+try:  # MessagePack é opcional: sem ele só JSON e colunar-em-JSON ficam disponíveis
+    import msgpack
+except ImportError:  # pragma: no cover - depende do ambiente
+    msgpack = None
+
+# Codificações negociáveis em `/ws/prices/{symbol}` e `/ws/dashboard`, via
+# subprotocolo (`Sec-WebSocket-Protocol`) ou parâmetro `?encoding=`.
+#   json     -> texto JSON com timestamps ISO (formato original)
+#   msgpack  -> binário MessagePack, timestamps em epoch-ms
+#   columnar -> frame colunar com índices de símbolos e epoch-ms
+#               (MessagePack quando disponível, senão JSON compacto); no
+#               `replay` do /ws/stream, `ts` é uma coluna com o instante de
+#               cada tick
+QUOTE_COLUMNS = ("price", "change", "change_percent")
+
+Frame = str | bytes
+
+def _epoch_ms(value: Any) -> Any:
+    return int(value.timestamp() * 1000) if isinstance(value, datetime) else value
+
+def _iso(value: Any) -> str:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(value).__name__}")
+
+class JsonEncoder:
+    """Mantém o formato original: JSON em texto com timestamps ISO."""
+    name = "json"
+    stateless = True
+
+    def encode(self, message: dict[str, Any]) -> Frame:
+        return json.dumps(message, default=_iso)
+
+class MsgpackEncoder:
+    """Mesmo formato do JSON em MessagePack binário, com timestamps em epoch-ms."""
+    name = "msgpack"
+    stateless = True
+
+    def encode(self, message: dict[str, Any]) -> Frame:
+        out = {k: _epoch_ms(v) for k, v in message.items()}
+        if isinstance(out.get("data"), list):
+            if out.get("type") == "replay":
+                # Ticks do histórico: cada linha tem o seu instante
+                out["data"] = [{k: _epoch_ms(v) for k, v in row.items()} for row in out["data"]]
+            else:
+                out["data"] = [{k: v for k, v in row.items() if k != "timestamp"} for row in out["data"]]
+        return msgpack.packb(out, use_bin_type=True)
+
+# Dicionário de símbolos compartilhado pelo processo: os índices são estáveis,
+# então o corpo colunar de uma mensagem é igual para todas as conexões e pode
+# ser codificado uma única vez.
+_SYMBOL_IDS: dict[str, int] = {}
+_SYMBOL_NAMES: list[str] = []
+# Último frame colunar montado (a mensagem é mantida para que `is` seja seguro)
+_last: dict[str, Any] = {"message": None, "frame": None, "sym": frozenset(), "packed": None}
+
+def _symbol_id(ticker: str) -> int:
+    idx = _SYMBOL_IDS.get(ticker)
+    if idx is None:
+        idx = _SYMBOL_IDS[ticker] = len(_SYMBOL_NAMES)
+        _SYMBOL_NAMES.append(ticker)
+    return idx
+
+def _pack(frame: dict[str, Any]) -> Frame:
+    if msgpack is not None:
+        return msgpack.packb(frame, use_bin_type=True)
+    return json.dumps(frame, separators=(",", ":"))
+
+def _columnar_frame(message: dict[str, Any]) -> tuple[dict[str, Any], list[int]]:
+    if isinstance(message.get("data"), list):
+        rows = message["data"]
+        frame = {k: _epoch_ms(v) for k, v in message.items() if k not in ("data", "timestamp")}
+    elif "ticker" in message:
+        rows = [message]
+        frame = {"type": "tick"}
+    else:
+        return {k: _epoch_ms(v) for k, v in message.items()}, []
+    if message.get("type") == "replay":
+        frame["ts"] = [_epoch_ms(row.get("timestamp")) for row in rows]  # um instante por tick
+    else:
+        frame["ts"] = _epoch_ms(message.get("timestamp"))
+    sym = [_symbol_id(row["ticker"]) for row in rows]
+    frame["sym"] = sym
+    for col in QUOTE_COLUMNS:
+        frame[col] = [row.get(col) for row in rows]
+    return frame, sym
+
+class ColumnarEncoder:
+    """Frame colunar: uma lista por campo e tickers trocados por índices.
+
+    Os índices vêm de um dicionário global do processo; cada conexão só
+    recebe, no campo `dict`, os pares `[índice, ticker]` que ainda não viu.
+    Campos ausentes num delta são enviados como `null`.
+    """
+    name = "columnar"
+    stateless = False
+
+    def __init__(self) -> None:
+        self.announced: set[int] = set()
+
+    def encode(self, message: dict[str, Any]) -> Frame:
+        if _last["message"] is not message:
+            frame, sym = _columnar_frame(message)
+            _last.update(message=message, frame=frame, sym=frozenset(sym), packed=None)
+        if self.announced.issuperset(_last["sym"]):
+            if _last["packed"] is None:
+                _last["packed"] = _pack(_last["frame"])
+            return _last["packed"]
+        new = sorted(_last["sym"] - self.announced)
+        self.announced.update(new)
+        return _pack({**_last["frame"], "dict": [[i, _SYMBOL_NAMES[i]] for i in new]})
+
+ENCODERS = {"json": JsonEncoder, "columnar": ColumnarEncoder}
+if msgpack is not None:
+    ENCODERS["msgpack"] = MsgpackEncoder
+
+def negotiate(subprotocols: list[str], requested: str | None = None) -> tuple[object, str | None]:
+    """Escolhe o codificador da conexão.
+
+    Retorna `(encoder, subprotocolo)`; o subprotocolo deve ser devolvido no
+    `accept` quando a escolha veio do cabeçalho `Sec-WebSocket-Protocol`.
+    Codificações desconhecidas caem para JSON.
+    """
+    for proto in subprotocols:
+        if proto in ENCODERS:
+            return ENCODERS[proto](), proto
+    if requested in ENCODERS:
+        return ENCODERS[requested](), None
+    return JsonEncoder(), None
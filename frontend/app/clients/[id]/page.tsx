@@ -10,7 +10,7 @@ import { Button } from '@/components/ui/button';
 import PerformanceChart from '@/components/PerformanceChart';
 import { Dialog, DialogContent, DialogCard, DialogFooter, DialogHeader, DialogTitle, DialogDescription } from '@/components/ui/dialog';
 import type { Allocation, PerformancePoint } from '@/lib/types';
-import { connectPriceWS } from '@/lib/ws';
+import { useLivePrices } from '@/hooks/useLivePrices';
 
 async function getClient(id: string) {
   const { data } = await api.get(`/clients/${id}`);
@@ -61,6 +61,8 @@ export default function ClientDetail({ params }: { params: { id: string } }) {
   const { data: client, error: errClient } = useQuery({ queryKey:['client',id], queryFn:()=>getClient(id), retry: false });
   const { data: allocs, error: errAllocs } = useQuery({ queryKey: ['allocs', id], queryFn: () => getAllocations(id), enabled: !!client, retry: false, refetchInterval: 5000 });
   const { data: perf, error: errPerf } = useQuery({ queryKey: ['perf', id], queryFn: () => getPerformance(id), enabled: !!client, retry: false, refetchInterval: 15000 });
+  // Um único WebSocket para todas as posições da carteira
+  const { ticks } = useLivePrices((allocs ?? []).map((a) => a.ticker || ''));
 
   useEffect(()=>{
     const is404 = (e: any) => Number(e?.response?.status) === 404;
@@ -279,7 +281,7 @@ export default function ClientDetail({ params }: { params: { id: string } }) {
               <TableCell>{a.ticker || a.asset_id}</TableCell>
               <TableCell>{a.quantity}</TableCell>
               <TableCell>{a.purchase_price}</TableCell>
-              <LiveCells allocation={a} />
+              <LiveCells allocation={a} live={a.ticker ? ticks[a.ticker.toUpperCase()]?.price : undefined} />
               <TableCell className='text-right'>
                 <div className='flex gap-3 justify-end'>
                   <button className='underline disabled:opacity-50' disabled={isProcessing} onClick={()=>setOpenEdit(a)}>{isProcessing ? '...' : 'Editar'}</button>
@@ -299,7 +301,7 @@ export default function ClientDetail({ params }: { params: { id: string } }) {
   </div>;
 }
 
-function LiveCells({ allocation }: { allocation: Allocation }){
+function LiveCells({ allocation, live }: { allocation: Allocation; live?: number }){
   const [price, setPrice] = useState<number | null>(allocation.current_price ?? null);
   // Fallback HTTP: busca preço atual/quando WS indisponível
   async function fetchPriceHttp(symbol: string){
@@ -309,15 +311,10 @@ function LiveCells({ allocation }: { allocation: Allocation }){
       if (typeof cur === 'number') setPrice(cur);
     }catch{}
   }
+  useEffect(()=>{ if (typeof live === 'number') setPrice(live); }, [live]);
   useEffect(()=>{
-    if (!allocation.ticker) return;
-    const ws = connectPriceWS(allocation.ticker);
-    ws.onmessage = (ev)=>{
-      try{ const d = JSON.parse(ev.data); if (typeof d.price === 'number') setPrice(d.price); }catch{}
-    };
     // Fallback inicial via HTTP (caso WS ainda não entregue valor)
-    fetchPriceHttp(allocation.ticker);
-    return ()=> { try{ ws.close(); }catch{} };
+    if (allocation.ticker) fetchPriceHttp(allocation.ticker);
   }, [allocation.ticker]);
   const daily = allocation.daily_change_pct;
   const profit = (typeof price === 'number' && allocation.purchase_price) ? (price - allocation.purchase_price) / allocation.purchase_price : allocation.profit_pct;
@@ -5,7 +5,7 @@ import Spinner from '@/components/ui/spinner';
 import { useEffect, useState } from 'react';
 import { useQuery } from '@tanstack/react-query';
 import { api } from '@/lib/api';
-import type { Client } from '@/lib/types';
+import type { Allocation, Client, DashboardSummary } from '@/lib/types';
 import LivePrice from '@/components/LivePrice';
 import PerformanceChart from '@/components/PerformanceChart';
 import { useDashboardPrices } from '@/lib/ws';
@@ -16,24 +16,43 @@ async function fetchClients(){
   return data as Client[];
 }
 
+async function fetchSummary(){
+  const { data } = await api.get('/dashboard/summary');
+  return data as DashboardSummary;
+}
+
+// Tickers da carteira do cliente: a alocação traz só o asset_id
+async function fetchTickers(clientId: number){
+  const { data } = await api.get(`/clients/${clientId}/allocations`);
+  const ids = Array.from(new Set((data as Allocation[]).map((a) => a.asset_id)));
+  const assets = await Promise.all(ids.map(async (aid) => (await api.get(`/assets/${aid}`)).data.ticker as string));
+  return Array.from(new Set(assets.filter(Boolean)));
+}
+
+const signed = (v: number) => `${v > 0 ? '+' : ''}${v.toFixed(2)}%`;
+
 export default function Dashboard(){
   const { data, isLoading, error } = useQuery({ queryKey:['dash','clients'], queryFn: fetchClients });
-  const { prices, isConnected, lastUpdated } = useDashboardPrices();
+  const { data: summary } = useQuery({ queryKey:['dash','summary'], queryFn: fetchSummary });
+  // Cliente em exibição: o primeiro ativo da lista até o usuário escolher outro
+  const [selectedId, setSelectedId] = useState<number | null>(null);
+  const selected = (data ?? []).find((c) => c.id === selectedId) ?? (data ?? []).find((c) => c.is_active) ?? data?.[0];
+  const { data: tickers } = useQuery({ queryKey: ['dash', 'tickers', selected?.id], queryFn: () => fetchTickers(selected!.id), enabled: !!selected });
+  const { prices, isConnected, lastUpdated } = useDashboardPrices(tickers ?? []);
   
   // Evita mismatch de hidratação: data/hora deve ser preenchida apenas no cliente
   const [today, setToday] = useState<string>('');
   useEffect(()=>{ setToday(new Date().toLocaleDateString()); }, []);
   
-  const total = data?.length ?? 0;
-  const active = data?.filter(c=>c.is_active).length ?? 0;
-  const inactive = total - active;
-
-  // Dados simulados para demonstração
-  const portfolioValue = 2847392.50;
-  const dailyChange = 15847.32;
-  const dailyChangePercent = 0.56;
-  const monthlyReturn = 8.8;
-  const yearlyReturn = 17.5;
+  // Totais da firma vêm dos agregados do backend, não da lista paginada
+  const total = summary?.clients_total ?? 0;
+  const active = summary?.clients_active ?? 0;
+  const inactive = summary?.clients_inactive ?? 0;
+  const portfolioValue = summary?.total_aum ?? 0;
+  const dailyChange = summary?.day_change ?? 0;
+  const dailyChangePercent = (summary?.day_change_pct ?? 0) * 100;
+  const monthlyReturn = summary?.mtd_return != null ? summary.mtd_return * 100 : null;
+  const yearlyReturn = summary?.ytd_return != null ? summary.ytd_return * 100 : null;
 
   return (
     <div className="space-y-6">
@@ -55,7 +74,7 @@ export default function Dashboard(){
                 <TrendingDown className="h-3 w-3 text-red-500" />
               )}
               <span className={dailyChange > 0 ? 'text-green-500' : 'text-red-500'}>
-                {dailyChange > 0 ? '+' : ''}R$ {Math.abs(dailyChange).toLocaleString('pt-BR', { minimumFractionDigits: 2 })} ({dailyChangePercent > 0 ? '+' : ''}{dailyChangePercent}%)
+                {dailyChange > 0 ? '+' : dailyChange < 0 ? '-' : ''}R$ {Math.abs(dailyChange).toLocaleString('pt-BR', { minimumFractionDigits: 2 })} ({signed(dailyChangePercent)})
               </span>
               <span>hoje</span>
             </div>
@@ -81,9 +100,11 @@ export default function Dashboard(){
             <Activity className="h-4 w-4 text-muted-foreground" />
           </CardHeader>
           <CardContent>
-            <div className="text-2xl font-bold text-green-500">+{yearlyReturn}%</div>
+            <div className={`text-2xl font-bold ${(yearlyReturn ?? 0) >= 0 ? 'text-green-500' : 'text-red-500'}`}>
+              {yearlyReturn != null ? signed(yearlyReturn) : '—'}
+            </div>
             <p className="text-xs text-muted-foreground">
-              Mensal: +{monthlyReturn}%
+              Mensal: {monthlyReturn != null ? signed(monthlyReturn) : '—'}
             </p>
           </CardContent>
         </Card>
@@ -123,7 +144,7 @@ export default function Dashboard(){
         <Card>
           <CardHeader>
             <CardTitle className="flex items-center justify-between">
-              Preços em Tempo Real
+              Preços em Tempo Real{selected ? ` — ${selected.name}` : ''}
               <div className="flex items-center gap-2 text-sm text-muted-foreground">
                 <div className={`w-2 h-2 rounded-full ${isConnected ? 'bg-green-500' : 'bg-red-500'}`} />
                 {lastUpdated && (
@@ -134,7 +155,7 @@ export default function Dashboard(){
           </CardHeader>
           <CardContent>
             <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-4 gap-4">
-              {prices.slice(0, 8).map((price, index) => (
+              {prices.map((price, index) => (
                 <div key={price.ticker || index} className="p-3 border rounded-lg">
                   <div className="flex items-center justify-between">
                     <span className="font-medium text-sm">{price.ticker}</span>
@@ -196,7 +217,7 @@ export default function Dashboard(){
                 </thead>
                 <tbody>
                   {(data ?? []).map((c)=> (
-                    <tr key={c.id} className="border-t border-neutral-200 dark:border-neutral-800 hover:bg-gray-50 dark:hover:bg-gray-800">
+                    <tr key={c.id} onClick={() => setSelectedId(c.id)} className={`border-t border-neutral-200 dark:border-neutral-800 hover:bg-gray-50 dark:hover:bg-gray-800 cursor-pointer ${c.id === selected?.id ? 'bg-gray-50 dark:bg-gray-800' : ''}`}>
                       <td className="py-3 font-medium">{c.name}</td>
                       <td className="py-3 text-muted-foreground">{c.email}</td>
                       <td className="py-3">
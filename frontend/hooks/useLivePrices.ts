@@ -1,46 +1,40 @@
 'use client';
-import { useEffect, useMemo, useRef, useState } from 'react';
-import { connectPriceWS } from '@/lib/ws';
+import { useEffect, useMemo, useState } from 'react';
+import { priceStream } from '@/lib/ws';
 
-export type LiveTick = { symbol: string; price?: number; daily_change_pct?: number };
+export type LiveTick = { symbol: string; price?: number; change_percent?: number; daily_change_pct?: number };
 type MapTick = Record<string, LiveTick>;
 
+// Todos os símbolos passam pelo mesmo WebSocket multiplexado (`priceStream`),
+// qualquer que seja o número de componentes ou tickers na página.
 export function useLivePrices(symbols: string[]) {
   const [ticks, setTicks] = useState<MapTick>({});
   const [lastUpdated, setLastUpdated] = useState<Date|null>(null);
-  const sockets = useRef<Record<string, WebSocket>>({});
 
-  const uniq = useMemo(() => Array.from(new Set(symbols.filter(Boolean))), [symbols]);
+  const key = useMemo(() => Array.from(new Set(symbols.filter(Boolean).map((s) => s.toUpperCase()))).sort().join(','), [symbols]);
 
   useEffect(() => {
-    uniq.forEach((sym) => {
-      if (sockets.current[sym]) return;
-      try {
-        const ws = connectPriceWS(sym);
-        sockets.current[sym] = ws;
-        ws.onmessage = (ev) => {
-          try {
-            const msg = JSON.parse(ev.data);
-            const key = (msg.ticker || msg.symbol || sym) as string;
-            setTicks((prev) => ({
-              ...prev,
-              [key]: {
-                symbol: key,
-                price: typeof msg.price === 'number' ? msg.price : prev[key]?.price,
-                daily_change_pct: typeof msg.daily_change_pct === 'number' ? msg.daily_change_pct : prev[key]?.daily_change_pct,
-              },
-            }));
-            setLastUpdated(new Date());
-          } catch {}
-        };
-        ws.onerror = () => {};
-      } catch {}
+    if (!key) return;
+    const wanted = new Set(key.split(','));
+    return priceStream.subscribe(Array.from(wanted), (batch) => {
+      const mine = batch.filter((t) => wanted.has(t.ticker));
+      if (!mine.length) return;
+      setTicks((prev) => {
+        const next = { ...prev };
+        mine.forEach((t) => {
+          next[t.ticker] = {
+            symbol: t.ticker,
+            price: typeof t.price === 'number' ? t.price : prev[t.ticker]?.price,
+            change_percent: typeof t.change_percent === 'number' ? t.change_percent : prev[t.ticker]?.change_percent,
+            // Mesma escala de `daily_change_pct` da API (fração)
+            daily_change_pct: typeof t.change_percent === 'number' ? t.change_percent / 100 : prev[t.ticker]?.daily_change_pct,
+          };
+        });
+        return next;
+      });
+      setLastUpdated(new Date());
     });
-    return () => {
-      Object.values(sockets.current).forEach((ws) => { try { ws.close(); } catch {} });
-      sockets.current = {};
-    };
-  }, [uniq]);
+  }, [key]);
 
   return { ticks, lastUpdated };
 }
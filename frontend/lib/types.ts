@@ -25,4 +25,18 @@ export type Allocation = {
 export type PerformancePoint = {
   date: string;
   cumulative_return: number;
-};
\ No newline at end of file
+};
+
+// Firm-wide totals from `/api/dashboard/summary`. Returns are fractions
+// (0.05 = 5%); `as_of` is the date of the latest close in the rollups.
+export type DashboardSummary = {
+  total_aum: number;
+  day_change: number;
+  day_change_pct: number | null;
+  mtd_return: number | null;
+  ytd_return: number | null;
+  as_of: string | null;
+  clients_total: number;
+  clients_active: number;
+  clients_inactive: number;
+};
@@ -1,3 +1,5 @@
+import { API_BASE } from './api';
+
 export function wsBase() {
   // 1) Prefer variável explícita NEXT_PUBLIC_WS_BASE
   const wsEnv = (process.env.NEXT_PUBLIC_WS_BASE || '').trim();
@@ -32,23 +34,156 @@ export function wsBase() {
   return '';
 }
 
+// Responde ao heartbeat do servidor ({"type":"ping"} -> {"action":"pong"});
+// sem resposta a conexão é encerrada pelo backend.
+function withHeartbeat(ws: WebSocket) {
+  ws.addEventListener('message', (ev) => {
+    if (typeof ev.data === 'string' && ev.data.includes('"ping"')) {
+      try { if (JSON.parse(ev.data).type === 'ping') ws.send('{"action":"pong"}'); } catch {}
+    }
+  });
+  return ws;
+}
+
 export function connectPriceWS(symbol: string) {
   const base = wsBase();
   if (!base) throw new Error('WS base not set');
   const url = `${base}/ws/prices/${encodeURIComponent(symbol)}`;
-  return new WebSocket(url);
+  return withHeartbeat(new WebSocket(url));
+}
+
+export function connectStreamWS() {
+  const base = wsBase();
+  if (!base) throw new Error('WS base not set');
+  return withHeartbeat(new WebSocket(`${base}/ws/stream`));
 }
 
+export type StreamTick = { ticker: string; price?: number; change?: number; change_percent?: number; timestamp?: string };
+type StreamListener = (ticks: StreamTick[]) => void;
+
+// Um único WebSocket multiplexado (/ws/stream) por aba. Componentes assinam
+// símbolos com contagem de referências; o socket abre na primeira assinatura,
+// fecha quando não resta nenhuma e reassina tudo ao reconectar. Cada frame
+// `batch` traz os ticks de uma janela do servidor de uma vez. Se o WebSocket
+// nunca chega a abrir (proxy que bloqueia upgrade), cai para SSE em
+// /api/stream/prices; o EventSource reconecta sozinho com Last-Event-ID.
+// Na reconexão do WebSocket, o `cursor` do último batch vai em `since` e o
+// servidor repõe os ticks perdidos num frame `replay`.
+class PriceStream {
+  private ws: WebSocket | null = null;
+  private cursor: number | null = null;
+  private es: EventSource | null = null;
+  private useSse = false;
+  private refs = new Map<string, number>();
+  private listeners = new Set<StreamListener>();
+  private retry: ReturnType<typeof setTimeout> | null = null;
+  readonly last: Record<string, StreamTick> = {};
+
+  subscribe(symbols: string[], listener: StreamListener) {
+    const syms = Array.from(new Set(symbols.filter(Boolean).map((s) => s.toUpperCase())));
+    const added = syms.filter((s) => !this.refs.has(s));
+    syms.forEach((s) => this.refs.set(s, (this.refs.get(s) ?? 0) + 1));
+    this.listeners.add(listener);
+    const known = syms.map((s) => this.last[s]).filter(Boolean);
+    if (known.length) listener(known);
+    if (this.es) { if (added.length) this.reopenSse(); }
+    else if (!this.ws) this.open();
+    else if (added.length) this.send('subscribe', added);
+    return () => {
+      this.listeners.delete(listener);
+      const removed = syms.filter((s) => {
+        const n = (this.refs.get(s) ?? 1) - 1;
+        if (n > 0) { this.refs.set(s, n); return false; }
+        this.refs.delete(s);
+        delete this.last[s];
+        return true;
+      });
+      if (!this.refs.size) this.close();
+      else if (removed.length && this.es) this.reopenSse();
+      else if (removed.length) this.send('unsubscribe', removed);
+    };
+  }
+
+  private send(action: 'subscribe' | 'unsubscribe', symbols: string[], since?: number) {
+    if (this.ws?.readyState === WebSocket.OPEN) {
+      this.ws.send(JSON.stringify({ action, channel: 'prices', symbols, ...(since != null ? { since } : {}) }));
+    }
+  }
+
+  private emit(ticks: StreamTick[]) {
+    ticks.forEach((t) => { this.last[t.ticker] = { ...this.last[t.ticker], ...t }; });
+    this.listeners.forEach((fn) => fn(ticks));
+  }
+
+  private open() {
+    if (this.useSse) { this.openSse(); return; }
+    try {
+      const ws = connectStreamWS();
+      let opened = false;
+      this.ws = ws;
+      ws.onopen = () => { opened = true; if (this.refs.size) this.send('subscribe', Array.from(this.refs.keys()), this.cursor ?? undefined); };
+      ws.onmessage = (ev) => {
+        try {
+          const msg = JSON.parse(ev.data);
+          if ((msg.type !== 'batch' && msg.type !== 'replay') || msg.channel !== 'prices' || !Array.isArray(msg.data)) return;
+          if (typeof msg.cursor === 'number') this.cursor = msg.cursor;
+          this.emit(msg.data as StreamTick[]);
+        } catch {}
+      };
+      ws.onclose = () => {
+        if (this.ws === ws) this.ws = null;
+        if (!opened && typeof EventSource !== 'undefined') { this.useSse = true; if (this.refs.size) this.openSse(); return; }
+        if (this.refs.size && !this.retry) this.retry = setTimeout(() => { this.retry = null; if (!this.ws) this.open(); }, 5000);
+      };
+    } catch {
+      this.ws = null;
+    }
+  }
+
+  private openSse() {
+    const symbols = encodeURIComponent(Array.from(this.refs.keys()).join(','));
+    const es = new EventSource(`${API_BASE}/api/stream/prices?symbols=${symbols}`);
+    this.es = es;
+    es.addEventListener('snapshot', (ev) => {
+      try { this.emit(JSON.parse((ev as MessageEvent).data).data as StreamTick[]); } catch {}
+    });
+    es.addEventListener('tick', (ev) => {
+      try { this.emit([JSON.parse((ev as MessageEvent).data) as StreamTick]); } catch {}
+    });
+  }
+
+  // A lista de símbolos vai na URL do SSE; mudou a lista, abre outro stream
+  // (com snapshot, para que os símbolos novos recebam o valor atual).
+  private reopenSse() {
+    this.es?.close();
+    this.openSse();
+  }
+
+  private close() {
+    if (this.retry) { clearTimeout(this.retry); this.retry = null; }
+    if (this.es) { this.es.close(); this.es = null; }
+    this.cursor = null;
+    const ws = this.ws;
+    this.ws = null;
+    if (ws) { ws.onclose = null; try { ws.close(); } catch {} }
+  }
+}
+
+export const priceStream = new PriceStream();
+
 // Nova função para conectar ao WebSocket do dashboard
 export function connectDashboardWS() {
   const base = wsBase();
   if (!base) throw new Error('WS base not set');
   const url = `${base}/ws/dashboard`;
-  return new WebSocket(url);
+  return withHeartbeat(new WebSocket(url));
 }
 
-// Hook personalizado para o dashboard
-export function useDashboardPrices() {
+// Hook personalizado para o dashboard: assina exatamente `symbols` (os
+// tickers da carteira em exibição) e aplica snapshot + deltas enviados pelo
+// servidor. Ao detectar salto de `seq`, solicita um novo snapshot. Sem
+// símbolos, não abre conexão.
+export function useDashboardPrices(symbols: string[]) {
   if (typeof window === 'undefined') {
     return { prices: [], isConnected: false, lastUpdated: null };
   }
@@ -57,26 +192,57 @@ export function useDashboardPrices() {
   const [isConnected, setIsConnected] = useState(false);
   const [lastUpdated, setLastUpdated] = useState<Date | null>(null);
   const wsRef = useRef<WebSocket | null>(null);
+  const stateRef = useRef<Record<string, any>>({});
+  const seqRef = useRef(0);
+  const key = Array.from(new Set(symbols.map((s) => s.toUpperCase()))).sort().join(',');
 
   useEffect(() => {
     let reconnectTimeout: NodeJS.Timeout;
-    
+    const wanted = key ? key.split(',') : [];
+    stateRef.current = {};
+    setPrices([]);
+    if (!wanted.length) {
+      setIsConnected(false);
+      return;
+    }
+
+    const publish = () => {
+      setPrices(wanted.map((s) => stateRef.current[s]).filter(Boolean));
+      setLastUpdated(new Date());
+    };
+
     const connect = () => {
       try {
         const ws = connectDashboardWS();
         wsRef.current = ws;
 
         ws.onopen = () => {
-          console.log('Dashboard WebSocket conectado');
           setIsConnected(true);
+          seqRef.current = 0;
+          if (wanted.length) ws.send(JSON.stringify({ action: 'subscribe', symbols: wanted }));
         };
 
         ws.onmessage = (event) => {
           try {
-            const data = JSON.parse(event.data);
-            if (data.type === 'price_update' && Array.isArray(data.data)) {
-              setPrices(data.data);
-              setLastUpdated(new Date());
+            const msg = JSON.parse(event.data);
+            if (typeof msg.seq === 'number') {
+              const expected = seqRef.current + 1;
+              seqRef.current = msg.seq;
+              if (msg.type !== 'snapshot' && msg.seq !== expected) {
+                ws.send(JSON.stringify({ action: 'snapshot' }));
+                return;
+              }
+            }
+            if (msg.type === 'snapshot' && Array.isArray(msg.data)) {
+              const next: Record<string, any> = {};
+              msg.data.forEach((p: any) => { next[p.ticker] = p; });
+              stateRef.current = next;
+              publish();
+            } else if (msg.type === 'delta' && Array.isArray(msg.data)) {
+              msg.data.forEach((p: any) => {
+                stateRef.current[p.ticker] = { ...(stateRef.current[p.ticker] || {}), ...p };
+              });
+              publish();
             }
           } catch (error) {
             console.error('Erro ao processar mensagem WebSocket:', error);
@@ -84,7 +250,6 @@ export function useDashboardPrices() {
         };
 
         ws.onclose = () => {
-          console.log('Dashboard WebSocket desconectado');
           setIsConnected(false);
           // Reconectar após 5 segundos
           reconnectTimeout = setTimeout(connect, 5000);
@@ -108,10 +273,11 @@ export function useDashboardPrices() {
     return () => {
       clearTimeout(reconnectTimeout);
       if (wsRef.current) {
+        wsRef.current.onclose = null;
         wsRef.current.close();
       }
     };
-  }, []);
+  }, [key]);
 
   return { prices, isConnected, lastUpdated };
 }